@@ -12,11 +12,11 @@ Contributors:  Pouria Hadjibagheri
 # Imports
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Python:
+from importlib import import_module
 
 # 3rd party:
 
-# Internal: 
-from .main import *
+# Internal:
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Header
@@ -25,3 +25,20 @@ __copyright__ = "Copyright (c) 2021, Public Health England"
 __license__ = "MIT"
 __version__ = "2.1.1"
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Exports are imported upon access, so that the modules of the
+# package may be run on their own - e.g. the CLI of the cache
+# garbage collector - without starting the app.
+_exports = {
+    'main': '.main',
+    'app': '.main',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if (module := _exports.get(name)) is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    return getattr(import_module(module, __name__), name)
@@ -33,3 +33,131 @@ class Settings:
         "path": "info/latest_published"
     }
 
+    # Executor used to process and format DB results - one of
+    # "process", "thread" or "inline" (runs on the event loop).
+    format_executor = getenv("FORMAT_EXECUTOR", "process")
+    format_executor_workers = int(getenv("FORMAT_EXECUTOR_WORKERS", "2"))
+
+    # Pre-compressed variants of cached payloads - comma separated
+    # content encodings: "gzip", "br" and / or "zstd".
+    cache_encodings = getenv("CACHE_ENCODINGS", "gzip").split(",")
+    cache_compression_level = int(getenv("CACHE_COMPRESSION_LEVEL", "6"))
+
+    # Requests whose estimated payload size (bytes) is below the threshold
+    # are streamed directly from the DB when they are not already cached.
+    # Set to 0 to disable. Streamed payloads are buffered to be cached once
+    # complete, unless they grow beyond the buffer size (bytes) - estimates
+    # are rough.
+    direct_stream_threshold = int(getenv("DIRECT_STREAM_THRESHOLD", str(2 * 1024 ** 2)))
+    direct_stream_buffer_size = int(getenv("DIRECT_STREAM_BUFFER_SIZE", str(8 * 1024 ** 2)))
+
+    # Coalescing of concurrent cache generations on the same host.
+    single_flight_dir = getenv("SINGLE_FLIGHT_DIR", "/dev/shm/apiv2-flights")
+    single_flight_timeout = int(getenv("SINGLE_FLIGHT_TIMEOUT", "290"))  # seconds
+    single_flight_ttl = int(getenv("SINGLE_FLIGHT_TTL", "300"))  # seconds
+    single_flight_max_waiters = int(getenv("SINGLE_FLIGHT_MAX_WAITERS", "32"))
+
+    # Coordination of cache generations across nodes - one of
+    # "blob" (blob leases and tags) or "postgres" (advisory locks).
+    # The latter relies on session-level advisory locks and LISTEN/NOTIFY,
+    # so requires a direct connection or a session-pooling pgbouncer - they
+    # do not work behind transaction or statement pooling.
+    generation_coordinator = getenv("GENERATION_COORDINATOR", "blob")
+    generation_timeout = int(getenv("GENERATION_TIMEOUT", "290"))  # seconds
+
+    # Host-local cache tier - disabled when the size (bytes) is set to 0.
+    # The size is the budget of the host, shared by all of its workers, and is
+    # capped to half the capacity of the file system of `local_cache_dir`.
+    local_cache_dir = getenv("LOCAL_CACHE_DIR", "/dev/shm/apiv2cache")
+    local_cache_size = int(getenv("LOCAL_CACHE_SIZE", str(1024 ** 3)))
+    # Internal nginx location aliasing `local_cache_dir` - e.g. "/_local_cache/".
+    # When set, local entries are served by nginx via `X-Accel-Redirect`.
+    local_cache_accel_prefix = getenv("LOCAL_CACHE_ACCEL_PREFIX", "")
+
+    # Staged block uploads.
+    upload_block_size = int(getenv("UPLOAD_BLOCK_SIZE", str(8 * 1024 ** 2)))
+    upload_max_concurrency = int(getenv("UPLOAD_MAX_CONCURRENCY", "4"))
+
+    # Connection pool shared by all storage clients of a worker.
+    storage_max_connections = int(getenv("STORAGE_MAX_CONNECTIONS", "100"))
+    storage_max_connections_per_host = int(getenv("STORAGE_MAX_CONNECTIONS_PER_HOST", "50"))
+
+    # Storage backend - one of "azure" (blob storage, using `DeploymentBlobStorage`)
+    # or "filesystem" (files in `storage_root`).
+    storage_backend = getenv("STORAGE_BACKEND", "azure")
+    storage_root = getenv("STORAGE_ROOT", "/var/lib/apiv2/storage")
+
+    # Ranged downloads of cached payloads.
+    download_chunk_size = int(getenv("DOWNLOAD_CHUNK_SIZE", str(4 * 1024 ** 2)))
+    download_max_concurrency = int(getenv("DOWNLOAD_MAX_CONCURRENCY", "4"))
+
+    # Gzip level of payloads uploaded with `compressed=True`.
+    storage_compression_level = int(getenv("STORAGE_COMPRESSION_LEVEL", "9"))
+
+    # Pre-warming of the cache with the most popular downloads once a
+    # new release is published. Popularity is recorded by all instances,
+    # and decayed by `prewarm_history_decay` after each release.
+    prewarm_enabled = getenv("PREWARM_ENABLED", "0") == "1"
+    prewarm_poll_interval = int(getenv("PREWARM_POLL_INTERVAL", "60"))  # seconds
+    prewarm_history_interval = int(getenv("PREWARM_HISTORY_INTERVAL", "300"))  # seconds
+    prewarm_history_decay = float(getenv("PREWARM_HISTORY_DECAY", "0.5"))
+    prewarm_top_n = int(getenv("PREWARM_TOP_N", "50"))
+    prewarm_concurrency = int(getenv("PREWARM_CONCURRENCY", "2"))
+
+    # Timestamps of published releases are cached by each worker for the TTL,
+    # so that a release that is published again is picked up once it expires.
+    release_timestamp_ttl = int(getenv("RELEASE_TIMESTAMP_TTL", "60"))  # seconds
+
+    # Requests known to yield no data for the current publication of
+    # a release. Set the size (number of entries) to 0 to disable.
+    negative_cache_size = int(getenv("NEGATIVE_CACHE_SIZE", "10000"))
+    negative_cache_persist = getenv("NEGATIVE_CACHE_PERSIST", "0") == "1"
+
+    # Garbage collection of `apiv2cache` - payloads of releases older than
+    # the retention period (relative to the latest release) are removed, and
+    # the least-recently-used ones are evicted beyond the byte budget (0 for
+    # no budget). Also available as a CLI: `python -m app.engine.from_db.gc`.
+    gc_enabled = getenv("CACHE_GC_ENABLED", "0") == "1"
+    gc_interval = int(getenv("CACHE_GC_INTERVAL", "3600"))  # seconds
+    gc_retention_days = int(getenv("CACHE_GC_RETENTION_DAYS", "30"))
+    gc_max_bytes = int(getenv("CACHE_GC_MAX_BYTES", "0"))
+    gc_batch_size = int(getenv("CACHE_GC_BATCH_SIZE", "256"))
+    gc_concurrency = int(getenv("CACHE_GC_CONCURRENCY", "16"))
+
+    # In-worker index of complete cache entries - disabled when the size
+    # (number of entries) is set to 0. Paths evicted from the index are
+    # still tracked by a Bloom filter. Payloads removed from the storage
+    # by other instances may be redirected to until their entries expire,
+    # so the TTL is kept well below the interval of the garbage collector.
+    cache_index_size = int(getenv("CACHE_INDEX_SIZE", "100000"))
+    cache_index_ttl = int(getenv("CACHE_INDEX_TTL", "300"))  # seconds
+    cache_index_bloom_capacity = int(getenv("CACHE_INDEX_BLOOM_CAPACITY", "1000000"))
+    cache_index_bloom_error_rate = float(getenv("CACHE_INDEX_BLOOM_ERROR_RATE", "0.01"))
+
+    # Cached payloads whose size (bytes) is below the threshold are served
+    # inline rather than redirected to - from the host-local tier or from
+    # the in-memory tier of the worker, whose budget (bytes) is set below.
+    # Set the threshold to 0 to always redirect.
+    inline_serve_threshold = int(getenv("INLINE_SERVE_THRESHOLD", str(256 * 1024)))
+    memory_cache_size = int(getenv("MEMORY_CACHE_SIZE", str(64 * 1024 ** 2)))
+
+    # Concurrent DB fetches for the same partition, area type and area chunk
+    # are merged into one, for the union of their metrics, if they start
+    # within the window of one another. The window is only opened whilst
+    # the chunk is already being fetched. Set to 0 to disable.
+    fetch_coalesce_window = float(getenv("FETCH_COALESCE_WINDOW", "5"))  # milliseconds
+
+    # Chunks of payloads generated from the DB are checkpointed as fragment
+    # blobs, so that an interrupted generation is resumed by a later attempt
+    # from the first missing chunk. Parquet payloads are never checkpointed.
+    # Each chunk is then written twice, so only payloads whose estimated size
+    # (bytes) is at or above the threshold are checkpointed. Set to 0 to disable.
+    generation_checkpoint_threshold = int(getenv("GENERATION_CHECKPOINT_THRESHOLD", str(64 * 1024 ** 2)))
+
+    # DB records of each (query, metric, area chunk) cell of full downloads
+    # are stored in `apiv2cache`, so that new combinations of metrics are
+    # assembled from the stored cells, and only the missing ones are fetched.
+    # Each chunk then costs a storage read per metric, and a write per metric
+    # missed - hence disabled by default.
+    fragment_store_enabled = getenv("FRAGMENT_STORE_ENABLED", "0") == "1"
+    fragment_store_concurrency = int(getenv("FRAGMENT_STORE_CONCURRENCY", "32"))
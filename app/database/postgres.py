@@ -122,6 +122,23 @@ class Connection:
     async def fetchrow(self, query, *args, **kwargs):
         return await self._conn.fetchrow(query, *args, **kwargs)
 
+    @trace_async_method_operation(
+        name="_account_name",
+        dep_type="_name",
+        action="connection_execute"
+    )
+    async def execute(self, query, *args, **kwargs):
+        return await self._conn.execute(query, *args, **kwargs)
+
+    async def add_listener(self, channel, callback):
+        return await self._conn.add_listener(channel, callback)
+
+    async def remove_listener(self, channel, callback):
+        return await self._conn.remove_listener(channel, callback)
+
+    def is_closed(self) -> bool:
+        return self._conn.is_closed()
+
     @trace_method_operation(
         name="_account_name",
         dep_type="_name",
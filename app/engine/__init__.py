@@ -12,12 +12,11 @@ Contributors:  Pouria Hadjibagheri
 # Imports
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Python:
+from importlib import import_module
 
 # 3rd party:
 
 # Internal:
-from .from_db import get_data
-from .healthcheck import run_healthcheck
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Header
@@ -26,3 +25,24 @@ __copyright__ = "Copyright (c) 2021, Public Health England"
 __license__ = "MIT"
 __version__ = "0.0.1"
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Exports are imported upon access - see `app.__init__`.
+_exports = {
+    'get_data': '.from_db',
+    'shutdown_executor': '.from_db',
+    'start_prewarmer': '.from_db',
+    'stop_prewarmer': '.from_db',
+    'start_collector': '.from_db',
+    'stop_collector': '.from_db',
+    'start_index_loader': '.from_db',
+    'run_healthcheck': '.healthcheck',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if (module := _exports.get(name)) is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    return getattr(import_module(module, __name__), name)
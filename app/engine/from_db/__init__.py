@@ -12,11 +12,11 @@ Contributors:  Pouria Hadjibagheri
 # Imports
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Python:
+from importlib import import_module
 
 # 3rd party:
 
 # Internal:
-from .base import *
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Header
@@ -25,3 +25,24 @@ __copyright__ = "Copyright (c) 2021, Public Health England"
 __license__ = "MIT"
 __version__ = "0.0.1"
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+# Exports are imported upon access - see `app.__init__`.
+_exports = {
+    'get_data': '.base',
+    'ensure_cache_entry': '.base',
+    'shutdown_executor': '.executor',
+    'start_prewarmer': '.prewarm',
+    'stop_prewarmer': '.prewarm',
+    'start_collector': '.gc',
+    'stop_collector': '.gc',
+    'start_index_loader': '.cache_index',
+}
+
+__all__ = list(_exports)
+
+
+def __getattr__(name):
+    if (module := _exports.get(name)) is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    return getattr(import_module(module, __name__), name)
@@ -6,27 +6,39 @@
 from logging import getLogger
 from typing import AsyncGenerator, Union
 from http import HTTPStatus
-from functools import partial
-from asyncio import sleep
-from tempfile import NamedTemporaryFile
+from asyncio import ensure_future, to_thread
+from collections import deque
 
 # 3rd party:
 from orjson import dumps
+from azure.core.exceptions import ResourceNotFoundError
 
 # Internal:
 from app.exceptions import NotAvailable
-from app.utils.operations import Response, RedirectResponse, Request
+from app.utils.operations import (
+    Response, RedirectResponse, Request, LocalFileResponse, parse_byte_range,
+    get_variant_path
+)
 from app.utils.assets import RequestMethod
 from app.database import Connection
-from app.storage import AsyncStorageClient
-from .utils import format_response, cache_response
-from .nested import process_nested_data
-from .generic import process_generic_data
+from app.storage import AsyncStorageClient, local_cache, memory_cache
+from app.config import Settings
+from .utils import cache_response, ParquetEncoder, get_framing, CacheEntry
+from .executor import run_formatter
+from .single_flight import SingleFlight
+from .coordination import get_coordinator
+from .projection import find_superset, project_payload
+from .history import request_history
+from .negative_cache import negative_cache
+from .cache_index import cache_index
+from .fragments import fragment_store
+from .checkpoint import GenerationCheckpoint
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
 __all__ = [
-    'get_data'
+    'get_data',
+    'ensure_cache_entry'
 ]
 
 
@@ -36,6 +48,11 @@ logger = getLogger('app')
 # Row limit for DB queries.
 RESPONSE_LIMIT = 10_000  # Records per iteration
 
+# Strong references to the tasks running in the background.
+_background_tasks = set()
+
+coordinator = get_coordinator()
+
 
 def log_response(query, arguments):
     """
@@ -68,93 +85,397 @@ def log_response(query, arguments):
     return process
 
 
-async def process_get_request(*, request: Request, **kwargs) -> AsyncGenerator[bytes, bytes]:
-    if len(request.nested_metrics) > 0:
-        func = partial(process_nested_data, request=request)
-    else:
-        func = partial(process_generic_data, request=request)
+async def process_get_request(*, request: Request, start: int = 0, **kwargs) -> AsyncGenerator[bytes, bytes]:
+    # Formatting runs in the executor whilst the next chunk is
+    # being fetched from the DB. Number of chunks being formatted
+    # at any one time is capped to keep the memory bounded.
+    max_pending = max(Settings.format_executor_workers, 1)
+    pending = deque()
+
+    # Parquet files are encoded as a single stream whose footer
+    # is produced once all the batches have been written.
+    encoder = ParquetEncoder(request) if request.format == "parquet" else None
+    last_index = None
+
+    async def encode(data: bytes) -> bytes:
+        if encoder is None:
+            return data
+
+        return await to_thread(encoder.write, data)
 
     # We use cursor movements instead of offset-limit. This is faster
     # as the DB won't have to iterate to fine the offset location.
     async with Connection() as conn:
         area_codes = await request.get_query_area_codes(conn)
 
-        header_generated = False
+        # Chunks preceding `start` have been produced by an
+        # earlier attempt - including the header.
+        header_generated = start > 0
+
+        try:
+            # Fetching data from the DB.
+            for index, codes in enumerate(area_codes):
+                if index < start:
+                    continue
+
+                result = await fragment_store.fetch(conn, request, codes)
+
+                if not len(result):
+                    continue
+
+                task = ensure_future(
+                    run_formatter(result, request=request, include_header=not header_generated)
+                )
+                pending.append((index, task))
+
+                header_generated = True
+
+                # Results are yielded in the order in which
+                # they were fetched.
+                while len(pending) >= max_pending or (pending and pending[0][1].done()):
+                    last_index, task = pending.popleft()
+                    yield last_index, await encode(await task)
+
+            while pending:
+                last_index, task = pending.popleft()
+                yield last_index, await encode(await task)
+
+            if encoder is not None and last_index is not None:
+                yield last_index + 1, await to_thread(encoder.close)
+
+        finally:
+            for _, task in pending:
+                task.cancel()
+
+
+async def generate_cache(request: Request) -> CacheEntry:
+    # Payloads are only generated once known not to be cached,
+    # which is when the markers of other instances are checked.
+    if await negative_cache.contains_persisted(request):
+        raise NotAvailable()
+
+    # Subsets of cached payloads are projected rather than queried.
+    try:
+        if (superset := await find_superset(request)) is not None:
+            return await cache_response(project_payload, request=request, superset=superset)
+    except NotAvailable as err:
+        raise err
+    except ResourceNotFoundError as err:
+        # Superset has since been removed.
+        cache_index.discard(superset.path)
+        logger.exception(err)
+    except Exception as err:
+        logger.exception(err)
+
+    # Parquet encoder is stateful, so its payloads cannot be resumed.
+    # Smaller payloads are cheaper to regenerate than to checkpoint.
+    if (
+        not Settings.generation_checkpoint_threshold or
+        request.format == "parquet" or
+        request.estimated_size < Settings.generation_checkpoint_threshold
+    ):
+        return await cache_response(process_get_request, request=request)
+
+    checkpoint = GenerationCheckpoint(request)
+
+    try:
+        entry = await cache_response(checkpoint.wrap(process_get_request), request=request)
+    except NotAvailable as err:
+        await checkpoint.clear()
+        raise err
+
+    # Fragments are retained on any other exception, for the next attempt.
+    run_in_background(checkpoint.clear())
+
+    return entry
+
+
+async def from_local_cache(request: Request,
+                           cache_entry: Union[CacheEntry, None] = None) -> Union[LocalFileResponse, None]:
+    # Raw payload is the last to be committed to the local tier.
+    if (raw_entry := await local_cache.get(request.path)) is None:
+        return None
+
+    entries = dict()
+    for encoding in request.cache_encodings:
+        if (entry := await local_cache.get(request.get_path(encoding))) is not None:
+            entries[encoding] = entry
+
+    encoding = request.get_encoding(list(entries))
+    entry = entries.get(encoding) or raw_entry
+
+    # Permalink leads to the target of an alias, where known.
+    if cache_entry is None:
+        cache_entry = cache_index.get(request.path)
+
+    return LocalFileResponse(
+        request,
+        filename=entry.filename,
+        path=entry.path,
+        size=entry.size,
+        content_encoding=encoding if encoding in entries else None,
+        permalink_path=cache_entry.path if cache_entry is not None else None
+    )
+
+
+async def ensure_cache_entry(request: Request) -> CacheEntry:
+    # Payloads known to be complete are served without
+    # any calls to the storage, and cached ones with one.
+    if (entry := await find_cache_entry(request)) is not None:
+        return entry
+
+    # Concurrent requests for the same payload on this host wait
+    # for the ongoing generation instead of polling the storage.
+    async with SingleFlight(request.path) as flight:
+        if flight.result is not None:
+            entry = CacheEntry(**{"path": request.path, **flight.result})
+        else:
+            entry = await coordinator.ensure_cached(request, generate_cache)
+            flight.complete(entry._asdict())
+
+    cache_index.add(request.path, entry, request.metric)
+
+    return entry
+
+
+async def find_cache_entry(request: Request) -> Union[CacheEntry, None]:
+    """
+    Returns the entry of the payload if it is cached, without
+    generating it otherwise.
+    """
+    return await cache_index.lookup(request.path)
+
 
-        # Fetching data from the DB.
-        for index, codes in enumerate(area_codes):
-            result = await conn.fetch(request.db_query, *request.db_args, codes)
+async def from_cache_or_db(request: Request) -> Union[Response, RedirectResponse, LocalFileResponse]:
+    request_history.record(request)
 
-            if not len(result):
-                continue
+    if (response := await from_local_cache(request)) is not None:
+        return response
 
-            res = format_response(
-                func(result),
-                response_type=request.format,
-                request=request,
-                include_header=not header_generated
-            )
+    entry = await ensure_cache_entry(request)
 
-            yield index, res
+    try:
+        return await serve_cache_entry(request, entry)
+    except ResourceNotFoundError:
+        # Indexed payload has since been removed - e.g. by the garbage collector.
+        cache_index.discard(request.path)
 
-            header_generated = True
+    entry = await ensure_cache_entry(request)
 
+    return await serve_cache_entry(request, entry)
 
-async def from_cache_or_db(request: Request) -> Union[Response, RedirectResponse]:
-    max_wait_cycles = 29  # Max wait: 4 minutes and 50 seconds
-    wait_period = 10  # seconds
-    wait_counter = 1
 
-    kws = {
-        "container": "apiv2cache",
-        "path": request.path,
-    }
+async def from_cache_or_stream(request: Request) -> Union[Response, RedirectResponse, LocalFileResponse]:
+    """
+    Serves small payloads from the cache, and streams
+    them from the DB only if they are not cached.
+    """
+    request_history.record(request)
 
-    cache_results = True
+    if (response := await from_local_cache(request)) is not None:
+        return response
 
-    async with AsyncStorageClient(**kws) as blob_client:
-        while await blob_client.exists() and wait_counter <= max_wait_cycles:
-            props = await blob_client.client.get_blob_tags()
+    if (entry := await find_cache_entry(request)) is not None:
+        try:
+            return await serve_cache_entry(request, entry)
+        except ResourceNotFoundError:
+            # Indexed payload has since been removed - e.g. by the garbage collector.
+            cache_index.discard(request.path)
 
-            # Wait for the blob lease to be release until `max_wait_cycles`
-            # is reached or the blob is removed.
-            lock_status = await blob_client.is_locked()
-            if lock_status and props.get("in_progress", '1') == '1':
-                await sleep(wait_period)
-                wait_counter += 1
-                continue
-            elif not lock_status and props.get('done', "0") != "1" and props.get('in_progress', '1') == '1':
-                await blob_client.delete()
-                cache_results = True
-                break
-            elif props.get('done', "0") == "1" and props.get('in_progress', '1') == '0':
-                cache_results = False
-                break
+    if await negative_cache.contains_persisted(request):
+        raise NotAvailable()
 
-    if cache_results:
-        await cache_response(process_get_request, request=request)
+    return await stream_response(request)
+
+
+async def serve_cache_entry(request: Request,
+                            entry: CacheEntry) -> Union[Response, RedirectResponse, LocalFileResponse]:
+    # Payloads generated on this host are served locally.
+    if (response := await from_local_cache(request, entry)) is not None:
+        return response
 
     if request.format != "xml":
-        return RedirectResponse(request, "apiv2cache", request.path)
-
-    with NamedTemporaryFile(mode='w+b') as cache_file:
-        async with AsyncStorageClient(kws['container'], kws['path']) as cli:
-            await cli.download_into(cache_file)
-
-        return Response(
-            content=cache_file.read(),
-            status_code=HTTPStatus.OK.real,
-            content_type=request.format,
-            release_date=request.release,
-            request=request
-        )
+        encoding = request.get_encoding(entry.encodings)
+        path = get_variant_path(entry.path, encoding)
+
+        # Small payloads are served inline, saving the client a round trip.
+        if (request.range_header is None and entry.size is not None and
+                entry.size < Settings.inline_serve_threshold):
+            return await serve_inline(request, path=path, content_encoding=encoding, etag=entry.etag)
+
+        return RedirectResponse(request, "apiv2cache", path, permalink_path=entry.path)
+
+    return await stream_from_cache(request, container="apiv2cache", path=entry.path, size=entry.size)
+
+
+async def serve_inline(request: Request, path: str, content_encoding: Union[str, None],
+                       etag: Union[str, None] = None) -> Response:
+    """
+    Serves a small cached payload in full, from the in-memory
+    tier of the worker where possible.
+    """
+    if (content := memory_cache.get(path, etag)) is None:
+        # Variants are served as they are stored, with their content encoding.
+        async with AsyncStorageClient("apiv2cache", path) as client:
+            content = await (await client.download(decompress=False)).readall()
+
+        memory_cache.put(path, content, etag)
+
+    return Response(
+        content=content,
+        status_code=HTTPStatus.OK.real,
+        content_type=request.format,
+        release_date=request.release,
+        request=request,
+        content_length=len(content),
+        content_encoding=content_encoding
+    )
+
+
+async def stream_from_cache(request: Request, container: str, path: str,
+                            size: Union[int, None] = None) -> Response:
+    """
+    Streams a cached payload from the storage in chunks, so
+    that the memory does not scale with the payload size.
+
+    Honours the ``Range`` of the request - if any - using
+    ranged reads of the blob.
+    """
+    if size is None:
+        async with AsyncStorageClient(container, path) as cli:
+            props = await cli.get_properties()
+
+        size = int(props['size'])
+
+    byte_range = parse_byte_range(request.range_header, size)
+
+    offset, length, content_range = 0, size, None
+    if byte_range is not None:
+        first, last = byte_range
+        offset, length, content_range = first, last - first + 1, (first, last, size)
+
+    async def stream():
+        async with AsyncStorageClient(container, path) as client:
+            async for chunk in client.download_chunks(offset=offset, length=length):
+                yield chunk
+
+    return Response(
+        content=stream(),
+        status_code=(HTTPStatus.OK if byte_range is None else HTTPStatus.PARTIAL_CONTENT).real,
+        content_type=request.format,
+        release_date=request.release,
+        request=request,
+        content_length=length,
+        content_range=content_range,
+        accept_ranges=True
+    )
+
 
+def run_in_background(coroutine):
+    task = ensure_future(coroutine)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
 
-async def get_data(*, request: Request) -> Union[Response, RedirectResponse]:
+
+async def cache_in_background(request: Request, payload: list[tuple[int, bytes]]):
+    """
+    Caches a payload that has already been produced, unless
+    it has been cached by another process in the meantime.
+    """
+    async def replay(**kwargs):
+        for item in payload:
+            yield item
+
+    try:
+        async with AsyncStorageClient("apiv2cache", request.path) as blob_client:
+            if await blob_client.exists():
+                return
+
+        entry = await cache_response(replay, request=request)
+        cache_index.add(request.path, entry, request.metric)
+    except Exception as err:
+        logger.exception(err)
+
+
+async def stream_response(request: Request) -> Response:
+    """
+    Streams the response directly from the DB. The payload is
+    cached in the background once the stream is complete, unless
+    it exceeds ``Settings.direct_stream_buffer_size``.
+    """
+    prefix, suffix, delimiter = get_framing(request)
+    chunks = process_get_request(request=request)
+
+    # The status code cannot be altered once the
+    # streaming has begun.
+    try:
+        first_chunk = await chunks.__anext__()
+    except StopAsyncIteration:
+        raise NotAvailable()
+
+    async def stream():
+        payload = [first_chunk]
+        payload_size = len(first_chunk[1])
+
+        try:
+            yield prefix + first_chunk[1]
+
+            async for index, item in chunks:
+                if payload is not None:
+                    payload.append((index, item))
+                    payload_size += len(item)
+
+                    # Too large to be held in memory, so is not cached.
+                    if payload_size > Settings.direct_stream_buffer_size:
+                        payload = None
+                        logger.info(dumps({
+                            "streamBufferExceeded": {
+                                "path": request.path,
+                                "estimatedSize": request.estimated_size
+                            }
+                        }).decode())
+
+                if item:
+                    yield delimiter + item
+
+            if payload is not None:
+                run_in_background(cache_in_background(request, payload))
+
+            yield suffix
+        finally:
+            await chunks.aclose()
+
+    return Response(
+        content=stream(),
+        status_code=HTTPStatus.OK.real,
+        content_type=request.format,
+        release_date=request.release,
+        request=request
+    )
+
+
+async def get_data(*, request: Request) -> Union[Response, RedirectResponse, LocalFileResponse]:
+    # Requests known to yield no data are rejected before any DB work.
+    if await negative_cache.contains(request):
+        raise NotAvailable()
+
+    try:
+        return await query_data(request=request)
+    except NotAvailable as err:
+        await negative_cache.add(request)
+        raise err
+
+
+async def query_data(*, request: Request) -> Union[Response, RedirectResponse, LocalFileResponse]:
     content = None
 
     if request.method == RequestMethod.Get:
-        content = await from_cache_or_db(request=request)
+        # Range requests are served from the cache, where the payload size is known.
+        if request.range_header is None and request.estimated_size < Settings.direct_stream_threshold:
+            content = await from_cache_or_stream(request=request)
+        else:
+            content = await from_cache_or_db(request=request)
 
     if request.method == RequestMethod.Head:
         async with Connection() as conn:
@@ -0,0 +1,307 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from logging import getLogger
+from typing import Union, Iterable
+from collections import OrderedDict
+from hashlib import blake2b
+from math import ceil, log
+from time import time
+from asyncio import Lock, ensure_future
+
+# 3rd party:
+from orjson import dumps
+from azure.core.exceptions import ResourceNotFoundError
+
+# Internal:
+from app.config import Settings
+from app.storage import AsyncStorageClient
+from app.utils.compression import ENCODING_EXTENSIONS
+from .utils import CACHE_CONTAINER, CacheEntry, get_encodings, get_size, get_latest_release
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'BloomFilter',
+    'CacheIndex',
+    'cache_index',
+    'start_index_loader'
+]
+
+
+logger = getLogger('app')
+
+VARIANT_EXTENSIONS = tuple(f".{extension}" for extension in ENCODING_EXTENSIONS.values())
+
+# Directories of a release that hold auxiliary blobs rather than payloads.
+AUXILIARY_DIRS = {"objects", "not_available", "fragments"}
+
+
+class BloomFilter:
+    """
+    Probabilistic set of strings, with no false negatives.
+
+    Parameters
+    ----------
+    capacity: int
+        Expected number of items.
+
+    error_rate: float
+        Probability of false positives at ``capacity``.
+    """
+    def __init__(self, capacity: int, error_rate: float):
+        capacity = max(capacity, 1)
+
+        self.n_bits = ceil(-capacity * log(error_rate) / log(2) ** 2)
+        self.n_hashes = max(round(self.n_bits / capacity * log(2)), 1)
+        self._bits = bytearray(ceil(self.n_bits / 8))
+
+    def _get_positions(self, item: str):
+        # Double hashing - Kirsch & Mitzenmacher.
+        digest = blake2b(item.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:], "big") | 1
+
+        for index in range(self.n_hashes):
+            yield (first + index * second) % self.n_bits
+
+    def add(self, item: str):
+        for position in self._get_positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item: str) -> bool:
+        return all(
+            self._bits[position >> 3] & (1 << (position & 7))
+            for position in self._get_positions(item)
+        )
+
+
+class CacheIndex:
+    """
+    Index of the complete payloads in ``apiv2cache``, held by each worker
+    so that known payloads are served without any calls to the storage.
+
+    The most recently used entries are held in full, up to ``max_size``.
+    All paths ever indexed are also added to a Bloom filter, which tells
+    the definite misses apart from the evicted entries - the latter are
+    verified with a single call to the storage. Misses are only definite
+    once the release has been ``load``-ed: payloads cached elsewhere
+    since then are found by the coordinator of the generation instead.
+
+    Entries expire after ``ttl`` seconds, so that payloads removed from
+    the storage - e.g. by the garbage collector - are eventually dropped.
+    Entries found to be missing before then are to be ``discard``-ed.
+
+    The metrics of the payloads are also indexed by release and directory,
+    so that the supersets of a request are found without listing the
+    storage. Each release is listed once - when first needed - and is
+    then kept up to date as payloads are added. Only the metrics of the
+    ``max_releases`` most recent releases are held, and they are kept
+    regardless of ``max_size``.
+    """
+    max_releases = 2
+
+    def __init__(self, max_size: int = Settings.cache_index_size,
+                 ttl: int = Settings.cache_index_ttl,
+                 bloom_capacity: int = Settings.cache_index_bloom_capacity,
+                 bloom_error_rate: float = Settings.cache_index_bloom_error_rate):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[CacheEntry, float]] = OrderedDict()
+        self._bloom = BloomFilter(bloom_capacity, bloom_error_rate)
+        # Release -> directory -> path -> (target, metrics)
+        self._metrics: dict[str, dict[str, dict[str, tuple[str, frozenset[str]]]]] = dict()
+        self._loaded_releases: set[str] = set()
+        self._load_lock = Lock()
+
+    def add(self, path: str, entry: CacheEntry, metrics: Union[Iterable[str], None] = None):
+        if metrics is not None:
+            self._add_metrics(path, entry.path, metrics)
+
+        if not self.max_size:
+            return
+
+        # Details of the payload are only known to the process
+        # that cached it, and must not be overwritten.
+        if (existing := self.get(path)) is not None and entry.size is None:
+            entry = entry._replace(size=existing.size, etag=existing.etag)
+
+        self._entries[path] = entry, time() + self.ttl
+        self._entries.move_to_end(path)
+        self._bloom.add(path)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, path: str):
+        self._entries.pop(path, None)
+
+        release, directory = path.split("/", 1)[0], path.rsplit("/", 1)[0]
+        self._metrics.get(release, dict()).get(directory, dict()).pop(path, None)
+
+    def _add_metrics(self, path: str, target: str, metrics: Iterable[str]):
+        release, directory = path.split("/", 1)[0], path.rsplit("/", 1)[0]
+
+        if release not in self._metrics:
+            # Releases are ISO dates, so the oldest sorts first.
+            if len(self._metrics) >= self.max_releases and release < min(self._metrics):
+                return
+
+            self._metrics[release] = dict()
+
+            while len(self._metrics) > self.max_releases:
+                oldest = min(self._metrics)
+                del self._metrics[oldest]
+                self._loaded_releases.discard(oldest)
+
+        paths = self._metrics[release].setdefault(directory, dict())
+        paths[path] = target, frozenset(filter(None, metrics))
+
+    def get_supersets(self, path: str, metrics: Iterable[str]) -> list[tuple[str, frozenset[str]]]:
+        """
+        Returns the target and the metrics of the indexed payloads in the
+        directory of ``path`` and with its extension, whose metrics are a
+        strict superset of ``metrics``.
+        """
+        release, directory = path.split("/", 1)[0], path.rsplit("/", 1)[0]
+        filename = path.rsplit("/", 1)[1]
+        extension = filename[filename.index("."):]
+        requested = set(metrics)
+
+        return [
+            (target, indexed)
+            for candidate, (target, indexed) in
+            self._metrics.get(release, dict()).get(directory, dict()).items()
+            if candidate != path and candidate.endswith(extension) and requested < indexed
+        ]
+
+    def is_loaded(self, release: str) -> bool:
+        return release in self._loaded_releases
+
+    def get(self, path: str) -> Union[CacheEntry, None]:
+        if (item := self._entries.get(path)) is None:
+            return None
+
+        entry, expires = item
+
+        if expires < time():
+            del self._entries[path]
+            return None
+
+        self._entries.move_to_end(path)
+
+        return entry
+
+    async def lookup(self, path: str) -> Union[CacheEntry, None]:
+        """
+        Returns the entry of a complete payload at ``path``, or ``None``
+        if it is not complete. The storage is probed at most once, and
+        only where the index cannot tell.
+        """
+        if (entry := self.get(path)) is not None:
+            return entry
+
+        release = path.split("/", 1)[0]
+
+        # Never indexed since the release was listed.
+        if self.max_size and self.is_loaded(release) and path not in self._bloom:
+            return None
+
+        try:
+            async with AsyncStorageClient(CACHE_CONTAINER, path) as client:
+                tags = await client.get_tags()
+        except ResourceNotFoundError:
+            return None
+
+        if tags.get("done") != "1" or tags.get("in_progress") != "0":
+            return None
+
+        entry = CacheEntry(
+            path=tags.get("alias", path),
+            encodings=get_encodings(tags),
+            size=get_size(tags)
+        )
+        self.add(path, entry, tags.get("metrics", "").split(":"))
+
+        return entry
+
+    async def load(self, release: Union[str, None] = None):
+        """
+        Indexes the complete payloads of ``release`` - the latest
+        release if not specified - unless it is already indexed.
+        """
+        if release is None and (release := await get_latest_release()) is None:
+            return
+
+        async with self._load_lock:
+            if self.is_loaded(release):
+                return
+
+            await self._load(release)
+
+            self._loaded_releases.add(release)
+
+    async def _load(self, release: str):
+        start = time()
+        entries: dict[str, CacheEntry] = dict()
+        metrics: dict[str, list[str]] = dict()
+
+        async with AsyncStorageClient(CACHE_CONTAINER, f"{release}/") as client:
+            async for blob in client.list_blobs(include_tags=True):
+                tags = blob.tags or dict()
+                directory = blob.name.split("/", 2)[1]
+
+                if blob.name.endswith(VARIANT_EXTENSIONS) or directory in AUXILIARY_DIRS:
+                    continue
+
+                if tags.get("done") != "1" or tags.get("in_progress") != "0":
+                    continue
+
+                entries[blob.name] = CacheEntry(
+                    path=tags.get("alias", blob.name),
+                    encodings=get_encodings(tags),
+                    size=blob.size,
+                    etag=blob.etag
+                )
+                metrics[blob.name] = tags.get("metrics", "").split(":")
+
+        for path, entry in entries.items():
+            # Aliases are empty - their content is that of the target.
+            if entry.path != path:
+                target = entries.get(entry.path)
+                entry = entry._replace(
+                    size=target.size if target is not None else None,
+                    etag=target.etag if target is not None else None
+                )
+
+            self.add(path, entry, metrics[path])
+
+        logger.info(dumps({
+            "cacheIndex": {
+                "release": release,
+                "loaded": len(entries),
+                "durationMs": round((time() - start) * 1000, 2)
+            }
+        }).decode())
+
+
+cache_index = CacheIndex()
+
+_loader = None
+
+
+async def _load_index():
+    try:
+        await cache_index.load()
+    except Exception as err:
+        logger.exception(err)
+
+
+def start_index_loader():
+    global _loader
+
+    # The index is loaded in the background as requests are served.
+    if _loader is None:
+        _loader = ensure_future(_load_index())
@@ -0,0 +1,178 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from logging import getLogger
+from typing import NamedTuple
+from asyncio import FIRST_COMPLETED, Task, ensure_future, gather, wait
+
+# 3rd party:
+from orjson import dumps
+from azure.core.exceptions import ResourceNotFoundError
+
+# Internal:
+from app.config import Settings
+from app.storage import AsyncStorageClient
+from app.utils.operations import Request
+from .constants import CACHE_CONTAINER, FRAGMENTS_SUFFIX
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'Fragment',
+    'GenerationCheckpoint',
+    'FRAGMENTS_SUFFIX'
+]
+
+
+logger = getLogger('app')
+
+# Uploads outlive the generation should it be interrupted.
+_uploads: set[Task] = set()
+
+
+class Fragment(NamedTuple):
+    sequence: int
+    index: int
+    name: str
+
+
+class GenerationCheckpoint:
+    """
+    Checkpoints of the generation of a payload.
+
+    Each item produced by the generator is stored as a fragment blob
+    named after its position in the payload and its index - i.e. its
+    area chunk. Fragments are uploaded in order, and each is visible
+    only once complete, so the listing of the fragments serves as the
+    manifest of the checkpoint.
+
+    Fragments are uploaded in the background - up to ``max_uploads`` at
+    a time - so as not to hold up the generation, and are all awaited
+    before it completes. Only the fragments that are contiguous from the
+    start are replayed, so those uploaded out of order are ignored.
+
+    A later attempt replays the fragments, and resumes the generation
+    from the chunk following the last one. As the chunks are processed
+    deterministically, the payload is identical to that of an attempt
+    that has not been interrupted.
+    """
+    def __init__(self, request: Request, max_uploads: int = Settings.upload_max_concurrency):
+        self.path = request.path
+        self.prefix = f"{request.path}{FRAGMENTS_SUFFIX}/"
+        self.names: list[str] = list()
+        self.max_uploads = max(max_uploads, 1)
+        self._uploads: set[Task] = set()
+
+    def get_name(self, sequence: int, index: int) -> str:
+        return f"{self.prefix}{sequence:06d}-{index:06d}"
+
+    async def list(self) -> list[Fragment]:
+        fragments = list()
+
+        async with AsyncStorageClient(CACHE_CONTAINER, self.prefix) as client:
+            async for blob in client.list_blobs():
+                sequence, index = blob.name.removeprefix(self.prefix).split("-")
+                fragments.append(Fragment(int(sequence), int(index), blob.name))
+
+        fragments.sort()
+
+        # Only the contiguous fragments from the start may be replayed.
+        for position, fragment in enumerate(fragments):
+            if fragment.sequence != position:
+                return fragments[:position]
+
+        return fragments
+
+    async def save(self, sequence: int, index: int, item: bytes):
+        kws = {
+            "container": CACHE_CONTAINER,
+            "path": self.get_name(sequence, index),
+            "compressed": False,
+            "content_type": "application/octet-stream"
+        }
+
+        try:
+            async with AsyncStorageClient(**kws) as client:
+                await client.upload(item)
+        except Exception as err:
+            # Checkpoints are best-effort - subsequent fragments
+            # are simply not replayed.
+            logger.exception(err)
+            return
+
+        self.names.append(kws["path"])
+
+    async def save_in_background(self, sequence: int, index: int, item: bytes):
+        while len(self._uploads) >= self.max_uploads:
+            await wait(self._uploads, return_when=FIRST_COMPLETED)
+
+        task = ensure_future(self.save(sequence, index, item))
+        self._uploads.add(task)
+        _uploads.add(task)
+        task.add_done_callback(self._uploads.discard)
+        task.add_done_callback(_uploads.discard)
+
+    async def wait_for_uploads(self):
+        if self._uploads:
+            await gather(*self._uploads)
+
+    @staticmethod
+    async def load(fragment: Fragment) -> bytes:
+        async with AsyncStorageClient(CACHE_CONTAINER, fragment.name) as client:
+            return await (await client.download()).readall()
+
+    async def clear(self):
+        """
+        Removes the fragments replayed or saved by this attempt.
+        """
+        async def delete(name: str):
+            try:
+                async with AsyncStorageClient(CACHE_CONTAINER, name) as client:
+                    await client.delete()
+            except ResourceNotFoundError:
+                pass
+
+        names, self.names = self.names, list()
+
+        try:
+            await gather(*map(delete, names))
+        except Exception as err:
+            logger.exception(err)
+
+    def wrap(self, func):
+        """
+        Wraps a resumable generator - one that takes the index of the
+        chunk from which to ``start`` - so that the items it produces
+        are checkpointed, and those of earlier attempts replayed.
+        """
+        async def resumable(**kwargs):
+            fragments = await self.list()
+            start = 0
+
+            if fragments:
+                logger.info(dumps({
+                    "resumedGeneration": {
+                        "path": self.path,
+                        "fragments": len(fragments),
+                        "start": fragments[-1].index + 1
+                    }
+                }).decode())
+
+            for fragment in fragments:
+                self.names.append(fragment.name)
+                yield fragment.index, await self.load(fragment)
+                start = fragment.index + 1
+
+            sequence = len(fragments)
+
+            async for index, item in func(start=start, **kwargs):
+                await self.save_in_background(sequence, index, item)
+                sequence += 1
+
+                yield index, item
+
+            await self.wait_for_uploads()
+
+        return resumable
@@ -0,0 +1,168 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from logging import getLogger
+from typing import Any, Union
+from asyncio import Future, get_running_loop, shield, sleep
+from contextlib import contextmanager
+
+# 3rd party:
+from orjson import dumps
+
+# Internal:
+from app.config import Settings
+from app.utils.operations import Request
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'FetchCoalescer',
+    'fetch_coalescer'
+]
+
+
+logger = getLogger('app')
+
+
+class CoalescedFetchError(RuntimeError):
+    pass
+
+
+class FetchBatch:
+    def __init__(self):
+        self.metrics: set[str] = set()
+        self.n_waiters = 0
+        self.future: Future = get_running_loop().create_future()
+
+    def fail(self, err: BaseException):
+        if self.future.done():
+            return
+
+        self.future.set_exception(CoalescedFetchError(repr(err)))
+
+        # Marks the exception as retrieved, as there may be no waiters.
+        self.future.exception()
+
+
+def get_area_ids(codes) -> tuple:
+    # Area codes are either a single record, or a chunk of records.
+    if isinstance(codes, list):
+        return tuple(item[0] for item in codes)
+
+    return tuple(codes)
+
+
+def select_metrics(rows: list, metrics: set[str]) -> list:
+    return [row for row in rows if row["metric"] in metrics]
+
+
+class FetchCoalescer:
+    """
+    Merges the concurrent DB fetches of different requests for the same
+    query - i.e. partition and query type - area type, and area chunk
+    into a single fetch for the union of their metrics. Rows are then
+    split back out to each request by their metric.
+
+    Fetches for a chunk that is not already being fetched are issued
+    immediately. Otherwise, a batch is opened, and its first request
+    waits for ``window`` seconds for others to join before it runs the
+    query on its own connection. Should it fail - e.g. as the request
+    is cancelled - the others run their own queries instead.
+
+    Parameters
+    ----------
+    window: float
+        Time in seconds for which a batch is open to new requests.
+        Fetches are not coalesced when set to 0.
+    """
+    def __init__(self, window: float = Settings.fetch_coalesce_window / 1000):
+        self.window = window
+        self._batches: dict[tuple, FetchBatch] = dict()
+        self._in_flight: dict[tuple, int] = dict()
+
+    @contextmanager
+    def _track(self, key: tuple):
+        self._in_flight[key] = self._in_flight.get(key, 0) + 1
+
+        try:
+            yield
+        finally:
+            if (n_fetches := self._in_flight.pop(key) - 1) > 0:
+                self._in_flight[key] = n_fetches
+
+    async def fetch(self, conn, request: Request, codes,
+                    metrics: Union[list[str], None] = None) -> list[Any]:
+        """
+        Fetches the records of ``request`` - or of a subset of
+        its ``metrics`` - for a chunk of areas.
+        """
+        if metrics is None:
+            metrics, _ = request.db_args
+
+        _, area_type = request.db_args
+
+        if not self.window:
+            return await conn.fetch(request.db_query, metrics, area_type, codes)
+
+        key = request.db_query, area_type, get_area_ids(codes)
+
+        # Uncontended fetches are not delayed by the window.
+        if key not in self._batches and key not in self._in_flight:
+            with self._track(key):
+                return await conn.fetch(request.db_query, metrics, area_type, codes)
+
+        if (batch := self._batches.get(key)) is None:
+            batch = self._batches[key] = FetchBatch()
+            batch.metrics.update(metrics)
+            batch.n_waiters += 1
+
+            return await self._lead(key, batch, conn, request, codes, metrics)
+
+        batch.metrics.update(metrics)
+        batch.n_waiters += 1
+
+        try:
+            rows = await shield(batch.future)
+        except CoalescedFetchError:
+            return await conn.fetch(request.db_query, metrics, area_type, codes)
+
+        return select_metrics(rows, set(metrics))
+
+    async def _lead(self, key: tuple, batch: FetchBatch, conn, request: Request,
+                    codes, metrics: list[str]) -> list[Any]:
+        _, area_type = request.db_args
+
+        try:
+            try:
+                await sleep(self.window)
+            finally:
+                # No more requests may join once the query is issued.
+                if self._batches.get(key) is batch:
+                    del self._batches[key]
+
+            with self._track(key):
+                rows = await conn.fetch(request.db_query, list(batch.metrics), area_type, codes)
+        except BaseException as err:
+            batch.fail(err)
+            raise
+
+        batch.future.set_result(rows)
+
+        if batch.n_waiters > 1:
+            logger.info(dumps({
+                "fetchCoalesced": {
+                    "requests": batch.n_waiters,
+                    "metrics": len(batch.metrics),
+                    "rows": len(rows)
+                }
+            }).decode())
+
+        if len(batch.metrics) == len(metrics):
+            return rows
+
+        return select_metrics(rows, set(metrics))
+
+
+fetch_coalescer = FetchCoalescer()
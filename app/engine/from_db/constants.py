@@ -0,0 +1,24 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+
+# 3rd party:
+
+# Internal:
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'CACHE_CONTAINER',
+    'FRAGMENTS_SUFFIX'
+]
+
+
+# Layout of the cache - kept free of imports, so that
+# it is shared with the `gc` CLI without the engine.
+CACHE_CONTAINER = "apiv2cache"
+
+# Fragments of a payload are stored under "<path>.parts/".
+FRAGMENTS_SUFFIX = ".parts"
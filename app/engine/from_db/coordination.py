@@ -0,0 +1,265 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from logging import getLogger
+from typing import Callable, Awaitable, Union
+from abc import ABC, abstractmethod
+from asyncio import (
+    sleep, Lock, Future, wait_for, get_running_loop, TimeoutError as AsyncTimeoutError
+)
+from hashlib import blake2b
+from time import time
+
+# 3rd party:
+from orjson import dumps, loads
+from azure.core.exceptions import ResourceNotFoundError
+
+# Internal:
+from app.config import Settings
+from app.database import Connection
+from app.storage import AsyncStorageClient
+from app.utils.operations import Request
+from .utils import CacheEntry, get_cache_entry
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'GenerationCoordinator',
+    'BlobLeaseCoordinator',
+    'PostgresCoordinator',
+    'NotificationListener',
+    'get_coordinator'
+]
+
+
+logger = getLogger('app')
+
+GenerateFunc = Callable[[Request], Awaitable[CacheEntry]]
+
+NOTIFICATION_CHANNEL = "apiv2cache_generation"
+
+
+class GenerationCoordinator(ABC):
+    """
+    Ensures that a payload is generated by no more
+    than one process at a time across all nodes.
+    """
+    @abstractmethod
+    async def ensure_cached(self, request: Request, generate: GenerateFunc) -> CacheEntry:
+        """
+        Ensures that the payload is available in the cache - generating
+        it using ``generate`` if need be - and returns its location and
+        the content encodings of its compressed variants.
+        """
+        ...
+
+
+class BlobLeaseCoordinator(GenerationCoordinator):
+    """
+    Coordinates generations through the lease and the
+    ``done`` / ``in_progress`` tags of the cache blob.
+    """
+    wait_period = 10  # seconds
+
+    async def ensure_cached(self, request: Request, generate: GenerateFunc) -> CacheEntry:
+        max_wait_cycles = Settings.generation_timeout // self.wait_period
+        wait_counter = 1
+
+        kws = {
+            "container": "apiv2cache",
+            "path": request.path,
+        }
+
+        cache_results = True
+        entry = None
+
+        async with AsyncStorageClient(**kws) as blob_client:
+            while await blob_client.exists() and wait_counter <= max_wait_cycles:
+                props = await blob_client.get_tags()
+
+                # Wait for the blob lease to be release until `max_wait_cycles`
+                # is reached or the blob is removed.
+                lock_status = await blob_client.is_locked()
+                if lock_status and props.get("in_progress", '1') == '1':
+                    await sleep(self.wait_period)
+                    wait_counter += 1
+                    continue
+                elif not lock_status and props.get('done', "0") != "1" and props.get('in_progress', '1') == '1':
+                    await blob_client.delete()
+                    cache_results = True
+                    break
+                elif props.get('done', "0") == "1" and props.get('in_progress', '1') == '0':
+                    cache_results = False
+                    entry = get_cache_entry(request, props)
+                    break
+
+        if cache_results:
+            entry = await generate(request)
+
+        return entry
+
+
+class NotificationListener:
+    """
+    Single connection per worker that listens on ``NOTIFICATION_CHANNEL``,
+    and passes on each notification to the in-process waiters for its path.
+
+    The connection is opened on first use, and reopened should it be lost.
+    """
+    def __init__(self):
+        self._connection: Union[Connection, None] = None
+        self._lock = Lock()
+        self._waiters: dict[str, set[Future]] = dict()
+
+    async def start(self):
+        if self._connection is not None and not self._connection.is_closed():
+            return
+
+        async with self._lock:
+            if self._connection is not None and not self._connection.is_closed():
+                return
+
+            connection = Connection()
+            await connection.__aenter__()
+            await connection.add_listener(NOTIFICATION_CHANNEL, self._on_notification)
+            self._connection = connection
+
+    def subscribe(self, path: str) -> Future:
+        future = get_running_loop().create_future()
+        self._waiters.setdefault(path, set()).add(future)
+        return future
+
+    def unsubscribe(self, path: str, future: Future):
+        waiters = self._waiters.get(path, set())
+        waiters.discard(future)
+
+        if not waiters:
+            self._waiters.pop(path, None)
+
+    def _on_notification(self, connection, pid, channel, payload):
+        content = loads(payload)
+
+        for future in self._waiters.pop(content["path"], set()):
+            if not future.done():
+                future.set_result(content)
+
+
+class PostgresCoordinator(GenerationCoordinator):
+    """
+    Coordinates generations through session-level advisory locks on
+    a hash of ``Request.path``. The owner of the lock announces the
+    completion on ``NOTIFICATION_CHANNEL``, waking up the waiters on
+    all nodes.
+
+    Waiters hold no connection of their own: notifications are received
+    by a ``NotificationListener`` shared by the worker. The lock is also
+    retried every ``poll_period`` in case a notification is missed - e.g.
+    when the owner is lost, or the listener is reconnected.
+
+    Payloads that are being generated by a node relying on blob
+    leases are waited for using ``BlobLeaseCoordinator``.
+    """
+    poll_period = 10  # seconds
+
+    def __init__(self):
+        self._fallback = BlobLeaseCoordinator()
+        self._listener = NotificationListener()
+
+    @staticmethod
+    def get_lock_id(path: str) -> int:
+        digest = blake2b(path.encode(), digest_size=8).digest()
+        return int.from_bytes(digest, "big", signed=True)
+
+    async def ensure_cached(self, request: Request, generate: GenerateFunc) -> CacheEntry:
+        lock_id = self.get_lock_id(request.path)
+        deadline = time() + Settings.generation_timeout
+
+        while time() < deadline:
+            await self._listener.start()
+
+            # Subscribe before attempting to acquire the lock so
+            # that no notification can be missed in between.
+            completed = self._listener.subscribe(request.path)
+
+            try:
+                async with Connection() as conn:
+                    if await conn.fetchval("SELECT pg_try_advisory_lock($1)", lock_id):
+                        return await self._generate(conn, lock_id, request, generate)
+
+                timeout = min(self.poll_period, deadline - time())
+
+                try:
+                    notification = await wait_for(completed, timeout=max(timeout, 0))
+                except AsyncTimeoutError:
+                    continue
+            finally:
+                self._listener.unsubscribe(request.path, completed)
+
+            if notification.get("done"):
+                return CacheEntry(
+                    path=notification.get("location", request.path),
+                    encodings=notification["encodings"],
+                    size=notification.get("size")
+                )
+
+        # The generation did not complete within the time limit.
+        return await self._fallback.ensure_cached(request, generate)
+
+    async def _generate(self, conn, lock_id: int, request: Request,
+                        generate: GenerateFunc) -> CacheEntry:
+        outcome = {"path": request.path, "done": False}
+
+        try:
+            tags = await self._get_tags(request)
+            in_progress = tags is not None and tags.get("in_progress", "1") == "1"
+
+            if tags is not None and tags.get("done", "0") == "1" and not in_progress:
+                entry = get_cache_entry(request, tags)
+            elif in_progress and await self._is_leased(request):
+                entry = await self._fallback.ensure_cached(request, generate)
+            else:
+                entry = await generate(request)
+
+            outcome.update({
+                "done": True,
+                "location": entry.path,
+                "encodings": entry.encodings,
+                "size": entry.size
+            })
+            return entry
+        finally:
+            await conn.execute("SELECT pg_notify($1, $2)", NOTIFICATION_CHANNEL, dumps(outcome).decode())
+            await conn.fetchval("SELECT pg_advisory_unlock($1)", lock_id)
+
+    @staticmethod
+    async def _get_tags(request: Request) -> Union[dict[str, str], None]:
+        try:
+            async with AsyncStorageClient("apiv2cache", request.path) as blob_client:
+                return await blob_client.get_tags()
+        except ResourceNotFoundError:
+            return None
+
+    @staticmethod
+    async def _is_leased(request: Request) -> bool:
+        async with AsyncStorageClient("apiv2cache", request.path) as blob_client:
+            return await blob_client.is_locked()
+
+
+_coordinators = {
+    "blob": BlobLeaseCoordinator,
+    "postgres": PostgresCoordinator,
+}
+
+
+def get_coordinator() -> GenerationCoordinator:
+    coordinator = _coordinators.get(Settings.generation_coordinator.lower())
+
+    if coordinator is None:
+        raise ValueError(
+            "Generation coordinator must be one of %s. "
+            "Got <%r> instead." % (list(_coordinators), Settings.generation_coordinator)
+        )
+
+    return coordinator()
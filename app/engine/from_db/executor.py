@@ -0,0 +1,113 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from logging import getLogger
+from typing import Union, Iterable, Any
+from asyncio import get_running_loop
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import get_context
+from functools import partial
+
+# 3rd party:
+from asyncpg import Record
+
+# Internal:
+from app.config import Settings
+from app.utils.operations import Request
+from .utils import format_response
+from .nested import process_nested_data
+from .generic import process_generic_data
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'run_formatter',
+    'shutdown_executor'
+]
+
+
+logger = getLogger('app')
+
+_executor: Union[Executor, None] = None
+
+
+def get_executor() -> Union[Executor, None]:
+    """
+    Lazily creates the executor for the current worker.
+
+    Returns ``None`` when the executor type is set to ``inline``,
+    in which case the processing runs on the event loop.
+    """
+    global _executor
+
+    if _executor is not None:
+        return _executor
+
+    executor_type = Settings.format_executor.lower()
+    max_workers = Settings.format_executor_workers
+
+    if executor_type == "process":
+        # Forking a process with a running event loop and open
+        # sockets is unsafe, hence the "spawn" context.
+        _executor = ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=get_context("spawn")
+        )
+    elif executor_type == "thread":
+        _executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix="formatter"
+        )
+    elif executor_type != "inline":
+        raise ValueError(
+            "Executor type must be one of 'process', 'thread' or 'inline'. "
+            "Got <%r> instead." % executor_type
+        )
+
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+
+
+def process_records(columns: list[str], rows: Iterable[tuple[Any, ...]], request: Request,
+                    include_header: bool) -> bytes:
+    """
+    Processes and formats a batch of DB records.
+
+    Records are received as plain tuples so that they can be
+    transferred to the executor without the overhead of pickling
+    their column names.
+    """
+    if len(request.nested_metrics) > 0:
+        records = [dict(zip(columns, row)) for row in rows]
+        payload = process_nested_data(records, request=request)
+    else:
+        payload = process_generic_data(rows, request=request)
+
+    return format_response(
+        payload,
+        response_type=request.format,
+        request=request,
+        include_header=include_header
+    )
+
+
+async def run_formatter(records: list[Record], request: Request, include_header: bool) -> bytes:
+    columns = list(records[0].keys())
+    rows = list(map(tuple, records))
+
+    func = partial(process_records, columns, rows, request, include_header)
+
+    if (executor := get_executor()) is None:
+        return func()
+
+    loop = get_running_loop()
+    return await loop.run_in_executor(executor, func)
@@ -0,0 +1,197 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from logging import getLogger
+from typing import Any, Union
+from hashlib import blake2b
+from asyncio import Semaphore, ensure_future, gather
+
+# 3rd party:
+from orjson import dumps, loads
+from azure.core.exceptions import ResourceNotFoundError
+
+# Internal:
+from app.config import Settings
+from app.storage import AsyncStorageClient
+from app.utils.operations import Request
+from app.utils.assets import RequestMethod, get_latest_timestamp
+from .utils import CACHE_CONTAINER
+from .coalescer import fetch_coalescer, get_area_ids
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'FragmentRecord',
+    'FragmentStore',
+    'fragment_store'
+]
+
+
+logger = getLogger('app')
+
+
+class FragmentRecord(tuple):
+    """
+    DB record restored from a fragment, with the interface
+    of ``asyncpg.Record`` used by the formatters.
+    """
+    columns: tuple[str, ...]
+
+    def __new__(cls, columns: tuple[str, ...], values):
+        record = super().__new__(cls, values)
+        record.columns = columns
+        return record
+
+    def keys(self) -> tuple[str, ...]:
+        return self.columns
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            key = self.columns.index(key)
+
+        return super().__getitem__(key)
+
+
+class FragmentStore:
+    """
+    Persistent store of the DB records of each (query, metric, area chunk)
+    cell - i.e. the records of one metric for one chunk of areas in the
+    partition of a release.
+
+    Requests are assembled from the cells of their metrics. Only the
+    missing cells are fetched from the DB, and are then stored for any
+    other combination of metrics that includes them. Cells are stored
+    as records rather than formatted payloads, as metrics are pivoted
+    into the columns of a payload.
+
+    Empty cells are never stored, nor are those of releases that are
+    yet to be published - their records may change upon publication.
+
+    Cells are only stored for full downloads of area types other than
+    "msoa" - i.e. those produced in chunks of areas, whose records are
+    JSON-serialisable.
+
+    Parameters
+    ----------
+    enabled: bool
+        Whether to use the store.
+
+    concurrency: int
+        Maximum number of concurrent calls to the storage.
+    """
+    def __init__(self, enabled: bool = Settings.fragment_store_enabled,
+                 concurrency: int = Settings.fragment_store_concurrency):
+        self.enabled = enabled
+        self._semaphore = Semaphore(max(concurrency, 1))
+        self._pending = set()
+
+    def is_applicable(self, request: Request) -> bool:
+        return (
+            self.enabled and
+            request.method == RequestMethod.Get and
+            request.area_code is None and
+            request.area_type != "msoa"
+        )
+
+    @staticmethod
+    def get_path(request: Request, metric: str, codes) -> str:
+        # Query includes the partition and the type of query.
+        _, area_type = request.db_args
+        key = dumps([request.db_query, area_type, get_area_ids(codes)])
+        digest = blake2b(key, digest_size=16).hexdigest()
+
+        # Cells are stored per release so that they
+        # expire alongside the payloads of the release.
+        return f"{request.release}/fragments/{digest}/{metric}"
+
+    async def load(self, path: str) -> Union[list[FragmentRecord], None]:
+        async with self._semaphore:
+            try:
+                async with AsyncStorageClient(CACHE_CONTAINER, path) as client:
+                    data = loads(await (await client.download()).readall())
+            except ResourceNotFoundError:
+                return None
+
+        columns = tuple(data["columns"])
+
+        return [FragmentRecord(columns, row) for row in data["rows"]]
+
+    async def save(self, path: str, columns: list[str], rows: list[Any]):
+        kws = {
+            "container": CACHE_CONTAINER,
+            "path": path,
+            "compressed": False,
+            "content_type": "application/json"
+        }
+
+        data = dumps({"columns": columns, "rows": [tuple(row) for row in rows]})
+
+        async with self._semaphore:
+            try:
+                async with AsyncStorageClient(**kws) as client:
+                    await client.upload(data)
+                    # Cells are evicted by the garbage collector as payloads.
+                    await client.set_tags({"done": "1", "in_progress": "0"})
+            except Exception as err:
+                logger.exception(err)
+
+    def save_in_background(self, path: str, columns: list[str], rows: list[Any]):
+        task = ensure_future(self.save(path, columns, rows))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    async def fetch(self, conn, request: Request, codes) -> list[Any]:
+        """
+        Returns the records of ``request`` for a chunk of areas,
+        fetching only the cells that are not already stored.
+        """
+        if not self.is_applicable(request):
+            return await fetch_coalescer.fetch(conn, request, codes)
+
+        metrics, _ = request.db_args
+
+        # Records are assembled in the order in which
+        # metrics are requested.
+        metrics = sorted(metrics, key=lambda item: (
+            request.metric.index(item) if item in request.metric else len(request.metric)
+        ))
+        paths = {metric: self.get_path(request, metric, codes) for metric in metrics}
+        cells = dict(zip(metrics, await gather(*map(self.load, paths.values()))))
+
+        missing = [metric for metric, records in cells.items() if records is None]
+
+        if missing:
+            rows = await fetch_coalescer.fetch(conn, request, codes, metrics=missing)
+            columns = list(rows[0].keys()) if rows else list()
+
+            fetched = {metric: list() for metric in missing}
+            for row in rows:
+                fetched[row["metric"]].append(row)
+
+            cells.update(fetched)
+
+            if rows and await get_latest_timestamp(request) is not None:
+                for metric, records in fetched.items():
+                    if records:
+                        self.save_in_background(paths[metric], columns, records)
+
+        if len(missing) < len(metrics):
+            logger.info(dumps({
+                "fragmentStore": {
+                    "path": request.path,
+                    "hits": len(metrics) - len(missing),
+                    "misses": len(missing)
+                }
+            }).decode())
+
+        results = [record for metric in metrics for record in cells[metric]]
+
+        # Records are ordered by date - as they are by the DB.
+        results.sort(key=lambda record: record["date"], reverse=True)
+
+        return results
+
+
+fragment_store = FragmentStore()
@@ -0,0 +1,422 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from logging import getLogger
+from typing import Callable, Union
+from datetime import date, datetime, timedelta, timezone
+from asyncio import Semaphore, CancelledError, ensure_future, gather, sleep
+from dataclasses import dataclass, field
+from time import time
+import re
+
+# 3rd party:
+from orjson import dumps
+from azure.core.exceptions import (
+    HttpResponseError, ResourceExistsError, ResourceNotFoundError
+)
+
+# Internal:
+from app.config import Settings
+from app.storage import AsyncStorageClient, close_service_clients
+from app.utils.compression import ENCODING_EXTENSIONS
+from .constants import CACHE_CONTAINER, FRAGMENTS_SUFFIX
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'CacheEntryBlobs',
+    'CacheCollector',
+    'run_collection',
+    'start_collector',
+    'stop_collector'
+]
+
+
+logger = getLogger('app')
+
+RELEASE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+VARIANT_EXTENSIONS = tuple(f".{extension}" for extension in ENCODING_EXTENSIONS.values())
+
+# Directories of a release that hold auxiliary blobs rather than
+# payloads - removed with the release, but never evicted.
+AUXILIARY_DIRS = {"objects", "not_available"}
+
+FRAGMENTS_DIR = f"{FRAGMENTS_SUFFIX}/"
+
+# Collections are serialised across instances using a lease on this blob.
+LOCK_PATH = "_gc/lock"
+
+LEASE_DURATION = 60  # seconds
+
+_collector = None
+
+
+@dataclass
+class CacheEntryBlobs:
+    """
+    Blobs of a cached payload - the raw payload and its compressed
+    variants - which are retained or removed together.
+    """
+    path: str
+    release: date
+    names: list[str] = field(default_factory=list)
+    size: int = 0
+    last_accessed: Union[datetime, None] = None
+    alias: Union[str, None] = None
+    protected: bool = False
+    auxiliary: bool = False
+
+    def add(self, blob, is_variant: bool):
+        self.names.append(blob.name)
+        self.size += blob.size or 0
+
+        accessed = blob.last_accessed_on or blob.last_modified
+        if self.last_accessed is None or (accessed is not None and accessed > self.last_accessed):
+            self.last_accessed = accessed
+
+        if blob.lease is not None and blob.lease.status == "locked":
+            self.protected = True
+
+        if is_variant or self.auxiliary:
+            return
+
+        tags = blob.tags or dict()
+        self.alias = tags.get("alias")
+
+        # Payloads being generated are never removed.
+        if tags.get("in_progress", "1") != "0" or tags.get("done", "0") != "1":
+            self.protected = True
+
+
+def get_entry_path(name: str) -> tuple[str, bool]:
+    # Checkpointed fragments are removed with their payload.
+    if FRAGMENTS_DIR in name:
+        return name.split(FRAGMENTS_DIR, 1)[0], True
+
+    if name.endswith(VARIANT_EXTENSIONS):
+        return name.rsplit(".", 1)[0], True
+
+    return name, False
+
+
+class CacheCollector:
+    """
+    Removes the payloads of ``apiv2cache`` whose release is older than
+    the retention period, and evicts the least-recently-used payloads
+    until the container fits into the byte budget.
+
+    Payloads that are leased or in progress are never removed. Removing
+    a payload also removes the aliases whose content it holds, and the
+    content pointers leading to it.
+
+    Parameters
+    ----------
+    retention_days: int
+        Number of days for which the payloads of a release are retained,
+        relative to the latest release in the cache.
+
+    max_bytes: int
+        Byte budget of the container. Set to 0 for no budget.
+
+    dry_run: bool
+        Whether to report the blobs that would be removed without removing them.
+
+    on_remove: Callable[[str], None]
+        Called with the path of each payload once it is removed - e.g. to
+        drop it from the index of the worker.
+    """
+    def __init__(self, retention_days: int = Settings.gc_retention_days,
+                 max_bytes: int = Settings.gc_max_bytes, dry_run: bool = False,
+                 on_remove: Union[Callable[[str], None], None] = None):
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.dry_run = dry_run
+        self.on_remove = on_remove
+        self._semaphore = Semaphore(max(Settings.gc_concurrency, 1))
+        self.stats = {
+            "listed": 0,
+            "listedBytes": 0,
+            "expired": 0,
+            "evicted": 0,
+            "protected": 0,
+            "deleted": 0,
+            "deletedBytes": 0,
+            "failed": 0
+        }
+
+    async def list_entries(self) -> dict[str, CacheEntryBlobs]:
+        entries: dict[str, CacheEntryBlobs] = dict()
+
+        async with AsyncStorageClient(CACHE_CONTAINER, "") as client:
+            async for blob in client.list_blobs(include_tags=True):
+                release, _, rest = blob.name.partition("/")
+
+                # Reserved blobs - e.g. those of the pre-warmer.
+                if not RELEASE_PATTERN.match(release):
+                    continue
+
+                self.stats["listed"] += 1
+                self.stats["listedBytes"] += blob.size or 0
+
+                path, is_variant = get_entry_path(blob.name)
+
+                if (entry := entries.get(path)) is None:
+                    entry = entries[path] = CacheEntryBlobs(
+                        path=path,
+                        release=date.fromisoformat(release),
+                        auxiliary=rest.split("/", 1)[0] in AUXILIARY_DIRS
+                    )
+
+                entry.add(blob, is_variant)
+
+        return entries
+
+    def select(self, entries: dict[str, CacheEntryBlobs]) -> list[CacheEntryBlobs]:
+        """
+        Selects the entries to be removed.
+        """
+        if not entries:
+            return list()
+
+        aliases: dict[str, list[CacheEntryBlobs]] = dict()
+        for entry in entries.values():
+            if entry.alias is not None:
+                aliases.setdefault(entry.alias, list()).append(entry)
+
+        selected: dict[str, CacheEntryBlobs] = dict()
+
+        def remove(entry: CacheEntryBlobs) -> bool:
+            related = [entry, *aliases.get(entry.path, list())]
+
+            if any(item.protected for item in related):
+                self.stats["protected"] += 1
+                return False
+
+            for item in related:
+                selected[item.path] = item
+
+            return True
+
+        latest_release = max(entry.release for entry in entries.values())
+        cutoff = latest_release - timedelta(days=self.retention_days)
+
+        for entry in entries.values():
+            if entry.release < cutoff and entry.path not in selected and remove(entry):
+                self.stats["expired"] += 1
+
+        if not self.max_bytes:
+            return list(selected.values())
+
+        total = sum(entry.size for entry in entries.values() if entry.path not in selected)
+        earliest = datetime.min.replace(tzinfo=timezone.utc)
+
+        candidates = sorted(
+            (
+                entry for entry in entries.values()
+                if entry.path not in selected and not entry.auxiliary
+            ),
+            key=lambda item: item.last_accessed or earliest
+        )
+
+        for entry in candidates:
+            if total <= self.max_bytes:
+                break
+
+            if entry.path in selected or not remove(entry):
+                continue
+
+            self.stats["evicted"] += 1
+            total -= sum(
+                item.size
+                for item in [entry, *aliases.get(entry.path, list())]
+            )
+
+        return list(selected.values())
+
+    async def _delete(self, name: str) -> bool:
+        async with self._semaphore:
+            try:
+                async with AsyncStorageClient(CACHE_CONTAINER, name) as client:
+                    await client.delete()
+            except ResourceNotFoundError:
+                return True
+            except HttpResponseError as err:
+                # e.g. leased since the listing.
+                logger.warning(f"Failed to delete '{name}': {err.message}")
+                self.stats["failed"] += 1
+                return False
+
+        return True
+
+    async def _get_pointer_target(self, name: str) -> Union[str, None]:
+        async with self._semaphore:
+            try:
+                async with AsyncStorageClient(CACHE_CONTAINER, name) as client:
+                    return (await (await client.download()).readall()).decode()
+            except ResourceNotFoundError:
+                return None
+
+    async def select_pointers(self, entries: dict[str, CacheEntryBlobs],
+                              selected: list[CacheEntryBlobs]) -> list[CacheEntryBlobs]:
+        """
+        Selects the content pointers leading to removed payloads, which
+        would otherwise prevent the content from being registered again.
+        """
+        removed = {entry.path for entry in selected}
+        releases = {entry.release for entry in selected if not entry.auxiliary}
+
+        pointers = [
+            entry for entry in entries.values()
+            if (entry.auxiliary and entry.release in releases and
+                entry.path not in removed and "/objects/" in entry.path)
+        ]
+
+        targets = await gather(*(self._get_pointer_target(entry.path) for entry in pointers))
+
+        return [
+            pointer
+            for pointer, target in zip(pointers, targets)
+            if target in removed
+        ]
+
+    async def remove(self, entry: CacheEntryBlobs):
+        # The raw payload is removed first, as it determines
+        # whether the payload is considered to be cached.
+        raw, *variants = sorted(entry.names, key=lambda name: name != entry.path)
+
+        if self.dry_run:
+            logger.info(dumps({"cacheGC": {"wouldDelete": entry.names, "bytes": entry.size}}).decode())
+            return
+
+        if not await self._delete(raw):
+            return
+
+        # Other workers drop the entry once it expires.
+        if self.on_remove is not None:
+            self.on_remove(entry.path)
+
+        if not all(await gather(*map(self._delete, variants))):
+            return
+
+        self.stats["deleted"] += len(entry.names)
+        self.stats["deletedBytes"] += entry.size
+
+    async def collect(self) -> dict[str, Union[int, float]]:
+        start = time()
+        entries = await self.list_entries()
+        selected = self.select(entries)
+        selected.extend(await self.select_pointers(entries, selected))
+
+        batch_size = max(Settings.gc_batch_size, 1)
+        for index in range(0, len(selected), batch_size):
+            await gather(*map(self.remove, selected[index: index + batch_size]))
+
+        self.stats["durationMs"] = round((time() - start) * 1000, 2)
+        logger.info(dumps({"cacheGC": {**self.stats, "dryRun": self.dry_run}}).decode())
+
+        return self.stats
+
+
+async def renew_periodically(lock):
+    while True:
+        await sleep(LEASE_DURATION // 2)
+        await lock.renew()
+
+
+async def run_collection(**kwargs) -> Union[dict[str, Union[int, float]], None]:
+    """
+    Runs a collection, unless one is already running on another instance.
+
+    Parameters
+    ----------
+    kwargs
+        Arguments of ``CacheCollector``.
+    """
+    kws = {
+        "container": CACHE_CONTAINER,
+        "path": LOCK_PATH,
+        "compressed": False
+    }
+
+    async with AsyncStorageClient(**kws) as lock_client:
+        try:
+            await lock_client.upload(b"", overwrite=False)
+        except ResourceExistsError:
+            pass
+
+        lock = lock_client.lock_file(LEASE_DURATION)
+
+        try:
+            await lock.acquire()
+        except HttpResponseError:
+            logger.info("Cache collection is already running on another instance.")
+            return None
+
+        renewal = ensure_future(renew_periodically(lock))
+
+        try:
+            return await CacheCollector(**kwargs).collect()
+        finally:
+            renewal.cancel()
+            await lock.release()
+
+
+async def collect_periodically():
+    # Imported here, as the CLI runs without the engine.
+    from .cache_index import cache_index
+
+    while True:
+        await sleep(Settings.gc_interval)
+
+        try:
+            await run_collection(on_remove=cache_index.discard)
+        except CancelledError:
+            raise
+        except Exception as err:
+            logger.exception(err)
+
+
+def start_collector():
+    global _collector
+
+    if Settings.gc_enabled and _collector is None:
+        _collector = ensure_future(collect_periodically())
+
+
+def stop_collector():
+    global _collector
+
+    if _collector is not None:
+        _collector.cancel()
+        _collector = None
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from asyncio import run
+    from sys import stdout
+    import logging
+
+    parser = ArgumentParser(description="Garbage collection of the `apiv2cache` container.")
+    parser.add_argument("--dry-run", action="store_true", help="List the blobs without removing them.")
+    parser.add_argument("--retention-days", type=int, default=Settings.gc_retention_days)
+    parser.add_argument("--max-bytes", type=int, default=Settings.gc_max_bytes)
+    args = parser.parse_args()
+
+    logger.addHandler(logging.StreamHandler(stdout))
+    logger.setLevel(logging.INFO)
+
+    async def main():
+        try:
+            await run_collection(
+                retention_days=args.retention_days,
+                max_bytes=args.max_bytes,
+                dry_run=args.dry_run
+            )
+        finally:
+            await close_service_clients()
+
+    run(main())
@@ -0,0 +1,145 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from logging import getLogger
+from collections import Counter
+
+# 3rd party:
+from orjson import dumps, loads
+from azure.core.exceptions import ResourceExistsError
+
+# Internal:
+from app.config import Settings
+from app.storage import AsyncStorageClient
+from app.utils.operations import Request
+from .utils import CACHE_CONTAINER
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'RequestHistory',
+    'request_history',
+    'HISTORY_PATH'
+]
+
+
+logger = getLogger('app')
+
+# Scores of the download specs, shared by all instances.
+HISTORY_PATH = "_prewarm/history.json"
+
+# Specs whose score decays below the threshold are forgotten.
+MIN_SCORE = 0.5
+
+
+class RequestHistory:
+    """
+    Popularity of the download specs - i.e. requests, less the release.
+
+    Counts are accumulated in memory by each worker, and periodically
+    merged into a blob shared by all instances, whose update is
+    serialised using a lease.
+    """
+    _kws = {
+        "container": CACHE_CONTAINER,
+        "path": HISTORY_PATH,
+        "compressed": False,
+        "content_type": "application/json; charset=utf-8"
+    }
+
+    def __init__(self):
+        self._counts: Counter[str] = Counter()
+
+    @staticmethod
+    def get_spec(request: Request) -> str:
+        return dumps({
+            "areaType": request.area_type,
+            "areaCode": request.area_code,
+            "metric": request.metric,
+            "format": request.format
+        }).decode()
+
+    @staticmethod
+    def get_request(spec: str, release: str) -> Request:
+        spec = loads(spec)
+
+        return Request(
+            request=None,
+            area_type=spec["areaType"],
+            release=release,
+            format=spec["format"],
+            metric=spec["metric"],
+            area_code=spec["areaCode"],
+            method="GET",
+            url=None
+        )
+
+    def record(self, request: Request):
+        if not Settings.prewarm_enabled:
+            return
+
+        self._counts[self.get_spec(request)] += 1
+
+    async def _update(self, func) -> dict[str, float]:
+        async with AsyncStorageClient(**self._kws) as client:
+            try:
+                await client.upload(b"{}", overwrite=False)
+            except ResourceExistsError:
+                pass
+
+            async with client.lock_file(60):
+                scores = loads(await (await client.download()).readall())
+                scores = func(scores)
+                await client.upload(dumps(scores))
+
+        return scores
+
+    async def flush(self):
+        """
+        Merges the counts of the worker into the shared history.
+        """
+        if not self._counts:
+            return
+
+        counts, self._counts = self._counts, Counter()
+
+        def merge(scores: dict[str, float]) -> dict[str, float]:
+            for spec, count in counts.items():
+                scores[spec] = scores.get(spec, 0) + count
+
+            return scores
+
+        try:
+            await self._update(merge)
+        except Exception as err:
+            logger.exception(err)
+            # Retained for the next flush.
+            self._counts.update(counts)
+
+    async def get_top(self, n: int) -> list[str]:
+        """
+        Returns the ``n`` most popular specs.
+        """
+        async with AsyncStorageClient(**self._kws) as client:
+            if not await client.exists():
+                return list()
+
+            scores = loads(await (await client.download()).readall())
+
+        return sorted(scores, key=scores.get, reverse=True)[:n]
+
+    async def decay(self):
+        """
+        Decays all the scores so that the history favours the
+        recent releases - applied once per release.
+        """
+        await self._update(lambda scores: {
+            spec: decayed
+            for spec, score in scores.items()
+            if (decayed := score * Settings.prewarm_history_decay) >= MIN_SCORE
+        })
+
+
+request_history = RequestHistory()
@@ -0,0 +1,162 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from logging import getLogger
+from typing import Union
+from collections import OrderedDict
+from datetime import datetime
+
+# 3rd party:
+from azure.core.exceptions import ResourceNotFoundError
+
+# Internal:
+from app.config import Settings
+from app.storage import AsyncStorageClient
+from app.utils.operations import Request
+from app.utils.assets import get_latest_timestamp
+from .utils import CACHE_CONTAINER
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'NegativeCache',
+    'negative_cache'
+]
+
+
+logger = getLogger('app')
+
+
+class NegativeCache:
+    """
+    Requests known to yield no data, so that they can be rejected
+    without querying the DB.
+
+    Entries are scoped to the timestamp of the release, and are
+    therefore invalidated once the release is (re-)published. Requests
+    for releases that are yet to be published are never recorded.
+
+    Entries are held in memory - least-recently-used entries are
+    evicted beyond ``max_size`` - and are optionally persisted as
+    blobs, so that they are shared by all instances. Persisted entries
+    are checked separately, once the payload is known not to be cached,
+    so that requests with data do not pay for the additional call.
+
+    Parameters
+    ----------
+    max_size: int
+        Maximum number of entries held in memory. Set to 0 to disable.
+
+    persist: bool
+        Whether to persist the entries in the storage.
+    """
+    def __init__(self, max_size: int = Settings.negative_cache_size,
+                 persist: bool = Settings.negative_cache_persist):
+        self.max_size = max_size
+        self.persist = persist
+        self._entries: OrderedDict[str, str] = OrderedDict()
+
+    @staticmethod
+    def get_marker_path(request: Request) -> str:
+        # Markers are stored per release so that they
+        # expire alongside the payloads of the release.
+        _, path = request.path.split("/", 1)
+        return f"{request.release}/not_available/{path}"
+
+    @staticmethod
+    async def get_release_key(request: Request) -> Union[str, None]:
+        timestamp: Union[datetime, None] = await get_latest_timestamp(request)
+
+        if timestamp is None:
+            return None
+
+        return timestamp.isoformat()
+
+    async def contains(self, request: Request) -> bool:
+        """
+        Whether the request is known to this worker to yield no data.
+        """
+        if not self.max_size:
+            return False
+
+        if (release_key := await self.get_release_key(request)) is None:
+            return False
+
+        if self._entries.get(request.path) != release_key:
+            return False
+
+        self._entries.move_to_end(request.path)
+
+        return True
+
+    async def contains_persisted(self, request: Request) -> bool:
+        """
+        Whether the request has been recorded by any instance
+        to yield no data.
+        """
+        if not self.max_size or not self.persist:
+            return False
+
+        if (release_key := await self.get_release_key(request)) is None:
+            return False
+
+        if not await self._is_persisted(request, release_key):
+            return False
+
+        self._remember(request.path, release_key)
+
+        return True
+
+    async def add(self, request: Request):
+        if not self.max_size:
+            return
+
+        if (release_key := await self.get_release_key(request)) is None:
+            return
+
+        # Already recorded - e.g. found to be persisted.
+        if self._entries.get(request.path) == release_key:
+            return
+
+        self._remember(request.path, release_key)
+
+        if not self.persist:
+            return
+
+        kws = {
+            "container": CACHE_CONTAINER,
+            "path": self.get_marker_path(request),
+            "compressed": False,
+            "content_type": "text/plain; charset=utf-8"
+        }
+
+        try:
+            async with AsyncStorageClient(**kws) as client:
+                await client.upload(release_key.encode())
+                await client.set_tags({"not_available": "1"})
+        except Exception as err:
+            logger.exception(err)
+
+    def _remember(self, path: str, release_key: str):
+        self._entries[path] = release_key
+        self._entries.move_to_end(path)
+
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def _is_persisted(self, request: Request, release_key: str) -> bool:
+        try:
+            async with AsyncStorageClient(CACHE_CONTAINER, self.get_marker_path(request)) as client:
+                content = await (await client.download()).readall()
+        except ResourceNotFoundError:
+            return False
+        except Exception as err:
+            logger.exception(err)
+            return False
+
+        return content.decode() == release_key
+
+
+negative_cache = NegativeCache()
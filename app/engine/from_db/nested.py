@@ -12,6 +12,7 @@ from pandas import DataFrame, json_normalize
 # Internal:
 from app.utils.operations import Request
 from app.utils.assets import MetricData
+from .utils import TABULAR_FORMATS
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -22,7 +23,7 @@ def process_nested_data(results: Iterable[Record], request: Request) -> DataFram
         "areaCode", "areaType", "areaName", "date", "metric",
     ]
 
-    if request.format == "csv":
+    if request.format in TABULAR_FORMATS:
         df = json_normalize(
             map(dict, results),
             nested_metric_name,
@@ -0,0 +1,196 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from logging import getLogger
+from asyncio import (
+    Semaphore, CancelledError, ensure_future, gather, sleep
+)
+from time import time
+
+# 3rd party:
+from orjson import dumps
+from azure.core.exceptions import ResourceExistsError, HttpResponseError
+
+# Internal:
+from app.config import Settings
+from app.exceptions import NotAvailable, APIException
+from app.storage import AsyncStorageClient
+from app.utils.assets import get_latest_timestamp
+from .utils import CACHE_CONTAINER, get_latest_release
+from .history import request_history
+from .base import ensure_cache_entry
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'start_prewarmer',
+    'stop_prewarmer',
+    'prewarm_release'
+]
+
+
+logger = getLogger('app')
+
+# Markers of the releases for which the pre-warming has been
+# claimed - tagged with ``done`` once it has completed.
+MARKER_PREFIX = "_prewarm/releases"
+
+LEASE_DURATION = 60  # seconds
+
+_watcher = None
+
+
+async def renew_periodically(lock):
+    while True:
+        await sleep(LEASE_DURATION // 2)
+        await lock.renew()
+
+
+class PrewarmProgress:
+    def __init__(self, release: str, total: int):
+        self.release = release
+        self.total = total
+        self.completed = 0
+        self.failed = 0
+        self.not_available = 0
+        self._start = time()
+
+    def report(self, status: str = "running"):
+        logger.info(dumps({
+            "prewarm": {
+                "release": self.release,
+                "status": status,
+                "total": self.total,
+                "completed": self.completed,
+                "failed": self.failed,
+                "notAvailable": self.not_available,
+                "durationMs": round((time() - self._start) * 1000, 2)
+            }
+        }).decode())
+
+
+async def prewarm_release(release: str) -> bool:
+    """
+    Generates the cache for the most popular download specs of the
+    ``release`` ahead of demand, unless it has already been done - or
+    is being done - by another instance.
+
+    Returns
+    -------
+    bool
+        Whether the release has been dealt with. ``False`` if the
+        release is yet to be published in the DB.
+    """
+    kws = {
+        "container": CACHE_CONTAINER,
+        "path": f"{MARKER_PREFIX}/{release}",
+        "compressed": False
+    }
+
+    async with AsyncStorageClient(**kws) as marker:
+        try:
+            await marker.upload(b"", overwrite=False)
+        except ResourceExistsError:
+            pass
+
+        if (await marker.get_tags()).get("done") == "1":
+            return True
+
+        lock = marker.lock_file(LEASE_DURATION)
+
+        try:
+            await lock.acquire()
+        except HttpResponseError:
+            # Being pre-warmed by another instance.
+            return True
+
+        renewal = ensure_future(renew_periodically(lock))
+
+        try:
+            specs = await request_history.get_top(Settings.prewarm_top_n)
+            requests = list()
+
+            for spec in specs:
+                try:
+                    requests.append(request_history.get_request(spec, release))
+                except APIException as err:
+                    logger.warning(f"Skipped pre-warming of {spec}: {err.message}")
+
+            if requests and await get_latest_timestamp(requests[0]) is None:
+                return False
+
+            await prewarm(release, requests)
+            await marker.set_tags({"done": "1"})
+            await request_history.decay()
+        finally:
+            renewal.cancel()
+            await lock.release()
+
+    return True
+
+
+async def prewarm(release: str, requests: list):
+    progress = PrewarmProgress(release, len(requests))
+    semaphore = Semaphore(max(Settings.prewarm_concurrency, 1))
+
+    progress.report("started")
+
+    async def warm(request):
+        async with semaphore:
+            try:
+                await ensure_cache_entry(request)
+                progress.completed += 1
+            except NotAvailable:
+                progress.not_available += 1
+            except Exception as err:
+                logger.exception(err)
+                progress.failed += 1
+
+            progress.report()
+
+    await gather(*map(warm, requests))
+
+    progress.report("complete")
+
+
+async def watch_releases():
+    last_release = None
+    last_flush = time()
+
+    while True:
+        await sleep(Settings.prewarm_poll_interval)
+
+        try:
+            if time() - last_flush >= Settings.prewarm_history_interval:
+                await request_history.flush()
+                last_flush = time()
+
+            release = await get_latest_release()
+
+            if release is not None and release != last_release:
+                if await prewarm_release(release):
+                    last_release = release
+
+        except CancelledError:
+            raise
+        except Exception as err:
+            logger.exception(err)
+
+
+def start_prewarmer():
+    global _watcher
+
+    if Settings.prewarm_enabled and _watcher is None:
+        _watcher = ensure_future(watch_releases())
+
+
+async def stop_prewarmer():
+    global _watcher
+
+    if _watcher is not None:
+        _watcher.cancel()
+        _watcher = None
+
+    await request_history.flush()
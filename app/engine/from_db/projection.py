@@ -0,0 +1,238 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from logging import getLogger
+from typing import Union, NamedTuple
+from codecs import getincrementaldecoder
+from json import JSONDecoder
+from asyncio import to_thread
+from io import StringIO
+import csv
+
+# 3rd party:
+from orjson import dumps, loads
+
+# Internal:
+from app.storage import AsyncStorageClient
+from app.utils.operations import Request
+from .utils import CACHE_CONTAINER
+from .cache_index import cache_index
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'Superset',
+    'find_superset',
+    'project_payload',
+    'PayloadProjector'
+]
+
+
+logger = getLogger('app')
+
+PROJECTABLE_FORMATS = {"csv", "jsonl", "json", "xml"}
+
+
+class Superset(NamedTuple):
+    path: str
+    metrics: set[str]
+
+
+async def find_superset(request: Request) -> Union[Superset, None]:
+    """
+    Finds the smallest complete payload in the cache for the same release,
+    area type, area code, and format, whose metrics are a strict superset
+    of those of ``request``.
+
+    Payloads are looked up in the index of their metrics, which lists
+    the storage only when the release is first looked up.
+    """
+    if request.format not in PROJECTABLE_FORMATS or request.nested_metrics:
+        return None
+
+    await cache_index.load(str(request.release))
+
+    supersets = cache_index.get_supersets(request.path, request.metric)
+
+    if not supersets:
+        return None
+
+    path, metrics = min(supersets, key=lambda item: len(item[1]))
+
+    return Superset(path=path, metrics=set(metrics))
+
+
+class PayloadProjector:
+    """
+    Incrementally removes the ``excluded`` metrics from a cached payload,
+    along with the records in which none of the ``included`` metrics has
+    a value.
+
+    The output of ``feed`` is formatted as per ``format_response``, and
+    may therefore be passed to ``cache_response`` as it is.
+
+    Parameters
+    ----------
+    format: str
+        Payload format - one of ``PROJECTABLE_FORMATS``.
+
+    included: set[str]
+        Requested metrics.
+
+    excluded: set[str]
+        Metrics of the payload that are not requested.
+    """
+    def __init__(self, format: str, included: set[str], excluded: set[str]):
+        self._format = format
+        self._included = included
+        self._excluded = excluded
+        self._decoder = getincrementaldecoder("utf-8")()
+        self._buffer = str()
+
+        # CSV
+        self._columns: Union[list[int], None] = None
+        self._metric_columns: list[int] = list()
+
+        # JSON
+        self._json_decoder = JSONDecoder()
+        self._body_started = False
+
+    def feed(self, data: bytes) -> bytes:
+        self._buffer += self._decoder.decode(data)
+
+        if self._format == "csv":
+            return self._project_csv()
+        elif self._format == "jsonl":
+            return self._project_jsonl()
+
+        return self._project_json()
+
+    def close(self) -> bytes:
+        output = self.feed(b"")
+        remainder = self._buffer.strip()
+
+        if self._format in ["json", "xml"]:
+            if remainder != "]}":
+                raise ValueError("Incomplete payload.")
+
+            return output
+
+        if remainder:
+            # Final line without a trailing line break.
+            self._buffer += "\n"
+            output += self.feed(b"")
+
+        return output
+
+    def _pop_lines(self) -> list[str]:
+        *lines, self._buffer = self._buffer.split("\n")
+        return lines
+
+    def _has_values(self, record: dict) -> bool:
+        return any(
+            record.get(metric) is not None
+            for metric in self._included
+        )
+
+    def _project_csv(self) -> bytes:
+        lines = self._pop_lines()
+        if not lines:
+            return b""
+
+        output = StringIO()
+        writer = csv.writer(output, lineterminator="\n")
+
+        for row in csv.reader(lines):
+            if self._columns is None:
+                self._columns = [
+                    index for index, column in enumerate(row)
+                    if column not in self._excluded
+                ]
+                self._metric_columns = [
+                    index for index, column in enumerate(row)
+                    if column in self._included
+                ]
+            elif not any(row[index] for index in self._metric_columns):
+                continue
+
+            writer.writerow([row[index] for index in self._columns])
+
+        return output.getvalue().encode()
+
+    def _project_record(self, record: dict) -> Union[bytes, None]:
+        if not self._has_values(record):
+            return None
+
+        return dumps({
+            key: value
+            for key, value in record.items()
+            if key not in self._excluded
+        })
+
+    def _project_jsonl(self) -> bytes:
+        output = list()
+
+        for line in self._pop_lines():
+            if line and (record := self._project_record(loads(line))) is not None:
+                output.append(record + b"\n")
+
+        return bytes.join(b"", output)
+
+    def _project_json(self) -> bytes:
+        buffer = self._buffer
+        position = 0
+
+        if not self._body_started:
+            if (position := buffer.find("[")) < 0:
+                return b""
+
+            position += 1
+            self._body_started = True
+
+        output = list()
+
+        while True:
+            # Skip the delimiters.
+            while position < len(buffer) and buffer[position] in ", \n":
+                position += 1
+
+            if position >= len(buffer) or buffer[position] != "{":
+                break
+
+            try:
+                record, end = self._json_decoder.raw_decode(buffer, position)
+            except ValueError:
+                # Incomplete record - awaiting more data.
+                break
+
+            position = end
+
+            if (projected := self._project_record(record)) is not None:
+                output.append(projected)
+
+        self._buffer = buffer[position:]
+
+        return bytes.join(b",", output)
+
+
+async def project_payload(*, request: Request, superset: Superset):
+    """
+    Produces the payload of ``request`` from that of ``superset``,
+    yielding the chunks in the same form as ``process_get_request``.
+    """
+    requested = set(request.metric)
+    projector = PayloadProjector(request.format, requested, superset.metrics - requested)
+    index = 0
+
+    logger.info(dumps({"projectedFrom": superset.path, "cachePath": request.path}).decode())
+
+    async with AsyncStorageClient(CACHE_CONTAINER, superset.path) as client:
+        async for chunk in client.download_chunks():
+            if item := await to_thread(projector.feed, chunk):
+                yield index, item
+                index += 1
+
+    if item := await to_thread(projector.close):
+        yield index, item
@@ -0,0 +1,252 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from logging import getLogger
+from typing import Union, Any
+from asyncio import Lock, get_running_loop, wait_for, shield, TimeoutError as AsyncTimeoutError
+from concurrent.futures import ThreadPoolExecutor
+from fcntl import flock, LOCK_EX, LOCK_NB, LOCK_UN
+from hashlib import blake2b
+from time import time
+import os
+
+# 3rd party:
+from orjson import dumps, loads, JSONDecodeError
+
+# Internal:
+from app.config import Settings
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'SingleFlight'
+]
+
+
+logger = getLogger('app')
+
+# Blocking `flock` calls are made in a dedicated pool so
+# that they cannot starve the default executor.
+_lock_executor = ThreadPoolExecutor(
+    max_workers=Settings.single_flight_max_waiters,
+    thread_name_prefix="single_flight"
+)
+
+
+def _open_and_lock(filename: str) -> int:
+    fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0o600)
+
+    try:
+        flock(fd, LOCK_EX)
+    except BaseException:
+        os.close(fd)
+        raise
+
+    return fd
+
+
+def _unlock_and_close(fd: int):
+    try:
+        flock(fd, LOCK_UN)
+    finally:
+        os.close(fd)
+
+
+def _release_abandoned(future):
+    # The lock was acquired after the waiter gave up.
+    if not future.cancelled() and future.exception() is None:
+        _unlock_and_close(future.result())
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent generations of the same payload on a host.
+    Flights are only to be entered once the payload is known not to be
+    cached, as they serialise all requests for the payload.
+
+    Coroutines within a worker queue on an ``asyncio.Lock``, and workers
+    on the same host queue on an exclusive ``flock`` of a lock file. The
+    kernel releases the lock the moment the generation finishes - or the
+    worker dies - at which point the next waiter is woken up.
+
+    The leader may record the outcome using ``complete``, which the
+    waiters of the flight receive as ``result``, and may use instead of
+    querying the storage. The lock file is removed once the flight is
+    over - whilst still locked, so that it cannot be locked by a new
+    arrival in the meantime. Waiters that acquire a removed file read
+    the outcome from it, or otherwise queue on the new file.
+
+    Parameters
+    ----------
+    key: str
+        Identifier of the payload - e.g. ``Request.path``.
+
+    timeout: float
+        Maximum time (in seconds) to wait for the lock. Once elapsed,
+        the context is entered without the lock and ``acquired`` is
+        set to ``False``.
+    """
+    _locks: dict[str, list[Union[Lock, int, dict[str, Any], None]]] = dict()
+
+    def __init__(self, key: str, timeout: float = Settings.single_flight_timeout):
+        self.key = key
+        self.acquired = False
+        self.result: Union[dict[str, Any], None] = None
+
+        self._timeout = timeout
+        self._fd: Union[int, None] = None
+        self._lock: Union[Lock, None] = None
+        self._local_acquired = False
+        self._outcome: Union[dict[str, Any], None] = None
+
+        digest = blake2b(key.encode(), digest_size=16).hexdigest()
+        self._filename = os.path.join(Settings.single_flight_dir, f"{digest}.lock")
+
+    async def __aenter__(self) -> 'SingleFlight':
+        # [lock, number of coroutines, outcome of the flight]
+        entry = self._locks.setdefault(self.key, [Lock(), 0, None])
+        entry[1] += 1
+        self._lock = entry[0]
+
+        start = time()
+
+        try:
+            await wait_for(self._lock.acquire(), timeout=self._timeout)
+            self._local_acquired = True
+
+            # Outcome of a flight led by this worker.
+            if (result := entry[2]) is not None:
+                self.acquired = True
+                self.result = result
+                return self
+
+            self._fd = await self._acquire_file_lock(self._timeout - (time() - start))
+        except AsyncTimeoutError:
+            logger.warning(dumps({"singleFlightTimeout": self.key}).decode())
+            return self
+        except BaseException:
+            await self.__aexit__(None, None, None)
+            raise
+
+        self.acquired = True
+
+        if self.result is None:
+            self.result = self._read_result(self._fd)
+
+        # Shared with the coroutines queued behind this one.
+        entry[2] = self.result
+
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        entry = self._locks[self.key]
+
+        try:
+            if exc_type is None and self._outcome is not None:
+                entry[2] = self._outcome
+
+            if self._fd is not None:
+                if exc_type is None and self._outcome is not None:
+                    self._write_result(self._outcome)
+
+                # Removed whilst locked - see the docstring.
+                self._remove_lock_file()
+                _unlock_and_close(self._fd)
+                self._fd = None
+        finally:
+            if self._local_acquired:
+                self._lock.release()
+
+            entry[1] -= 1
+
+            if not entry[1]:
+                self._locks.pop(self.key, None)
+
+    def complete(self, outcome: dict[str, Any]):
+        self._outcome = outcome
+
+    def _is_current(self, fd: int) -> bool:
+        # Whether the lock file is still in place, rather
+        # than removed by the previous holder.
+        try:
+            file_stat, path_stat = os.fstat(fd), os.stat(self._filename)
+        except FileNotFoundError:
+            return False
+
+        return (file_stat.st_dev, file_stat.st_ino) == (path_stat.st_dev, path_stat.st_ino)
+
+    def _remove_lock_file(self):
+        try:
+            os.unlink(self._filename)
+        except FileNotFoundError:
+            pass
+        except OSError as err:
+            logger.warning(f"Failed to remove single flight lock file: {err}")
+
+    async def _acquire_file_lock(self, timeout: float) -> Union[int, None]:
+        deadline = time() + timeout
+
+        while (fd := await self._lock_file(deadline - time())) is not None:
+            if self._is_current(fd):
+                return fd
+
+            # The flight is over - its outcome, if any, is in the removed file.
+            self.result = self._read_result(fd)
+            _unlock_and_close(fd)
+
+            if self.result is not None:
+                return None
+
+        return None
+
+    async def _lock_file(self, timeout: float) -> Union[int, None]:
+        try:
+            os.makedirs(Settings.single_flight_dir, exist_ok=True)
+            fd = os.open(self._filename, os.O_RDWR | os.O_CREAT, 0o600)
+        except OSError as err:
+            # Coalescing is limited to the current worker.
+            logger.warning(f"Single flight lock file unavailable: {err}")
+            return None
+
+        # Fast path - no other worker is generating the payload.
+        try:
+            flock(fd, LOCK_EX | LOCK_NB)
+            return fd
+        except BlockingIOError:
+            os.close(fd)
+
+        loop = get_running_loop()
+        future = loop.run_in_executor(_lock_executor, _open_and_lock, self._filename)
+
+        try:
+            return await wait_for(shield(future), timeout=max(timeout, 0))
+        except BaseException:
+            future.add_done_callback(_release_abandoned)
+            raise
+
+    @staticmethod
+    def _read_result(fd: Union[int, None]) -> Union[dict[str, Any], None]:
+        if fd is None:
+            return None
+
+        try:
+            data = os.pread(fd, 4096, 0)
+            content = loads(data) if data else None
+
+            if content is None or time() - content["timestamp"] > Settings.single_flight_ttl:
+                return None
+
+            return content["outcome"]
+        except (OSError, JSONDecodeError, KeyError, TypeError):
+            return None
+
+    def _write_result(self, outcome: dict[str, Any]):
+        content = dumps({"timestamp": time(), "outcome": outcome})
+
+        try:
+            os.ftruncate(self._fd, 0)
+            os.pwrite(self._fd, content, 0)
+        except OSError as err:
+            logger.warning(f"Failed to record single flight outcome: {err}")
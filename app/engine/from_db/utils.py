@@ -3,19 +3,27 @@
 # Imports
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Python:
-from typing import Dict, Iterable
-from tempfile import NamedTemporaryFile
-from asyncio import Lock
+from typing import Dict, Iterable, Union, NamedTuple
+from contextlib import AsyncExitStack
+from hashlib import blake2b
+from io import BytesIO
+from logging import getLogger
 
 # 3rd party:
-from pandas import DataFrame
+from pandas import DataFrame, to_datetime
 from orjson import dumps, loads
+import pyarrow as pa
+from pyarrow import parquet as pq
+from azure.core.exceptions import ResourceExistsError
 
 # Internal:
+from app.config import Settings
 from app.exceptions import NotAvailable
-from app.storage import AsyncStorageClient
+from app.storage import AsyncStorageClient, local_cache
 from app.utils.operations import Request
 from app.utils.assets import MetricData
+from app.utils.compression import CompressionStage
+from .constants import CACHE_CONTAINER
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -23,13 +31,164 @@ __all__ = [
     'format_dtypes',
     'format_data',
     'format_response',
-    'cache_response'
+    'cache_response',
+    'get_framing',
+    'get_cache_settings',
+    'get_response_columns',
+    'ParquetEncoder',
+    'CacheEntry',
+    'get_encodings',
+    'get_size',
+    'get_cache_entry',
+    'get_latest_release',
+    'TABULAR_FORMATS'
 ]
 
 
-async def cache_response(func, *, request: Request, **kwargs) -> bool:
+logger = getLogger('app')
+
+
+# Formats whose payload is a flat table - nested
+# metrics are normalised into columns.
+TABULAR_FORMATS = {"csv", "arrow", "parquet"}
+
+# End-of-stream marker for Arrow IPC streams.
+ARROW_EOS = b"\xff\xff\xff\xff\x00\x00\x00\x00"
+
+ARROW_TYPES = {
+    int: pa.int64(),
+    float: pa.float64(),
+    str: pa.string()
+}
+
+# Fields of nested metrics that contain labels rather than values.
+NESTED_LABEL_FIELDS = {"age", "variant"}
+
+
+def get_framing(request: Request) -> tuple[bytes, bytes, bytes]:
+    """
+    Prefix, suffix, and delimiter with which the
+    formatted chunks are assembled into a payload.
+    """
+    prefix, suffix, delimiter = b"", b"", b""
+
+    if request.format in ['json', 'xml']:
+        prefix, suffix, delimiter = b'{"body":[', b']}', b','
+    elif request.format == 'arrow':
+        suffix = ARROW_EOS
+
+    return prefix, suffix, delimiter
+
+
+class CacheEntry(NamedTuple):
+    """
+    Location of a cached payload.
+
+    ``path`` differs from ``Request.path`` when the request is an
+    alias of a payload with identical content. ``size`` and ``etag``
+    of the raw payload are only known to the process that cached it.
+    """
+    path: str
+    encodings: list[str]
+    size: Union[int, None] = None
+    etag: Union[str, None] = None
+
+
+def get_encodings(tags: dict[str, str]) -> list[str]:
+    # Payloads cached before the introduction of
+    # compressed variants have no `encodings` tag.
+    return list(filter(None, tags.get("encodings", "").split(":")))
+
+
+def get_size(tags: dict[str, str]) -> Union[int, None]:
+    # Size of the raw payload - also that of the target of an alias.
+    if (size := tags.get("size")) is None:
+        return None
+
+    return int(size)
+
+
+def get_cache_entry(request: Request, tags: dict[str, str]) -> CacheEntry:
+    return CacheEntry(
+        path=tags.get("alias", request.path),
+        encodings=get_encodings(tags),
+        size=get_size(tags)
+    )
+
+
+async def get_latest_release() -> Union[str, None]:
+    kws = Settings.latest_published_timestamp
+
+    async with AsyncStorageClient(kws["container"], kws["path"], compressed=False) as client:
+        timestamp = await (await client.download()).readall()
+
+    # e.g. "2021-03-09T15:46:12.5473621Z"
+    return timestamp.decode().strip()[:10] or None
+
+
+def get_object_path(request: Request, digest: str) -> str:
+    # Objects are stored per release so that they
+    # expire alongside the payloads of the release.
+    return f"{request.release}/objects/{digest}"
+
+
+async def find_duplicate(request: Request, digest: str, encodings: list[str]) -> Union[str, None]:
+    """
+    Returns the path of a complete payload whose content - including its
+    content settings - is identical to that with the given ``digest``,
+    or ``None`` if there is no such payload.
+    """
+    try:
+        async with AsyncStorageClient(CACHE_CONTAINER, get_object_path(request, digest)) as pointer:
+            if not await pointer.exists():
+                return None
+
+            target = (await (await pointer.download()).readall()).decode()
+
+        if target == request.path:
+            return None
+
+        async with AsyncStorageClient(CACHE_CONTAINER, target) as target_client:
+            if not await target_client.exists():
+                return None
+
+            tags = await target_client.get_tags()
+    except Exception as err:
+        logger.exception(err)
+        return None
+
+    # Aliases must be served with the same set of variants.
+    if (tags.get("done") != "1" or "alias" in tags or
+            set(get_encodings(tags)) != set(encodings)):
+        return None
+
+    return target
+
+
+async def register_content(request: Request, digest: str):
+    """
+    Records ``Request.path`` as the location of the content
+    with the given ``digest``, unless one already exists.
+    """
     kws = {
-        "container": "apiv2cache",
+        "container": CACHE_CONTAINER,
+        "path": get_object_path(request, digest),
+        "compressed": False,
+        "content_type": "text/plain; charset=utf-8"
+    }
+
+    try:
+        async with AsyncStorageClient(**kws) as pointer:
+            await pointer.upload(request.path.encode(), overwrite=False)
+    except ResourceExistsError:
+        pass
+    except Exception as err:
+        logger.exception(err)
+
+
+def get_cache_settings(request: Request) -> dict:
+    return {
+        "container": CACHE_CONTAINER,
         "path": request.path,
         "compressed": False,
         "cache_control": "max-age=90, s-maxage=300",
@@ -40,69 +199,184 @@ async def cache_response(func, *, request: Request, **kwargs) -> bool:
 
     }
 
-    prefix, suffix, delimiter = b"", b"", b""
 
-    if request.format in ['json', 'xml']:
-        prefix, suffix, delimiter = b'{"body":[', b']}', b','
+async def cache_response(func, *, request: Request, **kwargs) -> CacheEntry:
+    """
+    Caches the chunks produced by ``func`` as they arrive.
+
+    The chunks must be produced in order - as they are by
+    ``process_get_request``. The payload, and its compressed
+    variants, are uploaded in blocks whose IDs determine their
+    order in the committed blob.
+
+    Payloads are content-addressed: if an identical payload has
+    already been cached under a different path, the staged blocks
+    are discarded and the blob becomes an alias of the existing
+    payload, identified by its ``alias`` tag.
+    """
+    kws = get_cache_settings(request)
+
+    # Content settings are a part of the content, as they
+    # are served alongside the payload.
+    hasher = blake2b(digest_size=16)
+    hasher.update(dumps({key: value for key, value in kws.items() if key != "path"}))
+
+    prefix, suffix, delimiter = get_framing(request)
+
+    # Compressed variants are produced alongside the
+    # payload as it is being written.
+    encodings = request.cache_encodings
+    compressors = {
+        encoding: CompressionStage(encoding, Settings.cache_compression_level, label=request.get_path(encoding))
+        for encoding in encodings
+    }
+
+    # The payload and its variants are also written into the
+    # host-local cache tier, keyed by encoding (`None` for raw).
+    local_writers = dict()
+    writers = dict()
+    n_items = 0
+    etag = None
+
+    async def drop_local_writers(err: OSError):
+        # The local tier is best-effort - e.g. it may run out of space.
+        # Its writers are dropped together, as the raw payload must
+        # only be committed alongside complete variants.
+        logger.warning(f"Failed to write '{request.path}' to the local cache: {err}")
+
+        while local_writers:
+            await local_writers.popitem()[1].abort()
 
-    current_location = 0
+    async def write_variant(encoding: Union[str, None], data: bytes):
+        if (local_writer := local_writers.get(encoding)) is not None:
+            try:
+                await local_writer.write(data)
+            except OSError as err:
+                await drop_local_writers(err)
+
+        await writers[encoding].write(data)
+
+    async def write(data: bytes):
+        hasher.update(data)
+        await write_variant(None, data)
+
+        for encoding, compressor in compressors.items():
+            await write_variant(encoding, await compressor.compress(data))
+
+    async with AsyncExitStack() as stack:
+        blob_client = await stack.enter_async_context(AsyncStorageClient(**kws))
 
-    async with AsyncStorageClient(**kws) as blob_client:
         try:
             # Create an empty blob
             await blob_client.upload(b"")
             await blob_client.set_tags({"done": "0", "in_progress": "1"})
 
-            with NamedTemporaryFile() as fp:
-                async with blob_client.lock_file(60) as blob_lock:
-                    async for index, item in func(request=request, **kwargs):
-                        async with Lock():
-                            if not (index and current_location):
-                                fp.write(prefix)
-                                fp.write(item)
+            for encoding in [*encodings, None]:
+                if (local_writer := await local_cache.writer(request.get_path(encoding))) is not None:
+                    local_writers[encoding] = local_writer
+
+            async with blob_client.lock_file(60) as blob_lock:
+                writers[None] = blob_client.block_writer()
+
+                for encoding in encodings:
+                    variant_kws = {
+                        **kws,
+                        "path": request.get_path(encoding),
+                        "content_encoding": encoding
+                    }
+                    variant_client = await stack.enter_async_context(AsyncStorageClient(**variant_kws))
+                    writers[encoding] = variant_client.block_writer()
+
+                async for index, item in func(request=request, **kwargs):
+                    if not n_items:
+                        await write(prefix + item)
+                    elif item:
+                        await write(delimiter + item)
+
+                    n_items += 1
+
+                    # Renew the lease by after each
+                    # iteration as some processes may
+                    # take longer.
+                    await blob_lock.renew()
+
+                # Responses without any data won't be cached.
+                if not n_items:
+                    raise NotAvailable()
+
+                await write(suffix)
+
+                for encoding, compressor in compressors.items():
+                    await write_variant(encoding, await compressor.flush())
+                    compressor.report()
+
+                digest = hasher.hexdigest()
+                target = await find_duplicate(request, digest, encodings)
+
+                tags = request.metric_tag
+                tags["done"] = "1"
+                tags["in_progress"] = "0"
+                tags["size"] = str(writers[None].size)
 
-                            elif not index and current_location:
-                                fp.seek(0)
-                                tmp = item + fp.read()
-                                fp.seek(0)
-                                fp.truncate(0)
-                                fp.write(tmp)
+                if encodings:
+                    tags["encodings"] = str.join(":", encodings)
 
-                            elif item:
-                                fp.write(delimiter)
-                                fp.write(item)
+                if target is None:
+                    for encoding in encodings:
+                        await writers[encoding].commit()
 
-                            current_location = fp.tell()
+                    committed = await writers[None].commit()
+                    etag = (committed or dict()).get("etag")
+                else:
+                    # Staged blocks are removed, as the payload is never committed.
+                    for writer in writers.values():
+                        await writer.discard()
 
-                        # Renew the lease by after each
-                        # iteration as some processes may
-                        # take longer.
-                        await blob_lock.renew()
+                    tags["alias"] = target
 
-                    async with Lock():
-                        fp.write(suffix)
-                        fp.seek(0)
+                await blob_client.set_tags(tags)
 
-                        # Anything below 40 bytes won't contain any
-                        # data and won't be cached.
-                        if fp.tell() == 40:
-                            raise NotAvailable()
+            if target is None:
+                await register_content(request, digest)
 
-                        await blob_client.upload(fp.read())
+            # Raw payload is committed last, so its presence in the
+            # local tier implies that the variants are complete too.
+            for encoding in [*encodings, None]:
+                if (local_writer := local_writers.pop(encoding, None)) is None:
+                    continue
 
-                    tags = request.metric_tag
-                    tags["done"] = "1"
-                    tags["in_progress"] = "0"
-                    await blob_client.set_tags(tags)
+                try:
+                    await local_writer.commit()
+                except OSError as err:
+                    await local_writer.abort()
+                    await drop_local_writers(err)
 
         except Exception as err:
+            for writer in writers.values():
+                writer.abort()
+
+            for local_writer in local_writers.values():
+                await local_writer.abort()
+
             # Remove the blob on exception - data may be incomplete.
             if await blob_client.exists():
                 await blob_client.delete()
+
+            for encoding in encodings:
+                async with AsyncStorageClient(kws["container"], request.get_path(encoding)) as cli:
+                    if await cli.exists():
+                        await cli.delete()
+
             raise err
 
-    # return responder
-    return True
+    await local_cache.evict_if_needed()
+
+    return CacheEntry(
+        path=target or request.path,
+        encodings=encodings,
+        size=writers[None].size,
+        etag=etag
+    )
 
 
 def format_dtypes(df: DataFrame, column_types: Dict[str, object]) -> DataFrame:
@@ -152,23 +426,115 @@ def format_data(df: DataFrame, response_metrics: Iterable[str]) -> DataFrame:
     return df
 
 
-def format_response(df: DataFrame, response_type: str, request: Request,
-                    include_header: bool = True) -> bytes:
-    if response_type == 'csv':
-        base_metrics = ["areaCode", "areaName", "areaType", "date"]
+def get_response_columns(request: Request) -> list[str]:
+    base_metrics = ["areaCode", "areaName", "areaType", "date"]
+
+    if request.area_type == "msoa":
+        base_metrics = [
+            "regionCode", "regionName", "UtlaCode", "UtlaName", "LtlaCode", "LtlaName",
+            *base_metrics
+        ]
+
+    if not len(request.nested_metrics):
+        request_metrics = sorted(request.db_metrics)
+        return [*base_metrics, *request_metrics]
 
-        if request.area_type == "msoa":
-            base_metrics = [
-                "regionCode", "regionName", "UtlaCode", "UtlaName", "LtlaCode", "LtlaName",
-                *base_metrics
-            ]
+    nested_metric = request.nested_metrics[0]
+    return [*base_metrics, *MetricData.nested_struct[nested_metric]]
 
-        if not len(request.nested_metrics):
-            request_metrics = sorted(request.db_metrics)
-            metrics = [*base_metrics, *request_metrics]
+
+def get_arrow_schema(request: Request) -> pa.Schema:
+    fields = list()
+
+    for column in get_response_columns(request):
+        if column == "date":
+            dtype = pa.date32()
+        elif len(request.nested_metrics) and column not in MetricData.dtypes:
+            dtype = pa.string() if column in NESTED_LABEL_FIELDS else pa.float64()
         else:
-            nested_metric = request.nested_metrics[0]
-            metrics = [*base_metrics, *MetricData.nested_struct[nested_metric]]
+            dtype = ARROW_TYPES.get(MetricData.dtypes.get(column), pa.string())
+
+        fields.append(pa.field(column, dtype, nullable=True))
+
+    return pa.schema(fields)
+
+
+def to_record_batch(df: DataFrame, request: Request) -> pa.RecordBatch:
+    schema = get_arrow_schema(request)
+
+    for metric in set(schema.names) - set(df.columns):
+        df = df.assign(**{metric: None})
+
+    df = df.loc[:, schema.names]
+
+    if len(df):
+        df = df.assign(date=to_datetime(df.date).dt.date)
+
+    return pa.RecordBatch.from_pandas(df, schema=schema, preserve_index=False)
+
+
+class _BufferSink:
+    """
+    Write-only file object whose content may be drained
+    incrementally as the Parquet writer produces data.
+    """
+    def __init__(self):
+        self._buffer = BytesIO()
+        self._position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._buffer.write(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def writable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return False
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = self._buffer.getvalue()
+        self._buffer.seek(0)
+        self._buffer.truncate(0)
+        return data
+
+
+class ParquetEncoder:
+    """
+    Incrementally encodes Arrow record batches - as produced by
+    ``format_response`` - into a Parquet file, with one row group
+    per batch. The file footer is produced by ``close``.
+    """
+    def __init__(self, request: Request):
+        self._schema = get_arrow_schema(request)
+        self._sink = _BufferSink()
+        self._writer = pq.ParquetWriter(self._sink, self._schema, compression="snappy")
+
+    def write(self, data: bytes) -> bytes:
+        batch = pa.ipc.read_record_batch(pa.py_buffer(data), self._schema)
+        self._writer.write_table(pa.Table.from_batches([batch], schema=self._schema))
+        return self._sink.drain()
+
+    def close(self) -> bytes:
+        self._writer.close()
+        return self._sink.drain()
+
+
+def format_response(df: DataFrame, response_type: str, request: Request,
+                    include_header: bool = True) -> bytes:
+    if response_type == 'csv':
+        metrics = get_response_columns(request)
 
         for metric in set(metrics) - set(df.columns):
             df = df.assign(**{metric: None})
@@ -185,6 +551,17 @@ def format_response(df: DataFrame, response_type: str, request: Request,
         )
         return csv_response.encode()
 
+    if response_type in ['arrow', 'parquet']:
+        batch = to_record_batch(df, request=request)
+        batch_message = batch.serialize().to_pybytes()
+
+        # Parquet files are assembled from the batches by
+        # the `ParquetEncoder`.
+        if response_type == 'parquet' or not include_header:
+            return batch_message
+
+        return batch.schema.serialize().to_pybytes() + batch_message
+
     df_dict = df.to_dict(orient='records')
 
     if response_type == 'jsonl':
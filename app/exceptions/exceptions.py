@@ -21,7 +21,7 @@ Contributors:  Pouria Hadjibagheri
 from http import HTTPStatus
 from string import Template
 from difflib import SequenceMatcher
-from typing import Iterable
+from typing import Iterable, Union, Dict
 from logging import getLogger
 from datetime import date
 
@@ -52,6 +52,7 @@ __all__ = [
     'StructureTooLarge',
     'BadRequest',
     'WeekendPublicationEnded',
+    'RangeNotSatisfiable',
 ]
 
 
@@ -94,13 +95,13 @@ class APIException(HTTPException):
     message = str()
     code: HTTPStatus = HTTPStatus.BAD_REQUEST
 
-    def __init__(self, **kwargs):
+    def __init__(self, headers: Union[Dict[str, str], None] = None, **kwargs):
         self.message = Template(self.message).substitute(**kwargs)
 
         super(APIException, self).__init__(
             status_code=self.code.real,
             detail=self.message,
-            **kwargs
+            headers=headers
         )
 
 
@@ -257,3 +258,13 @@ class UnauthorisedRequest(APIException):
         "is denied."
     )
     code = HTTPStatus.UNAUTHORIZED
+
+
+class RangeNotSatisfiable(APIException):
+    message = (
+        "The requested range is not satisfiable. The payload is $size bytes long."
+    )
+    code = HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE
+
+    def __init__(self, *, size: int):
+        super().__init__(size=size, headers={"Content-Range": f"bytes */{size}"})
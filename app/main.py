@@ -8,20 +8,29 @@ from typing import Optional, List
 from json import dumps
 from http import HTTPStatus
 from pathlib import Path
+from inspect import isasyncgen
 
 # 3rd party:
 from fastapi import Query, Request as APIRequest
 from fastapi.responses import (
-    RedirectResponse as APIRedirect, Response as APIResponse, FileResponse
+    RedirectResponse as APIRedirect, Response as APIResponse, FileResponse,
+    StreamingResponse
 )
 
 # Internal:
 from app.startup import start_app
-from app.utils.operations import Response, RedirectResponse, Request
+from app.utils.operations import (
+    Response, RedirectResponse, Request, LocalFileResponse, Validators, get_validators,
+    is_not_modified, if_range_matches
+)
 from app.utils.assets import RequestMethod
 from app.exceptions import APIException
-from app.engine import get_data, run_healthcheck
+from app.engine import (
+    get_data, run_healthcheck, shutdown_executor, start_prewarmer, stop_prewarmer,
+    start_collector, stop_collector, start_index_loader
+)
 from app.config import Settings
+from app.storage import close_service_clients
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
@@ -38,19 +47,46 @@ app = start_app()
 base_path = Path(__file__).parent
 
 
+@app.on_event("startup")
+async def startup():
+    start_index_loader()
+    start_prewarmer()
+    start_collector()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await stop_prewarmer()
+    stop_collector()
+    shutdown_executor()
+    await close_service_clients()
+
+
 @app.get("/api/v2/openapi.json")
 async def main():
     open_api = base_path.joinpath("assets", "openapi.json")
     return FileResponse(str(open_api.absolute()))
 
 
+def not_modified(validators: Validators) -> APIResponse:
+    return APIResponse(
+        None,
+        status_code=HTTPStatus.NOT_MODIFIED.real,
+        headers={
+            "Cache-Control": "public, max-age=90, must-revalidate",
+            "Vary": "Accept-Encoding",
+            **validators.get_headers()
+        }
+    )
+
+
 @app.get("/api/v2/data")
 @app.head("/api/v2/data")
 async def main(req: APIRequest,
                areaType: str = Query(..., max_length=10, title="Area type"),
                release: str = Query(..., regex=r"^\d{4}-\d{2}-\d{2}$", title="Release date"),
                metric: List[str] = Query(...),
-               format: str = Query("json", regex=r"^csv|jsonl?|xml$", title="Response format"),
+               format: str = Query("json", regex=r"^(csv|jsonl?|xml|arrow|parquet)$", title="Response format"),
                areaCode: Optional[str] = Query(None, max_length=10, title="Area code")):
 
     request = Request(
@@ -64,6 +100,22 @@ async def main(req: APIRequest,
         url=req.url
     )
 
+    try:
+        validators = await get_validators(request)
+    except Exception as err:
+        logger.exception(err)
+        validators = None
+
+    # Revalidations are answered without touching the engine.
+    if validators is not None and is_not_modified(req.headers, validators):
+        return not_modified(validators)
+
+    # Ranges of an outdated representation are not served.
+    if request.range_header is not None and not if_range_matches(req.headers, validators):
+        request.range_header = None
+
+    error_headers = dict()
+
     try:
         response = await get_data(request=request)
 
@@ -71,6 +123,7 @@ async def main(req: APIRequest,
         logging.info(err)
         content = dumps({"response": err.message, "status_code": err.code})
         response = Response(content=content.encode(), status_code=err.code)
+        error_headers = err.headers or dict()
 
     except Exception as err:
         # A generic exception may contain sensitive data and must
@@ -88,24 +141,55 @@ async def main(req: APIRequest,
         })
         response = APIResponse(content=content.encode(), status_code=err)
 
+    # The wildcard is only matched once the payload is known to exist.
+    if (validators is not None and response.status_code < 400 and
+            is_not_modified(req.headers, validators, exists=True)):
+        return not_modified(validators)
+
+    headers = {**response.headers, **error_headers}
+
+    if validators is not None and response.status_code < 400:
+        headers.update(validators.get_headers(headers.get("Content-Encoding")))
+
     if request.method == RequestMethod.Head:
         return APIResponse(
             str(),
             status_code=response.status_code,
-            headers=response.headers
+            headers=headers
         )
 
     if isinstance(response, RedirectResponse):
         return APIRedirect(
             url=response.location,
             status_code=HTTPStatus.SEE_OTHER.real,
-            headers=response.headers
+            headers=headers
+        )
+
+    if isinstance(response, LocalFileResponse):
+        if response.accel_redirect is not None:
+            return APIResponse(
+                None,
+                status_code=HTTPStatus.OK.real,
+                headers={**headers, "X-Accel-Redirect": response.accel_redirect}
+            )
+
+        return FileResponse(
+            response.filename,
+            status_code=HTTPStatus.OK.real,
+            headers=headers
+        )
+
+    if isasyncgen(response.content):
+        return StreamingResponse(
+            response.content,
+            status_code=response.status_code,
+            headers=headers
         )
 
     return APIResponse(
         response.content,
         status_code=HTTPStatus.OK.real,
-        headers=response.headers
+        headers=headers
     )
 
 
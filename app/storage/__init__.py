@@ -6,7 +6,8 @@ Storage
 
 Azure blob storage client wrapper.
 
-Provides convenient tools to upload and download data to and from Azure Storage.
+Provides convenient tools to upload and download data to and from Azure Storage,
+or - for local and on-prem deployments - a file system with the same interface.
 
 Author:        Pouria Hadjibagheri <pouria.hadjibagheri@phe.gov.uk>
 Created:       11 Jul 2020
@@ -21,7 +22,26 @@ Contributors:  Pouria Hadjibagheri
 # 3rd party:
 
 # Internal:
+from app.config import Settings
 from .storage import *
+from .filesystem import *
+from .local_cache import *
+from .memory_cache import *
+
+_backends = {
+    "azure": AsyncStorageClient,
+    "filesystem": FileSystemStorageClient,
+}
+
+if Settings.storage_backend.lower() not in _backends:
+    raise ValueError(
+        "Storage backend must be one of %s. "
+        "Got <%r> instead." % (list(_backends), Settings.storage_backend)
+    )
+
+# Storage clients are imported from the package, which exposes
+# the backend selected by `Settings.storage_backend`.
+AsyncStorageClient = _backends[Settings.storage_backend.lower()]
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Header
@@ -0,0 +1,633 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+import logging
+import os
+import shutil
+import gzip
+from typing import Union, NoReturn, Iterable, NamedTuple, Any
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from asyncio import to_thread
+from fcntl import flock, LOCK_EX, LOCK_UN
+from hashlib import blake2b
+from time import time
+from uuid import uuid4
+
+# 3rd party:
+from azure.storage.blob import BlobType
+from azure.core.exceptions import (
+    HttpResponseError, ResourceExistsError, ResourceNotFoundError
+)
+from orjson import dumps, loads
+
+# Internal:
+from app.config import Settings
+from app.utils.compression import CompressionStage
+from .storage import (
+    AsyncBlockBlobWriter, DEFAULT_CONTENT_TYPE, DEFAULT_CACHE_CONTROL, CONTENT_LANGUAGE
+)
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'FileSystemStorageClient',
+    'FileSystemLock',
+    'FileProperties',
+    'FileLease'
+]
+
+
+logger = logging.getLogger("app")
+
+# Reserved directories in the storage root. Container
+# names cannot start with a dot.
+META_DIR = ".meta"
+LOCKS_DIR = ".locks"
+BLOCKS_DIR = ".blocks"
+TEMP_DIR = ".tmp"
+
+CHUNK_SIZE = 2 ** 22  # 4MB
+
+
+class FileLease(NamedTuple):
+    """
+    Lease properties of a stored file, as per ``LeaseProperties``.
+    """
+    status: str
+    state: str
+    duration: Union[str, None]
+
+
+class FileProperties(NamedTuple):
+    """
+    Properties of a stored file - a subset of those of an Azure blob.
+    """
+    name: str
+    container: str
+    size: int
+    etag: str
+    last_modified: datetime
+    last_accessed_on: datetime
+    lease: FileLease
+    blob_type: str
+    tags: dict[str, str]
+    content_settings: dict[str, Union[str, None]]
+
+    def __getitem__(self, item):
+        # Subscript access, as supported by `BlobProperties`.
+        if isinstance(item, str):
+            return getattr(self, item)
+
+        return tuple.__getitem__(self, item)
+
+
+class FileSystemDownloader:
+    """
+    Content of a file. Content encoded with gzip is decoded when
+    ``decompress`` is set - as it is by the Azure SDK by default.
+    """
+    def __init__(self, filename: str, content_encoding: Union[str, None] = None,
+                 decompress: bool = True):
+        self._filename = filename
+        self._decode = decompress and content_encoding == "gzip"
+        self.size = os.stat(filename).st_size
+
+    async def readall(self) -> bytes:
+        return await to_thread(self._read)
+
+    async def readinto(self, fp) -> int:
+        return await to_thread(self._copy, fp)
+
+    def _open(self):
+        if self._decode:
+            return gzip.open(self._filename, "rb")
+
+        return open(self._filename, "rb")
+
+    def _read(self) -> bytes:
+        with self._open() as fp:
+            return fp.read()
+
+    def _copy(self, target) -> int:
+        with self._open() as fp:
+            shutil.copyfileobj(fp, target, CHUNK_SIZE)
+
+        return self.size
+
+
+class FileSystemLock:
+    """
+    Lease on a file, with the semantics of an Azure blob lease.
+
+    A duration of -1 produces an infinite lease.
+    """
+    _name = "File system"
+
+    def __init__(self, client: 'FileSystemStorageClient', duration: int):
+        self._client = client
+        self._duration = duration
+        self.id = str(uuid4())
+
+    async def __aenter__(self):
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.release()
+
+    async def acquire(self):
+        return await to_thread(self._client.set_lease, self.id, self._duration, acquire=True)
+
+    async def renew(self):
+        return await to_thread(self._client.set_lease, self.id, self._duration)
+
+    async def release(self):
+        return await to_thread(self._client.release_lease, self.id)
+
+
+class FileSystemStorageClient:
+    """
+    Storage client backed by the local file system, implementing the
+    interface of ``AsyncStorageClient``.
+
+    Files are stored in ``<root>/<container>/<path>``. Writes go into
+    a temporary file which is atomically renamed into place, so readers
+    never observe partial content. Content settings, tags, and leases
+    are kept in a JSON sidecar under ``<root>/.meta``, and updates to
+    them are serialised using an exclusive ``fcntl`` lock per file -
+    shared by all the processes on the host.
+
+    Parameters
+    ----------
+    container: str
+        Storage container - a directory in ``root``.
+
+    path: str
+        Path to the file (excluding ``container``). For the listing process,
+        the argument is the prefix to filter the files.
+
+    root: str
+        Storage root. [Default: ``Settings.storage_root``]
+
+    For the remaining parameters, see ``AsyncStorageClient``.
+    """
+    _name = "File system"
+
+    def __init__(self, container: str, path: str = str(),
+                 root: Union[str, None] = None,
+                 content_type: Union[str, None] = DEFAULT_CONTENT_TYPE,
+                 cache_control: str = DEFAULT_CACHE_CONTROL, compressed: bool = True,
+                 content_disposition: Union[str, None] = None,
+                 content_language: Union[str, None] = CONTENT_LANGUAGE,
+                 content_encoding: Union[str, None] = None,
+                 tier: str = 'Hot', **kwargs):
+        self.path = path
+        self.container = container
+        self.compressed = compressed
+        self._tier = tier
+        self._lock: Union[FileSystemLock, None] = None
+        self._root = os.path.abspath(root or Settings.storage_root)
+
+        if tier not in ['Hot', 'Cool', 'Archive']:
+            raise ValueError(
+                "Tier must be one of 'Hot', 'Cool' or 'Archive'. "
+                "Got <%r> instead." % tier
+            )
+
+        self._content_settings = {
+            "content_type": content_type,
+            "cache_control": cache_control,
+            # Data that is already encoded is uploaded as is.
+            "content_encoding": content_encoding or ("gzip" if self.compressed else None),
+            "content_language": content_language,
+            "content_disposition": content_disposition,
+        }
+
+        self._container_dir = self._get_filename(self._root, container)
+        self.filename = self._get_filename(self._container_dir, path)
+
+        relative_path = os.path.relpath(self.filename, self._root)
+        self._meta_filename = os.path.join(self._root, META_DIR, f"{relative_path}.json")
+        self._blocks_dir = os.path.join(self._root, BLOCKS_DIR, relative_path)
+
+        digest = blake2b(relative_path.encode(), digest_size=16).hexdigest()
+        self._lock_filename = os.path.join(self._root, LOCKS_DIR, f"{digest}.lock")
+
+        self.account_name = "local"
+        self.target = self._root
+        self.url = f"file://{self.filename}"
+
+    @staticmethod
+    def _get_filename(base: str, path: str) -> str:
+        filename = os.path.normpath(os.path.join(base, path))
+
+        # Paths must not escape the base directory.
+        if filename != base and not filename.startswith(base + os.sep):
+            raise ValueError("Invalid storage path: %r" % path)
+
+        return filename
+
+    async def __aenter__(self) -> 'FileSystemStorageClient':
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb) -> NoReturn:
+        pass
+
+    # Synchronous primitives
+    # ----------------------------------------------------------------------------------------
+
+    @contextmanager
+    def _locked(self):
+        os.makedirs(os.path.dirname(self._lock_filename), exist_ok=True)
+        fd = os.open(self._lock_filename, os.O_RDWR | os.O_CREAT, 0o600)
+
+        try:
+            flock(fd, LOCK_EX)
+            yield
+        finally:
+            flock(fd, LOCK_UN)
+            os.close(fd)
+
+    def _write_atomic(self, filename: str, chunks: Iterable[bytes]):
+        temp_dir = os.path.join(self._root, TEMP_DIR)
+        os.makedirs(temp_dir, exist_ok=True)
+        temp_name = os.path.join(temp_dir, uuid4().hex)
+
+        try:
+            with open(temp_name, "wb") as fp:
+                for chunk in chunks:
+                    fp.write(chunk)
+
+            os.makedirs(os.path.dirname(filename), exist_ok=True)
+            os.replace(temp_name, filename)
+        except BaseException:
+            try:
+                os.remove(temp_name)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _read_meta(self) -> dict[str, Any]:
+        try:
+            with open(self._meta_filename, "rb") as fp:
+                return loads(fp.read())
+        except FileNotFoundError:
+            return dict()
+
+    def _write_meta(self, meta: dict[str, Any]):
+        self._write_atomic(self._meta_filename, [dumps(meta)])
+
+    @staticmethod
+    def _active_lease(meta: dict[str, Any]) -> Union[dict[str, Any], None]:
+        lease = meta.get("lease")
+
+        if lease is None or (lease["expires"] is not None and lease["expires"] < time()):
+            return None
+
+        return lease
+
+    def _check_lease(self, meta: dict[str, Any]):
+        lease = self._active_lease(meta)
+        lease_id = self._lock.id if self._lock is not None else None
+
+        if lease is not None and lease["id"] != lease_id:
+            raise HttpResponseError(
+                message=f"There is currently a lease on '{self.container}/{self.path}'."
+            )
+
+    def _new_meta(self, blob_type: str, meta: dict[str, Any],
+                  tags: Union[dict[str, str], None] = None) -> dict[str, Any]:
+        return {
+            "blob_type": blob_type,
+            "content_settings": self._content_settings,
+            "tier": self._tier,
+            "tags": tags or dict(),
+            "sealed": False,
+            # Leases survive overwrites, as they do in Azure.
+            "lease": self._active_lease(meta)
+        }
+
+    def _upload(self, data: bytes, overwrite: bool, blob_type: str):
+        with self._locked():
+            meta = self._read_meta()
+            self._check_lease(meta)
+
+            if not overwrite and os.path.isfile(self.filename):
+                raise ResourceExistsError(
+                    message=f"The specified blob already exists: '{self.container}/{self.path}'."
+                )
+
+            self._write_atomic(self.filename, [data])
+            self._write_meta(self._new_meta(blob_type, meta))
+
+    def _stage_block(self, block_id: str, data: bytes):
+        self._write_atomic(os.path.join(self._blocks_dir, block_id), [data])
+
+    def _commit_block_list(self, block_ids: list[str], tags: Union[dict[str, str], None]):
+        def read_blocks():
+            for block_id in block_ids:
+                with open(os.path.join(self._blocks_dir, block_id), "rb") as fp:
+                    while chunk := fp.read(CHUNK_SIZE):
+                        yield chunk
+
+        with self._locked():
+            meta = self._read_meta()
+            self._check_lease(meta)
+
+            self._write_atomic(self.filename, read_blocks())
+            self._write_meta(self._new_meta(
+                BlobType.BlockBlob.value, meta,
+                tags=tags if tags is not None else meta.get("tags")
+            ))
+
+        shutil.rmtree(self._blocks_dir, ignore_errors=True)
+
+    def _append(self, data: bytes):
+        with self._locked():
+            meta = self._read_meta()
+            self._check_lease(meta)
+
+            if meta.get("blob_type") != BlobType.AppendBlob.value:
+                raise HttpResponseError(message="The blob type is invalid for this operation.")
+
+            if meta.get("sealed"):
+                raise HttpResponseError(message="The blob is sealed.")
+
+            with open(self.filename, "ab") as fp:
+                fp.write(data)
+
+    def _update_meta(self, check_lease: bool = True, **fields):
+        with self._locked():
+            if not os.path.isfile(self.filename):
+                raise ResourceNotFoundError(
+                    message=f"The specified blob does not exist: '{self.container}/{self.path}'."
+                )
+
+            meta = self._read_meta()
+            if check_lease:
+                self._check_lease(meta)
+
+            meta.update(fields)
+            self._write_meta(meta)
+
+    def _delete(self):
+        with self._locked():
+            meta = self._read_meta()
+            self._check_lease(meta)
+
+            try:
+                os.remove(self.filename)
+            except FileNotFoundError:
+                raise ResourceNotFoundError(
+                    message=f"The specified blob does not exist: '{self.container}/{self.path}'."
+                )
+
+            try:
+                os.remove(self._meta_filename)
+            except FileNotFoundError:
+                pass
+
+        shutil.rmtree(self._blocks_dir, ignore_errors=True)
+
+    def set_lease(self, lease_id: str, duration: int, acquire: bool = False):
+        with self._locked():
+            if not os.path.isfile(self.filename):
+                raise ResourceNotFoundError(
+                    message=f"The specified blob does not exist: '{self.container}/{self.path}'."
+                )
+
+            meta = self._read_meta()
+            lease = self._active_lease(meta)
+
+            if lease is not None and lease["id"] != lease_id:
+                raise ResourceExistsError(
+                    message=f"There is already a lease present on '{self.container}/{self.path}'."
+                )
+
+            if lease is None and not acquire:
+                raise HttpResponseError(message="The lease ID specified did not match.")
+
+            meta["lease"] = {
+                "id": lease_id,
+                "expires": time() + duration if duration >= 0 else None
+            }
+            self._write_meta(meta)
+
+    def release_lease(self, lease_id: str):
+        with self._locked():
+            meta = self._read_meta()
+            lease = meta.get("lease")
+
+            if lease is not None and lease["id"] == lease_id:
+                meta["lease"] = None
+                self._write_meta(meta)
+
+    def _get_tags(self) -> dict[str, str]:
+        if not os.path.exists(self.filename):
+            raise ResourceNotFoundError(
+                message=f"The specified blob does not exist: '{self.container}/{self.path}'."
+            )
+
+        return self._read_meta().get("tags", dict())
+
+    def _get_properties(self) -> FileProperties:
+        try:
+            stat = os.stat(self.filename)
+        except FileNotFoundError:
+            raise ResourceNotFoundError(
+                message=f"The specified blob does not exist: '{self.container}/{self.path}'."
+            )
+
+        meta = self._read_meta()
+
+        if (lease := self._active_lease(meta)) is not None:
+            duration = "infinite" if lease["expires"] is None else "fixed"
+            lease = FileLease(status="locked", state="leased", duration=duration)
+        else:
+            lease = FileLease(status="unlocked", state="available", duration=None)
+
+        return FileProperties(
+            name=self.path,
+            container=self.container,
+            size=stat.st_size,
+            etag=f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            last_modified=datetime.fromtimestamp(stat.st_mtime, tz=timezone.utc),
+            last_accessed_on=datetime.fromtimestamp(stat.st_atime, tz=timezone.utc),
+            lease=lease,
+            blob_type=meta.get("blob_type", BlobType.BlockBlob.value),
+            tags=meta.get("tags", dict()),
+            content_settings=meta.get("content_settings", self._content_settings)
+        )
+
+    def _read_range(self, offset: int, length: int) -> bytes:
+        with open(self.filename, "rb") as fp:
+            fp.seek(offset)
+            return fp.read(length)
+
+    def _list(self) -> list[FileProperties]:
+        # Prefixes are matched as strings, as they are in Azure.
+        prefix_dir = self._get_filename(self._container_dir, os.path.dirname(self.path))
+        blobs = list()
+
+        for dir_path, _, filenames in os.walk(prefix_dir):
+            for name in filenames:
+                blob_name = os.path.relpath(os.path.join(dir_path, name), self._container_dir)
+
+                if not blob_name.startswith(self.path):
+                    continue
+
+                client = FileSystemStorageClient(self.container, blob_name, root=self._root)
+
+                try:
+                    blobs.append(client._get_properties())
+                except ResourceNotFoundError:
+                    continue
+
+        return sorted(blobs, key=lambda blob: blob.name)
+
+    # Public interface
+    # ----------------------------------------------------------------------------------------
+
+    async def set_tier(self, tier: str):
+        await to_thread(self._update_meta, tier=tier)
+
+    async def exists(self) -> bool:
+        return await to_thread(os.path.isfile, self.filename)
+
+    async def delete(self):
+        await to_thread(self._delete)
+
+    def lock_file(self, duration: int) -> FileSystemLock:
+        self._lock = FileSystemLock(self, duration)
+        return self._lock
+
+    async def is_locked(self) -> bool:
+        meta = await to_thread(self._read_meta)
+        return self._active_lease(meta) is not None
+
+    async def upload(self, data: Union[str, bytes], overwrite: bool = True,
+                     blob_type: BlobType = BlobType.BlockBlob) -> NoReturn:
+        data = data.encode() if isinstance(data, str) else data
+
+        if self.compressed:
+            stage = CompressionStage(label=self.path)
+            data = await stage.compress(data) + await stage.flush()
+            stage.report()
+
+        await to_thread(self._upload, data, overwrite, BlobType(blob_type).value)
+        logger.info(f"Uploaded file '{self.container}/{self.path}'")
+
+    async def stage_block(self, block_id: str, data: bytes):
+        await to_thread(self._stage_block, block_id, data)
+
+    async def commit_block_list(self, block_ids: Iterable[str], tags: Union[dict[str, str], None] = None):
+        if self._lock is not None:
+            await self._lock.renew()
+
+        await to_thread(self._commit_block_list, list(block_ids), tags)
+
+    async def discard_blocks(self):
+        await to_thread(shutil.rmtree, self._blocks_dir, True)
+
+    def block_writer(self, **kwargs) -> AsyncBlockBlobWriter:
+        return AsyncBlockBlobWriter(self, **kwargs)
+
+    async def create_append_blob(self):
+        await to_thread(self._upload, b"", True, BlobType.AppendBlob.value)
+
+    async def seal_append_blob(self):
+        await to_thread(self._update_meta, sealed=True)
+
+    async def append_blob(self, data: Union[str, bytes]):
+        """
+        Appends a block to the file. Compressed blocks are each a
+        complete gzip member, as they are in ``AsyncStorageClient``.
+        """
+        data = data.encode() if isinstance(data, str) else data
+
+        if self.compressed:
+            stage = CompressionStage(label=self.path)
+            data = await stage.compress(data) + await stage.flush()
+            stage.report()
+
+        if self._lock is not None:
+            await self._lock.renew()
+
+        await to_thread(self._append, data)
+
+    async def get_properties(self) -> FileProperties:
+        return await to_thread(self._get_properties)
+
+    def _get_downloader(self, decompress: bool) -> FileSystemDownloader:
+        content_settings = self._read_meta().get("content_settings", dict())
+
+        return FileSystemDownloader(
+            self.filename,
+            content_encoding=content_settings.get("content_encoding"),
+            decompress=decompress
+        )
+
+    async def download(self, decompress: bool = True) -> FileSystemDownloader:
+        try:
+            downloader = await to_thread(self._get_downloader, decompress)
+        except FileNotFoundError:
+            raise ResourceNotFoundError(
+                message=f"The specified blob does not exist: '{self.container}/{self.path}'."
+            )
+
+        logger.info(f"Downloaded file '{self.container}/{self.path}'")
+        return downloader
+
+    async def list_blobs(self, include_tags: bool = False):
+        # Tags are always included, as they are read with the properties.
+        for blob in await to_thread(self._list):
+            yield blob
+
+    async def download_chunks(self, offset: int = 0, length: Union[int, None] = None,
+                              chunk_size: int = Settings.download_chunk_size, **kwargs):
+        """
+        Reads the file - or ``length`` bytes thereof, starting from
+        ``offset`` - in chunks of ``chunk_size`` bytes. Local reads
+        are sequential; other arguments are accepted for compatibility.
+        """
+        if length is None:
+            props = await self.get_properties()
+            length = props.size - offset
+
+        end = offset + length
+        position = offset
+        while position < end:
+            chunk_length = min(chunk_size, end - position)
+            data = await to_thread(self._read_range, position, chunk_length)
+            position += chunk_length
+
+            if not data:
+                break
+
+            yield data
+
+    async def download_into(self, fp):
+        download_obj = await self.download()
+        await download_obj.readinto(fp)
+        fp.seek(0)
+        return True
+
+    async def set_tags(self, tags: dict[str, str]):
+        if self._lock is not None:
+            await self._lock.renew()
+
+        try:
+            return await to_thread(self._update_meta, tags=tags)
+        except HttpResponseError:
+            logger.warning("Failed to create tags.")
+
+    async def get_tags(self) -> dict[str, str]:
+        return await to_thread(self._get_tags)
+
+    def __str__(self):
+        return f"File system storage object for '{self.container}/{self.path}'"
+
+    __repr__ = __str__
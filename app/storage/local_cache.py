@@ -0,0 +1,257 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+import logging
+import os
+import shutil
+from typing import Union, NamedTuple
+from contextlib import contextmanager
+from uuid import uuid4
+from asyncio import to_thread
+from fcntl import flock, LOCK_EX
+
+# 3rd party:
+
+# Internal:
+from app.config import Settings
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'LocalCache',
+    'LocalCacheWriter',
+    'LocalCacheEntry',
+    'local_cache'
+]
+
+
+logger = logging.getLogger("app")
+
+TEMP_DIR_NAME = ".tmp"
+
+# Size of the cache shared by the workers - kept
+# alongside the temporary files, so it is never evicted.
+SIZE_FILE_NAME = os.path.join(TEMP_DIR_NAME, "size")
+
+
+class LocalCacheEntry(NamedTuple):
+    path: str
+    filename: str
+    size: int
+
+
+class LocalCacheWriter:
+    """
+    Writes an entry into a temporary file, which is atomically moved
+    into the cache once committed. Incomplete entries are therefore
+    never visible to the readers.
+
+    File operations are run in a thread so as not to block the event loop.
+    """
+    def __init__(self, cache: 'LocalCache', filename: str):
+        self._cache = cache
+        self._target = filename
+        self._temp_name = os.path.join(cache.root, TEMP_DIR_NAME, uuid4().hex)
+        self._fp = open(self._temp_name, "wb")
+        self.size = 0
+
+    async def write(self, data: bytes):
+        await to_thread(self._fp.write, data)
+        self.size += len(data)
+
+    def truncate(self):
+        self._fp.seek(0)
+        self._fp.truncate(0)
+        self.size = 0
+
+    def _commit(self):
+        self._fp.close()
+        os.makedirs(os.path.dirname(self._target), exist_ok=True)
+        os.replace(self._temp_name, self._target)
+
+    async def commit(self):
+        await to_thread(self._commit)
+        await self._cache.register(self.size)
+
+    def _abort(self):
+        try:
+            self._fp.close()
+        except OSError:
+            # e.g. buffered data that cannot be flushed for lack of space.
+            pass
+
+        try:
+            os.remove(self._temp_name)
+        except FileNotFoundError:
+            pass
+
+    async def abort(self):
+        await to_thread(self._abort)
+
+
+class LocalCache:
+    """
+    Host-local cache tier with a byte budget and least-recently-used
+    eviction - shared by all the workers on the host.
+
+    Entries are keyed by their path in the ``apiv2cache`` container.
+    The modification time of an entry is renewed whenever it is read,
+    and serves as its last access time for the purpose of eviction.
+
+    The size of the cache is shared by the workers through a file, which
+    is updated - and the cache evicted - under an exclusive lock, so the
+    budget applies to the host rather than to each worker. The size is
+    recalculated from the directory upon eviction, so entries that are
+    replaced or removed by others are accounted for.
+
+    Parameters
+    ----------
+    root: str
+        Cache directory - ideally on a local SSD or ``/dev/shm``.
+
+    max_size: int
+        Byte budget. The cache is disabled when set to 0. It is capped to
+        half the capacity of the file system of ``root`` - e.g. Docker's
+        default ``/dev/shm`` is 64 MB.
+    """
+    def __init__(self, root: str, max_size: int):
+        self.root = os.path.abspath(root)
+        self.max_size = max_size
+        self._size: Union[int, None] = None
+        self.enabled = max_size > 0
+
+        if not self.enabled:
+            return
+
+        try:
+            os.makedirs(os.path.join(self.root, TEMP_DIR_NAME), exist_ok=True)
+            self.max_size = min(max_size, shutil.disk_usage(self.root).total // 2)
+        except OSError as err:
+            logger.warning(f"Local cache disabled: {err}")
+            self.enabled = False
+
+    def _get_filename(self, path: str) -> Union[str, None]:
+        filename = os.path.normpath(os.path.join(self.root, path))
+
+        # Paths must not escape the cache directory.
+        if not filename.startswith(self.root + os.sep):
+            return None
+
+        return filename
+
+    @staticmethod
+    def _get(path: str, filename: str) -> Union[LocalCacheEntry, None]:
+        try:
+            os.utime(filename)
+            size = os.stat(filename).st_size
+        except OSError:
+            return None
+
+        return LocalCacheEntry(path=path, filename=filename, size=size)
+
+    async def get(self, path: str) -> Union[LocalCacheEntry, None]:
+        if not self.enabled or (filename := self._get_filename(path)) is None:
+            return None
+
+        return await to_thread(self._get, path, filename)
+
+    async def writer(self, path: str) -> Union[LocalCacheWriter, None]:
+        if not self.enabled or (filename := self._get_filename(path)) is None:
+            return None
+
+        try:
+            return await to_thread(LocalCacheWriter, self, filename)
+        except OSError as err:
+            logger.warning(f"Failed to create local cache entry: {err}")
+            return None
+
+    @contextmanager
+    def _locked_size(self):
+        fd = os.open(os.path.join(self.root, SIZE_FILE_NAME), os.O_RDWR | os.O_CREAT, 0o644)
+
+        try:
+            # Lock is released once the file is closed.
+            flock(fd, LOCK_EX)
+            yield fd
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _write_size(fd: int, size: int):
+        os.ftruncate(fd, 0)
+        os.pwrite(fd, str(size).encode(), 0)
+
+    def _add_size(self, size: int) -> int:
+        with self._locked_size() as fd:
+            content = os.pread(fd, 32, 0)
+            total_size = (int(content) if content else self._scan_size()) + size
+            self._write_size(fd, total_size)
+
+        return total_size
+
+    async def register(self, size: int):
+        try:
+            self._size = await to_thread(self._add_size, size)
+        except (OSError, ValueError) as err:
+            logger.warning(f"Failed to update the size of the local cache: {err}")
+
+    @property
+    def over_budget(self) -> bool:
+        return self._size is not None and self._size > self.max_size
+
+    def _list_entries(self) -> list[tuple[float, int, str]]:
+        entries = list()
+        temp_dir = os.path.join(self.root, TEMP_DIR_NAME)
+
+        for dir_path, _, filenames in os.walk(self.root):
+            if dir_path.startswith(temp_dir):
+                continue
+
+            for name in filenames:
+                filename = os.path.join(dir_path, name)
+
+                try:
+                    stat = os.stat(filename)
+                except FileNotFoundError:
+                    continue
+
+                entries.append((stat.st_mtime, stat.st_size, filename))
+
+        return entries
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._list_entries())
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the
+        size of the cache falls below 90% of its budget.
+        """
+        with self._locked_size() as fd:
+            entries = sorted(self._list_entries())
+            total_size = sum(size for _, size, _ in entries)
+            target_size = self.max_size * 0.9
+
+            for _, size, filename in entries:
+                if total_size <= target_size:
+                    break
+
+                try:
+                    os.remove(filename)
+                except FileNotFoundError:
+                    pass
+
+                total_size -= size
+
+            self._write_size(fd, total_size)
+
+        self._size = total_size
+
+    async def evict_if_needed(self):
+        if self.enabled and self.over_budget:
+            await to_thread(self.evict)
+
+
+local_cache = LocalCache(Settings.local_cache_dir, Settings.local_cache_size)
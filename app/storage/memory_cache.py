@@ -0,0 +1,88 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from typing import Union
+from collections import OrderedDict
+from time import time
+
+# 3rd party:
+
+# Internal:
+from app.config import Settings
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'MemoryCache',
+    'memory_cache'
+]
+
+
+class MemoryCache:
+    """
+    In-memory cache tier of small payloads, held by each worker
+    with a byte budget and least-recently-used eviction.
+
+    Entries are keyed by their path in the ``apiv2cache`` container, and
+    are only served for the ETag of the payload - where known - with which
+    they were stored, so that regenerated payloads are never served from
+    memory. Entries also expire after ``ttl`` seconds - alongside those of
+    the cache index - so that removed payloads are eventually dropped.
+
+    Parameters
+    ----------
+    max_size: int
+        Byte budget. The cache is disabled when set to 0.
+
+    ttl: int
+        Time in seconds for which entries are held.
+    """
+    def __init__(self, max_size: int, ttl: int = Settings.cache_index_ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        # path -> (etag, content, expiry)
+        self._entries: OrderedDict[str, tuple[Union[str, None], bytes, float]] = OrderedDict()
+
+    def get(self, path: str, etag: Union[str, None] = None) -> Union[bytes, None]:
+        if (item := self._entries.get(path)) is None:
+            return None
+
+        entry_etag, content, expires = item
+
+        if expires < time():
+            self._remove(path)
+            return None
+
+        # Stored for another version of the payload, which
+        # is replaced once the current one is stored.
+        if entry_etag != etag:
+            return None
+
+        self._entries.move_to_end(path)
+
+        return content
+
+    def put(self, path: str, content: bytes, etag: Union[str, None] = None):
+        # Entries larger than a tenth of the budget would
+        # evict too many others.
+        if len(content) > self.max_size // 10:
+            return
+
+        self._remove(path)
+
+        self._entries[path] = etag, content, time() + self.ttl
+        self.size += len(content)
+
+        while self.size > self.max_size:
+            _, (_, evicted, _) = self._entries.popitem(last=False)
+            self.size -= len(evicted)
+
+    def _remove(self, path: str):
+        if (item := self._entries.pop(path, None)) is not None:
+            self.size -= len(item[1])
+
+
+memory_cache = MemoryCache(Settings.memory_cache_size)
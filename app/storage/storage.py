@@ -5,8 +5,10 @@
 # Python:
 import logging
 from os import getenv
-from typing import Union, NoReturn
+from typing import Union, NoReturn, Iterable
 from gzip import compress
+from asyncio import Semaphore, ensure_future, gather
+from collections import deque
 from uuid import uuid4
 from urllib.parse import quote
 
@@ -26,8 +28,12 @@ from azure.storage.blob.aio import (
 )
 
 from azure.core.exceptions import HttpResponseError
+from azure.core.pipeline.transport import AioHttpTransport
+from aiohttp import ClientSession, TCPConnector
 
 # Internal:
+from app.config import Settings
+from app.utils.compression import CompressionStage
 from app.middleware.tracers.utils import trace_async_method_operation
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
@@ -36,7 +42,10 @@ from app.middleware.tracers.utils import trace_async_method_operation
 __all__ = [
     "StorageClient",
     "AsyncStorageClient",
-    "BlobType"
+    "AsyncBlockBlobWriter",
+    "BlobType",
+    "get_service_client",
+    "close_service_clients"
 ]
 
 
@@ -48,6 +57,56 @@ CONTENT_LANGUAGE = 'en-GB'
 
 logger = logging.getLogger("app")
 
+# Service clients are shared by all the storage clients of a worker,
+# keyed by connection string, so that the connections - and their
+# TLS sessions - are reused across requests.
+_service_clients: dict[str, AsyncBlobServiceClient] = dict()
+_sessions: list[ClientSession] = list()
+
+
+def get_service_client(connection_string: str = STORAGE_CONNECTION_STRING) -> AsyncBlobServiceClient:
+    """
+    Returns the service client of the worker for ``connection_string``,
+    creating it - and its connection pool - on first use.
+
+    Must be called from within the event loop.
+    """
+    if (service_client := _service_clients.get(connection_string)) is not None:
+        return service_client
+
+    session = ClientSession(
+        connector=TCPConnector(
+            limit=Settings.storage_max_connections,
+            limit_per_host=Settings.storage_max_connections_per_host,
+            enable_cleanup_closed=True
+        ),
+        # As with the sessions created by the SDK, decompression
+        # is left to the pipeline.
+        auto_decompress=False
+    )
+    _sessions.append(session)
+
+    service_client = AsyncBlobServiceClient.from_connection_string(
+        conn_str=connection_string,
+        transport=AioHttpTransport(session=session, session_owner=False),
+        connection_timeout=60,
+        max_block_size=8 * 1024 * 1024,
+        max_single_put_size=256 * 1024 * 1024,
+        min_large_block_upload_threshold=8 * 1024 * 1024 + 1
+    )
+    _service_clients[connection_string] = service_client
+
+    return service_client
+
+
+async def close_service_clients():
+    while _service_clients:
+        _, service_client = _service_clients.popitem()
+        await service_client.close()
+
+    while _sessions:
+        await _sessions.pop().close()
+
 
 class LockBlob:
     def __init__(self, client: BlobClient, duration: int):
@@ -300,6 +359,107 @@ class AsyncLockBlob:
         return self._lock.renew()
 
 
+class AsyncBlockBlobWriter:
+    """
+    Uploads a block blob incrementally.
+
+    Data is buffered into fixed-size blocks, which are staged concurrently
+    as soon as they are filled, and committed in the order in which they
+    were written. At most ``max_concurrency`` blocks are held in memory
+    at any one time, in addition to the one being filled.
+
+    Parameters
+    ----------
+    client: AsyncStorageClient
+        Client for the target blob.
+
+    block_size: int
+        Size of each block in bytes. [Default: ``Settings.upload_block_size``]
+
+    max_concurrency: int
+        Maximum number of blocks being staged at any one
+        time. [Default: ``Settings.upload_max_concurrency``]
+    """
+    def __init__(self, client: 'AsyncStorageClient', block_size: int = Settings.upload_block_size,
+                 max_concurrency: int = Settings.upload_max_concurrency):
+        self._client = client
+        self._block_size = block_size
+        self._semaphore = Semaphore(max_concurrency)
+        self._buffer = bytearray()
+        self._pending = set()
+        self.block_ids: list[str] = list()
+        self.size = 0
+
+    @staticmethod
+    def get_block_id(index: int) -> str:
+        # All block IDs of a blob must have the same length.
+        return f"{index:08d}"
+
+    async def write(self, data: bytes):
+        self._buffer += data
+        self.size += len(data)
+
+        while len(self._buffer) >= self._block_size:
+            block = bytes(self._buffer[:self._block_size])
+            del self._buffer[:self._block_size]
+            await self._stage(block)
+
+    async def _stage(self, data: bytes):
+        # Raise errors from blocks that have already failed.
+        for task in self._pending:
+            if task.done() and task.exception() is not None:
+                raise task.exception()
+
+        block_id = self.get_block_id(len(self.block_ids))
+        self.block_ids.append(block_id)
+
+        await self._semaphore.acquire()
+
+        task = ensure_future(self._upload(block_id, data))
+        self._pending.add(task)
+        task.add_done_callback(self._on_staged)
+
+    def _on_staged(self, task):
+        # Failed tasks are retained so that their
+        # errors are raised on commit.
+        if not task.cancelled() and task.exception() is None:
+            self._pending.discard(task)
+
+    async def _upload(self, block_id: str, data: bytes):
+        try:
+            await self._client.stage_block(block_id, data)
+        finally:
+            self._semaphore.release()
+
+    async def commit(self, **kwargs):
+        if self._buffer:
+            await self._stage(bytes(self._buffer))
+            self._buffer.clear()
+
+        await gather(*self._pending)
+
+        return await self._client.commit_block_list(self.block_ids, **kwargs)
+
+    def abort(self):
+        for task in self._pending:
+            task.cancel()
+
+        self._buffer.clear()
+
+    async def discard(self):
+        """
+        Abandons the upload, and removes the blocks staged thus far.
+        """
+        self._buffer.clear()
+
+        # Staging is awaited rather than cancelled, as
+        # a block may otherwise be written after removal.
+        await gather(*self._pending, return_exceptions=True)
+        self._pending.clear()
+
+        await self._client.discard_blocks()
+
+
 class AsyncStorageClient:
     _name = "Azure blob"
 
@@ -309,6 +469,7 @@ class AsyncStorageClient:
                  cache_control: str = DEFAULT_CACHE_CONTROL, compressed: bool = True,
                  content_disposition: Union[str, None] = None,
                  content_language: Union[str, None] = CONTENT_LANGUAGE,
+                 content_encoding: Union[str, None] = None,
                  tier: str = 'Hot', **kwargs):
         self.path = path
         self.compressed = compressed
@@ -316,6 +477,7 @@ class AsyncStorageClient:
         self.container = container
         self._tier = getattr(StandardBlobTier, tier, None)
         self._lock = None
+        self._properties = None
 
         if self._tier is None:
             raise ValueError(
@@ -326,21 +488,18 @@ class AsyncStorageClient:
         self._content_settings: ContentSettings = ContentSettings(
             content_type=content_type,
             cache_control=cache_control,
-            content_encoding="gzip" if self.compressed else None,
+            # Data that is already encoded is uploaded as is.
+            content_encoding=content_encoding or ("gzip" if self.compressed else None),
             content_language=content_language,
             content_disposition=content_disposition,
             **kwargs
         )
 
-        self.client: AsyncBlobClient = AsyncBlobClient.from_connection_string(
-            conn_str=connection_string,
-            container_name=container,
-            blob_name=path,
-            # retry_to_secondary=True,
-            connection_timeout=60,
-            max_block_size=8 * 1024 * 1024,
-            max_single_put_size=256 * 1024 * 1024,
-            min_large_block_upload_threshold=8 * 1024 * 1024 + 1
+        # Per-blob handle over the shared pipeline. Closing
+        # the handle leaves the shared transport open.
+        self.client: AsyncBlobClient = (
+            get_service_client(connection_string)
+            .get_blob_client(container=container, blob=path)
         )
 
         # self.client.blob_name
@@ -432,10 +591,19 @@ class AsyncStorageClient:
         -------
         NoReturn
         """
+        data = data.encode() if isinstance(data, str) else data
+
+        # Large payloads are compressed in blocks, each of
+        # which is staged as soon as it is produced.
+        if (self.compressed and blob_type == BlobType.BlockBlob and overwrite and
+                len(data) > Settings.upload_block_size):
+            return await self._upload_compressed_blocks(data)
+
+        prepped_data = data
         if self.compressed:
-            prepped_data = compress(data.encode() if isinstance(data, str) else data)
-        else:
-            prepped_data = data
+            stage = CompressionStage(label=self.path)
+            prepped_data = await stage.compress(data) + await stage.flush()
+            stage.report()
 
         kwargs = dict()
         if blob_type == BlobType.BlockBlob:
@@ -457,6 +625,69 @@ class AsyncStorageClient:
 
         return await upload
 
+    async def _upload_compressed_blocks(self, data: bytes):
+        stage = CompressionStage(label=self.path)
+        writer = self.block_writer()
+        view = memoryview(data)
+        block_size = Settings.upload_block_size
+
+        try:
+            for index in range(0, len(view), block_size):
+                await writer.write(await stage.compress(view[index: index + block_size]))
+
+            await writer.write(await stage.flush())
+            response = await writer.commit()
+        except BaseException:
+            writer.abort()
+            raise
+
+        stage.report()
+
+        return response
+
+    @trace_async_method_operation(
+        "container", "path", "target", "url",
+        name="account_name",
+        dep_type="_name",
+        action="stage_block",
+        operation="PUT"
+    )
+    async def stage_block(self, block_id: str, data: bytes):
+        return await self.client.stage_block(
+            block_id,
+            data,
+            length=len(data),
+            lease=self._lock,
+            timeout=60
+        )
+
+    @trace_async_method_operation(
+        "container", "path", "target", "url",
+        name="account_name",
+        dep_type="_name",
+        action="commit_block_list",
+        operation="PUT"
+    )
+    async def commit_block_list(self, block_ids: Iterable[str], tags: Union[dict[str, str], None] = None):
+        if self._lock:
+            await self._lock.renew()
+
+        return await self.client.commit_block_list(
+            list(block_ids),
+            content_settings=self._content_settings,
+            standard_blob_tier=self._tier,
+            lease=self._lock,
+            tags=tags,
+            timeout=60
+        )
+
+    async def discard_blocks(self):
+        # Uncommitted blocks are discarded by the service.
+        return None
+
+    def block_writer(self, **kwargs) -> AsyncBlockBlobWriter:
+        return AsyncBlockBlobWriter(self, **kwargs)
+
     @trace_async_method_operation(
         "container", "path", "target", "url",
         name="account_name",
@@ -487,10 +718,18 @@ class AsyncStorageClient:
         operation="PUT"
     )
     async def append_blob(self, data: Union[str, bytes]):
+        """
+        Appends a block to the blob.
+
+        Compressed blocks are each a complete gzip member, so the
+        blob is valid - as a multi-member gzip file - after every call.
+        """
+        prepped_data = data.encode() if isinstance(data, str) else data
+
         if self.compressed:
-            prepped_data = compress(data.encode() if isinstance(data, str) else data)
-        else:
-            prepped_data = data
+            stage = CompressionStage(label=self.path)
+            prepped_data = await stage.compress(prepped_data) + await stage.flush()
+            stage.report()
 
         if self._lock is not None:
             await self._lock.renew()
@@ -507,55 +746,109 @@ class AsyncStorageClient:
         "container", "path", "target", "url",
         name="account_name",
         dep_type="_name",
-        action="download",
-        operation="GET"
+        action="get_properties",
+        operation="HEAD"
     )
-    async def download(self) -> AsyncStorageStreamDownloader:
-        data = await self.client.download_blob()
-        logging.info(f"Downloaded blob '{self.container}/{self.path}'")
-        return data
+    async def get_properties(self):
+        # Retained so that subsequent downloads need not query the size.
+        self._properties = await self.client.get_blob_properties()
+        return self._properties
 
     @trace_async_method_operation(
         "container", "path", "target", "url",
         name="account_name",
         dep_type="_name",
-        action="list",
+        action="download",
         operation="GET"
     )
-    async def list_blobs(self):
-        async with AsyncBlobServiceClient.from_connection_string(self._connection_string) as client:
-            container: AsyncContainerClient = client.get_container_client(self.container)
-            async for blob in container.list_blobs(name_starts_with=self.path):
-                yield blob
+    async def download(self, decompress: bool = True) -> AsyncStorageStreamDownloader:
+        # Content is decoded as per its `Content-Encoding` unless
+        # `decompress` is unset - e.g. to serve it as it is stored.
+        data = await self.client.download_blob(decompress=decompress)
+        logging.info(f"Downloaded blob '{self.container}/{self.path}'")
+        return data
+
+    # Async generators cannot be traced by `trace_async_method_operation`,
+    # which awaits the decorated method.
+    async def list_blobs(self, include_tags: bool = False):
+        client = get_service_client(self._connection_string)
+        container: AsyncContainerClient = client.get_container_client(self.container)
+        include = ["tags"] if include_tags else None
+        async for blob in container.list_blobs(name_starts_with=self.path, include=include):
+            yield blob
+
+    async def download_chunks(self, offset: int = 0, length: Union[int, None] = None,
+                              chunk_size: int = Settings.download_chunk_size,
+                              max_concurrency: int = Settings.download_max_concurrency):
+        """
+        Downloads the blob - or ``length`` bytes thereof, starting from
+        ``offset`` - in ranges of ``chunk_size`` bytes.
+
+        Up to ``max_concurrency`` ranges are downloaded concurrently,
+        and yielded in order. No more than ``max_concurrency`` chunks
+        are therefore held in memory at any one time.
+
+        If neither ``length`` nor the size of the blob is known, the
+        size is obtained from the response to the first range.
+        """
+        if length is None and self._properties is not None:
+            length = int(self._properties['size']) - offset
+
+        if length is None:
+            first_chunk, blob_size = await self._download_range(offset, chunk_size)
+            length = blob_size - offset
+            yield first_chunk
+
+            offset += len(first_chunk)
+            length -= len(first_chunk)
+
+        end = offset + length
+        pending = deque()
+
+        try:
+            position = offset
+            while position < end or pending:
+                while position < end and len(pending) < max_concurrency:
+                    chunk_length = min(chunk_size, end - position)
+                    pending.append(ensure_future(self._download_range(position, chunk_length)))
+                    position += chunk_length
+
+                data, _ = await pending.popleft()
+
+                # aiohttp.client_exceptions.ClientPayloadError: 400, message='Can not decode content-encoding: gzip'
+                yield data
+        finally:
+            for task in pending:
+                task.cancel()
 
     @trace_async_method_operation(
         "container", "path", "target", "url",
         name="account_name",
         dep_type="_name",
-        action="download chunks",
+        action="download range",
         operation="GET"
     )
-    async def download_chunks(self):
-        props = await self.client.get_blob_properties()
-        blob_size = int(props['size'])
-
-        chunk_size = 2 ** 22  # 4MB
-        total_downloaded = 0
-        while total_downloaded < blob_size:
-            length = min(chunk_size, blob_size - total_downloaded)
-            data = await self.client.download_blob(
-                offset=total_downloaded,
-                length=min(chunk_size, blob_size - total_downloaded),
-                max_concurrency=1
-            )
-            # length = len(data)
-            total_downloaded += length
+    async def _download_range(self, offset: int, length: int) -> tuple[bytes, int]:
+        """
+        Downloads a range of the blob, and returns
+        its content and the size of the blob.
+        """
+        # Ranges are served as they are stored - a range
+        # of encoded content cannot be decoded on its own.
+        downloader = await self.client.download_blob(
+            offset=offset,
+            length=length,
+            max_concurrency=1,
+            decompress=False
+        )
+
+        data = await downloader.readall()
 
-            if not length:
-                break
+        # e.g. "bytes 0-4194303/10485760"
+        content_range = downloader.properties.content_range
+        blob_size = int(content_range.rsplit("/", 1)[1]) if content_range else downloader.size
 
-            # aiohttp.client_exceptions.ClientPayloadError: 400, message='Can not decode content-encoding: gzip'
-            yield await data.readall()
+        return data, blob_size
 
     @trace_async_method_operation(
         "container", "path", "target", "url",
@@ -585,3 +878,13 @@ class AsyncStorageClient:
             return await self.client.set_blob_tags(tags, lease=self._lock)
         except HttpResponseError:
             logger.warning("Failed to create tags.")
+
+    @trace_async_method_operation(
+        "container", "path", "target", "url",
+        name="account_name",
+        dep_type="_name",
+        action="get tags",
+        operation="GET"
+    )
+    async def get_tags(self) -> dict[str, str]:
+        return await self.client.get_blob_tags()
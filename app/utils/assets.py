@@ -5,8 +5,9 @@
 # Python:
 from datetime import datetime
 from os import getenv
+from time import time
 from dataclasses import dataclass
-from typing import Dict
+from typing import Dict, Tuple
 
 # 3rd party:
 
@@ -49,6 +50,12 @@ if ENVIRONMENT != "DEVELOPMENT":
     query += " AND rr.released IS TRUE"
 
 
+# Timestamps of published releases, with their expiry. They are
+# renewed after `Settings.release_timestamp_ttl`, as a release may
+# be published again - e.g. to correct its data.
+_release_timestamps: Dict[tuple, Tuple[datetime, float]] = dict()
+
+
 async def get_latest_timestamp(request) -> datetime:
     area_type = request.area_type.lower()
 
@@ -57,9 +64,22 @@ async def get_latest_timestamp(request) -> datetime:
     else:
         category = "MAIN"
 
+    key = (request.release, category)
+    if (cached := _release_timestamps.get(key)) is not None:
+        timestamp, expiry = cached
+
+        if expiry > time():
+            return timestamp
+
+        del _release_timestamps[key]
+
     async with Connection() as conn:
         timestamp = await conn.fetchval(query, request.release, category)
 
+    # Releases that are yet to be published are not cached.
+    if timestamp is not None and Settings.release_timestamp_ttl > 0:
+        _release_timestamps[key] = timestamp, time() + Settings.release_timestamp_ttl
+
     return timestamp
 
 
@@ -0,0 +1,229 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from logging import getLogger
+from zlib import compressobj, DEFLATED, MAX_WBITS
+from typing import Iterable, Union
+from asyncio import Lock, to_thread
+from time import perf_counter
+
+# 3rd party:
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+from orjson import dumps
+
+# Internal:
+from app.config import Settings
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'StreamCompressor',
+    'CompressionStage',
+    'ENCODING_EXTENSIONS',
+    'get_available_encodings',
+    'negotiate_encoding'
+]
+
+
+logger = getLogger("app")
+
+# File extensions for the compressed variants of a blob.
+ENCODING_EXTENSIONS = {
+    "br": "br",
+    "zstd": "zst",
+    "gzip": "gz",
+}
+
+# Server preference when the client accepts
+# more than one encoding with the same weight.
+ENCODING_PREFERENCE = ["br", "zstd", "gzip"]
+
+
+class StreamCompressor:
+    """
+    Incremental compressor for ``gzip``, ``br`` (requires ``brotli``)
+    and ``zstd`` (requires ``zstandard``) content encodings.
+
+    Parameters
+    ----------
+    encoding: str
+        HTTP content encoding.
+
+    level: int
+        Compression level. Brotli and zstd levels are clipped to their
+        respective range. [Default: 6]
+    """
+    def __init__(self, encoding: str, level: int = 6):
+        self.encoding = encoding
+
+        if encoding == "gzip":
+            # Offsetting `wbits` by 16 produces a gzip header and trailer.
+            self._compressor = compressobj(level, DEFLATED, MAX_WBITS | 16)
+        elif encoding == "br" and brotli is not None:
+            self._compressor = brotli.Compressor(quality=min(level, 11))
+        elif encoding == "zstd" and zstandard is not None:
+            self._compressor = (
+                zstandard
+                .ZstdCompressor(level=min(level, 22))
+                .compressobj()
+            )
+        else:
+            raise ValueError(f"Unsupported content encoding: <{encoding!r}>")
+
+    def compress(self, data: bytes) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.process(data)
+
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        if self.encoding == "br":
+            return self._compressor.finish()
+
+        return self._compressor.flush()
+
+
+class CompressionStage:
+    """
+    Streaming compression stage that runs in the default thread pool, so
+    that compressing large payloads does not block the event loop.
+
+    Calls are serialised, and therefore produce the output in the order
+    in which they are made. Compression time and ratio are logged by
+    ``report``.
+
+    Parameters
+    ----------
+    encoding: str
+        HTTP content encoding. [Default: ``gzip``]
+
+    level: int
+        Compression level. [Default: ``Settings.storage_compression_level``]
+
+    label: str
+        Identifies the stage in the metrics - e.g. the blob path.
+    """
+    def __init__(self, encoding: str = "gzip", level: int = Settings.storage_compression_level,
+                 label: Union[str, None] = None):
+        self._compressor = StreamCompressor(encoding, level)
+        self._lock = Lock()
+        self.encoding = encoding
+        self.level = level
+        self.label = label
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.duration = 0.0
+
+    def _timed(self, func, *args) -> bytes:
+        start = perf_counter()
+        output = func(*args)
+        self.duration += perf_counter() - start
+        self.bytes_out += len(output)
+
+        return output
+
+    def _compress(self, data: bytes) -> bytes:
+        self.bytes_in += len(data)
+        return self._timed(self._compressor.compress, data)
+
+    async def compress(self, data: bytes) -> bytes:
+        async with self._lock:
+            return await to_thread(self._compress, data)
+
+    async def flush(self) -> bytes:
+        async with self._lock:
+            return await to_thread(self._timed, self._compressor.flush)
+
+    @property
+    def ratio(self) -> Union[float, None]:
+        if not self.bytes_in:
+            return None
+
+        return self.bytes_out / self.bytes_in
+
+    def report(self):
+        ratio = self.ratio
+
+        logger.info(dumps({
+            "compression": {
+                "label": self.label,
+                "encoding": self.encoding,
+                "level": self.level,
+                "bytesIn": self.bytes_in,
+                "bytesOut": self.bytes_out,
+                "ratio": round(ratio, 4) if ratio is not None else None,
+                "durationMs": round(self.duration * 1000, 2)
+            }
+        }).decode())
+
+
+def get_available_encodings(encodings: Iterable[str]) -> list[str]:
+    """
+    Filters ``encodings`` to those supported in the current environment.
+    """
+    available = list()
+
+    for encoding in map(str.strip, encodings):
+        if encoding == "br" and brotli is None:
+            continue
+        elif encoding == "zstd" and zstandard is None:
+            continue
+        elif encoding not in ENCODING_EXTENSIONS:
+            continue
+
+        available.append(encoding)
+
+    return available
+
+
+def negotiate_encoding(accept_encoding: Union[str, None],
+                       available: Iterable[str]) -> Union[str, None]:
+    """
+    Selects the best content encoding from ``available`` based
+    on the ``Accept-Encoding`` header of the request.
+
+    Returns ``None`` when the identity encoding is to be used.
+    """
+    if not accept_encoding:
+        return None
+
+    weights = dict()
+
+    for item in accept_encoding.split(","):
+        token, *params = item.strip().split(";")
+        token = token.strip().lower()
+
+        weight = 1.0
+        for param in params:
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    weight = float(value)
+                except ValueError:
+                    weight = 0.0
+
+        weights[token] = weight
+
+    wildcard = weights.get("*", 0.0)
+    candidates = [
+        (weights.get(encoding, wildcard), -ENCODING_PREFERENCE.index(encoding), encoding)
+        for encoding in available
+        if encoding in ENCODING_PREFERENCE
+    ]
+    candidates = [item for item in candidates if item[0] > 0]
+
+    if not candidates:
+        return None
+
+    return max(candidates)[2]
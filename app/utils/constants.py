@@ -204,7 +204,8 @@ FETCH FIRST 1 ROW ONLY""")
 SELECT MIN(id) AS id
 FROM covid19.area_reference
 WHERE area_type = $1
-GROUP BY area_code"""
+GROUP BY area_code
+ORDER BY id"""
 
     area_id_by_code_no_type = """\
 SELECT MIN(id) AS id
@@ -18,6 +18,7 @@ Contributors:  Pouria Hadjibagheri
 # Internal: 
 from .request import *
 from .response import *
+from .conditional import *
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Header
 __author__ = "Pouria Hadjibagheri"
@@ -0,0 +1,193 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from typing import NamedTuple, Union, Mapping
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from hashlib import blake2b
+
+# 3rd party:
+
+# Internal:
+from app.exceptions import RangeNotSatisfiable
+from ..assets import get_latest_timestamp
+from .request import Request
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+__all__ = [
+    'Validators',
+    'get_validators',
+    'is_not_modified',
+    'if_range_matches',
+    'parse_byte_range'
+]
+
+
+class Validators(NamedTuple):
+    """
+    Cache validators of a response.
+
+    The payload of a request is fully determined by its path - which
+    encodes the release, area, metrics and format - and the timestamp
+    of the release. A hash of the two therefore identifies the content
+    without it having to be generated or downloaded.
+    """
+    digest: str
+    last_modified: datetime
+
+    def get_etag(self, content_encoding: Union[str, None] = None) -> str:
+        # Each content encoding is a different representation
+        # and must therefore have a distinct strong ETag.
+        if content_encoding is None:
+            return f'"{self.digest}"'
+
+        return f'"{self.digest}-{content_encoding}"'
+
+    def get_headers(self, content_encoding: Union[str, None] = None) -> dict[str, str]:
+        return {
+            "ETag": self.get_etag(content_encoding),
+            "Last-Modified": format_datetime(self.last_modified, usegmt=True)
+        }
+
+
+async def get_validators(request: Request) -> Union[Validators, None]:
+    timestamp = await get_latest_timestamp(request)
+
+    # The release is yet to be published.
+    if timestamp is None:
+        return None
+
+    if timestamp.tzinfo is None:
+        timestamp = timestamp.replace(tzinfo=timezone.utc)
+
+    timestamp = timestamp.astimezone(timezone.utc)
+
+    digest = blake2b(
+        f"{request.path}:{timestamp.isoformat()}".encode(),
+        digest_size=16
+    ).hexdigest()
+
+    return Validators(digest=digest, last_modified=timestamp)
+
+
+def _parse_entity_tags(header: str) -> list[str]:
+    tags = list()
+
+    for tag in header.split(","):
+        tag = tag.strip().removeprefix("W/").strip('"')
+
+        if tag:
+            tags.append(tag)
+
+    return tags
+
+
+def is_not_modified(headers: Mapping[str, str], validators: Validators, exists: bool = False) -> bool:
+    """
+    Evaluates the ``If-None-Match`` and ``If-Modified-Since`` preconditions
+    as per RFC 7232. The latter is ignored when the former is present.
+
+    ETags are compared weakly - i.e. those of all content encodings
+    of the payload match. The wildcard only matches once the payload
+    is known to ``exist``.
+    """
+    if (if_none_match := headers.get("If-None-Match")) is not None:
+        for tag in _parse_entity_tags(if_none_match):
+            if (tag == "*" and exists) or tag.split("-", 1)[0] == validators.digest:
+                return True
+
+        return False
+
+    if (if_modified_since := headers.get("If-Modified-Since")) is None:
+        return False
+
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+
+    # HTTP dates have a resolution of one second.
+    return validators.last_modified.replace(microsecond=0) <= since
+
+
+def if_range_matches(headers: Mapping[str, str], validators: Union[Validators, None]) -> bool:
+    """
+    Evaluates the ``If-Range`` precondition of a range request. The
+    range must be ignored - and the full payload served - unless the
+    validator matches the current representation exactly.
+    """
+    if (if_range := headers.get("If-Range")) is None:
+        return True
+
+    if validators is None:
+        return False
+
+    if_range = if_range.strip()
+    if if_range.startswith('"'):
+        return if_range == validators.get_etag()
+
+    return if_range == validators.get_headers()["Last-Modified"]
+
+
+def parse_byte_range(header: Union[str, None], size: int) -> Union[tuple[int, int], None]:
+    """
+    Parses a single ``bytes`` range as per RFC 7233.
+
+    Parameters
+    ----------
+    header: Union[str, None]
+        Value of the ``Range`` header.
+
+    size: int
+        Size of the payload in bytes.
+
+    Returns
+    -------
+    Union[tuple[int, int], None]
+        First and last byte positions (inclusive) of the range, or ``None``
+        if the header is absent, malformed, or requests multiple ranges - in
+        which case the full payload is served.
+
+    Raises
+    ------
+    RangeNotSatisfiable
+        If the range does not overlap with the payload.
+    """
+    if header is None:
+        return None
+
+    unit, _, byte_range = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in byte_range:
+        return None
+
+    first, sep, last = byte_range.strip().partition("-")
+    if not sep:
+        return None
+
+    try:
+        if not first:
+            # Suffix range - e.g. the last 500 bytes.
+            suffix_length = int(last)
+            if suffix_length <= 0 or not size:
+                raise RangeNotSatisfiable(size=size)
+
+            return max(size - suffix_length, 0), size - 1
+
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+
+    if start >= size:
+        raise RangeNotSatisfiable(size=size)
+
+    if end < start:
+        return None
+
+    return start, min(end, size - 1)
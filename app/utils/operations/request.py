@@ -14,15 +14,18 @@ from hashlib import blake2b
 from starlette.datastructures import URL
 
 # Internal:
+from app.config import Settings
 from app.exceptions import InvalidQuery, BadRequest, StructureTooLarge, WeekendPublicationEnded
 from .. import constants as const
 from ..assets import RequestMethod, MetricData
 from ..formatters import json_formatter
+from ..compression import ENCODING_EXTENSIONS, get_available_encodings, negotiate_encoding
 
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 
 __all__ = [
-    'Request'
+    'Request',
+    'get_variant_path'
 ]
 
 
@@ -32,6 +35,27 @@ ENVIRONMENT = getenv("API_ENV", "PRODUCTION")
 
 LAST_WEEKEND = datetime(year=2022, month=2, day=20)
 
+FIRST_RECORD = date(year=2020, month=1, day=30)
+
+# Approximate number of areas per area type - used
+# to estimate the size of a response.
+AREA_TYPE_SIZES = {
+    "overview": 1,
+    "nation": 4,
+    "region": 9,
+    "nhsregion": 7,
+    "utla": 150,
+    "ltla": 310,
+    "nhstrust": 250,
+    "msoa": 6800,
+}
+
+# Approximate size of the base metrics (area code, name,
+# type, and date) and of each metric value in a record.
+BASE_RECORD_SIZE = 70
+METRIC_VALUE_SIZE = 12
+NESTED_RECORD_FACTOR = 20
+
 
 def to_chunks(iterable: list[Any], n_chunk: int) -> Iterator[list[Any]]:
     n_data = len(iterable)
@@ -40,6 +64,16 @@ def to_chunks(iterable: list[Any], n_chunk: int) -> Iterator[list[Any]]:
         yield iterable[index: index + n_chunk]
 
 
+def get_variant_path(path: str, encoding: Union[str, None] = None) -> str:
+    """
+    Path to the variant of a cached payload in ``encoding`` (``None`` for raw).
+    """
+    if encoding is None:
+        return path
+
+    return f"{path}.{ENCODING_EXTENSIONS[encoding]}"
+
+
 class Request:
     area_type: str
     release: date
@@ -60,7 +94,9 @@ class Request:
         'json': 'application/vnd.PHE-COVID19.v2+json; charset=utf-8',
         'jsonl': 'application/vnd.PHE-COVID19.v2+jsonl; charset=utf-8',
         'xml': 'application/vnd.PHE-COVID19.v1+json; charset=utf-8',
-        'csv': 'text/csv; charset=utf-8'
+        'csv': 'text/csv; charset=utf-8',
+        'arrow': 'application/vnd.apache.arrow.stream',
+        'parquet': 'application/vnd.apache.parquet'
     }
 
     def __init__(self, request, area_type: str, release: str, format: str, metric: Union[list[str], str],
@@ -69,11 +105,15 @@ class Request:
         self.area_type = area_type
         self.release = datetime.strptime(release[:10], "%Y-%m-%d").date()
         self.format = format.lower()
-        self.area_code = area_code
+        # Area codes are normalised into their canonical (upper) case.
+        self.area_code = (area_code or "").strip().upper() or None
         self.method = method
         self.url = url
         self.content_type = self._content_types_lookup[self.format]
 
+        # Cleared when the range does not apply to the current representation.
+        self.range_header = request.headers.get("Range") if request is not None else None
+
         if not area_type:
             raise InvalidQuery(
                 details=(
@@ -87,10 +127,16 @@ class Request:
             raise WeekendPublicationEnded(archive_date=self.release)
 
         if isinstance(metric, list) and len(metric) and ',' in metric[0]:
-            self.metric = metric[0].split(',')
-        elif isinstance(metric, list) and len(metric):
-            self.metric = metric
-        else:
+            metric = metric[0].split(',')
+        elif not isinstance(metric, list) or not len(metric):
+            raise InvalidQuery(details="Invalid metric. Must be one or more metric names.")
+
+        # Metrics are canonicalised so that permutations of the same
+        # request share a cache key - the payload does not depend on
+        # the order of the metrics.
+        self.metric = sorted(set(filter(None, map(str.strip, metric))))
+
+        if not self.metric:
             raise InvalidQuery(details="Invalid metric. Must be one or more metric names.")
 
         if (n_metric := len(self.metric)) > 5:
@@ -98,6 +144,14 @@ class Request:
 
         logger.info(dumps({"requestURL": str(url)}))
 
+    def __getstate__(self) -> dict[str, Any]:
+        # The underlying HTTP request is bound to the event loop
+        # and cannot be pickled - it is never needed by the
+        # processing and formatting stages.
+        state = self.__dict__.copy()
+        state['base_request'] = None
+        return state
+
     @property
     def path(self) -> str:
         if (path := getattr(self, '_path', None)) is not None:
@@ -123,6 +177,48 @@ class Request:
 
         return self._path
 
+    @property
+    def estimated_size(self) -> int:
+        """
+        Rough estimate of the payload size in bytes.
+        """
+        if self.area_code is not None:
+            n_areas = 1
+        else:
+            n_areas = AREA_TYPE_SIZES.get(self.area_type.lower(), max(AREA_TYPE_SIZES.values()))
+
+        n_days = max((self.release - FIRST_RECORD).days, 1)
+        record_size = BASE_RECORD_SIZE + METRIC_VALUE_SIZE * len(self.metric)
+
+        if self.nested_metrics:
+            record_size *= NESTED_RECORD_FACTOR
+
+        return n_areas * n_days * record_size
+
+    @property
+    def cache_encodings(self) -> list[str]:
+        """
+        Content encodings for the pre-compressed variants of the cached payload.
+        """
+        # Parquet is compressed internally.
+        if self.format == "parquet":
+            return list()
+
+        return get_available_encodings(Settings.cache_encodings)
+
+    def get_encoding(self, available: list[str]) -> Union[str, None]:
+        """
+        Negotiates the content encoding with the client from the ``available`` variants.
+        """
+        if self.base_request is None:
+            return None
+
+        accept_encoding = self.base_request.headers.get("Accept-Encoding")
+        return negotiate_encoding(accept_encoding, available)
+
+    def get_path(self, encoding: Union[str, None] = None) -> str:
+        return get_variant_path(self.path, encoding)
+
     @property
     def metric_tag(self) -> dict[str, str]:
         metrics = str.join(":", self.metric)
@@ -17,7 +17,8 @@ from .request import Request
 
 __all__ = [
     'Response',
-    "RedirectResponse"
+    "RedirectResponse",
+    "LocalFileResponse"
 ]
 
 
@@ -32,26 +33,66 @@ class RedirectResponse:
         'json': 'application/vnd.PHE-COVID19.v2+json; charset=utf-8',
         'jsonl': 'application/vnd.PHE-COVID19.v2+jsonl; charset=utf-8',
         'xml': 'application/vnd.PHE-COVID19.v1+json; charset=utf-8',
-        'csv': 'text/csv; charset=utf-8'
+        'csv': 'text/csv; charset=utf-8',
+        'arrow': 'application/vnd.apache.arrow.stream',
+        'parquet': 'application/vnd.apache.parquet'
     }
 
-    def __init__(self, request, container, path):
+    def __init__(self, request, container, path, permalink_path: Union[str, None] = None):
         host: str = request.base_request.headers.get("X-Forwarded-Host", API_URL)
         host = host.removeprefix("https://").removeprefix("api.")
 
         self.location = f"https://api.{host}/downloads/{container}/{path}"
 
-        permalink = f"https://{API_URL}/apiv2cache/{request.path}"
+        # Deduplicated payloads are held at the path of the
+        # payload of which they are an alias.
+        permalink = f"https://{API_URL}/apiv2cache/{permalink_path or request.path}"
 
-        headers = {
-            'Content-Type': self._content_types_lookup[request.format]
+        self.headers = {
+            'Content-Type': self._content_types_lookup[request.format],
+            "Cache-Control": "public, max-age=90, must-revalidate",
+            "Content-Location": permalink,
+            "Content-Language": "en-GB",
+            # Location depends on the encoding negotiated with the client.
+            "Vary": "Accept-Encoding"
         }
 
-        self.headers = headers.update({
+
+class LocalFileResponse:
+    """
+    Response served from a file in the host-local cache tier.
+    """
+    _content_types_lookup = RedirectResponse._content_types_lookup
+
+    def __init__(self, request, filename: str, path: str, size: int,
+                 content_encoding: Union[str, None] = None,
+                 permalink_path: Union[str, None] = None):
+        self.filename = filename
+        self.size = size
+        self.status_code = 200
+
+        permalink = f"https://{API_URL}/apiv2cache/{permalink_path or request.path}"
+        extension = request.format if request.format != "xml" else "json"
+
+        self.headers = {
+            'Content-Type': self._content_types_lookup[request.format],
+            'Content-Disposition': (
+                f'attachment; filename="{request.area_type}_{request.release:%Y-%m-%d}.{extension}"'
+            ),
             "Cache-Control": "public, max-age=90, must-revalidate",
             "Content-Location": permalink,
-            "Content-Language": "en-GB"
-        })
+            "Content-Language": "en-GB",
+            "Vary": "Accept-Encoding",
+            "Accept-Ranges": "bytes"
+        }
+
+        if content_encoding is not None:
+            self.headers["Content-Encoding"] = content_encoding
+
+        # Zero-copy delivery of the file by nginx.
+        self.accel_redirect = None
+        if Settings.local_cache_accel_prefix:
+            self.accel_redirect = f"{Settings.local_cache_accel_prefix.rstrip('/')}/{path}"
 
 
 class Response:
@@ -65,17 +106,25 @@ class Response:
         'json': 'application/vnd.PHE-COVID19.v2+json; charset=utf-8',
         'jsonl': 'application/vnd.PHE-COVID19.v2+jsonl; charset=utf-8',
         'xml': 'application/vnd.PHE-COVID19.v1+json; charset=utf-8',
-        'csv': 'text/csv; charset=utf-8'
+        'csv': 'text/csv; charset=utf-8',
+        'arrow': 'application/vnd.apache.arrow.stream',
+        'parquet': 'application/vnd.apache.parquet'
     }
 
     def __init__(self, content: ResponseContentType, status_code: int,
                  release_date: Union[date, None] = None, content_type: str = 'json',
-                 request: Union[Request, None] = None):
+                 request: Union[Request, None] = None, content_length: Union[int, None] = None,
+                 content_range: Union[tuple[int, int, int], None] = None, accept_ranges: bool = False,
+                 content_encoding: Union[str, None] = None):
         self._content = content
         self.status_code = status_code
         self._content_type = content_type
         self._request = request
         self._release_date = release_date
+        self._content_length = content_length
+        self._content_range = content_range
+        self._accept_ranges = accept_ranges
+        self._content_encoding = content_encoding
 
     @property
     async def latest_timestamp(self) -> Union[datetime, None]:
@@ -89,6 +138,20 @@ class Response:
             'Content-Type': self._content_types_lookup[self._content_type]
         }
 
+        if self._content_length is not None:
+            headers['Content-Length'] = str(self._content_length)
+
+        if self._accept_ranges:
+            headers['Accept-Ranges'] = 'bytes'
+
+        if self._content_encoding is not None:
+            headers['Content-Encoding'] = self._content_encoding
+            headers['Vary'] = 'Accept-Encoding'
+
+        if self._content_range is not None:
+            first, last, size = self._content_range
+            headers['Content-Range'] = f'bytes {first}-{last}/{size}'
+
         if self._content is not None:
             headers['Content-Disposition'] = (
                 f'attachment; filename="{self._request.area_type}_{self._release_date:%Y-%m-%d}.{self._content_type}"'
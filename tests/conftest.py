@@ -0,0 +1,37 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+import os
+import shutil
+from tempfile import mkdtemp
+
+# 3rd party:
+import pytest
+
+# Internal:
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+# Settings are read upon import, so the environment is set before the
+# app is imported: storage is on the file system, and the host-local
+# and in-memory cache tiers are disabled.
+_root = mkdtemp(prefix="apiv2-tests-")
+
+os.environ["STORAGE_BACKEND"] = "filesystem"
+os.environ["STORAGE_ROOT"] = os.path.join(_root, "storage")
+os.environ["SINGLE_FLIGHT_DIR"] = os.path.join(_root, "single_flight")
+os.environ["LOCAL_CACHE_SIZE"] = "0"
+os.environ["MEMORY_CACHE_SIZE"] = "0"
+
+
+@pytest.fixture
+def storage_root():
+    """
+    Root of the file system storage, which is emptied after the test.
+    """
+    yield os.environ["STORAGE_ROOT"]
+
+    shutil.rmtree(os.environ["STORAGE_ROOT"], ignore_errors=True)
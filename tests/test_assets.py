@@ -0,0 +1,70 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from asyncio import run
+from datetime import datetime
+from types import SimpleNamespace
+
+# 3rd party:
+import pytest
+
+# Internal:
+from app.config import Settings
+from app.utils import assets
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+REQUEST = SimpleNamespace(release="2021-01-04", area_type="ltla")
+
+
+@pytest.fixture
+def timestamps(monkeypatch):
+    """
+    Timestamps returned by the DB, in order - the number
+    of queries is given by the length of ``queried``.
+    """
+    pending = [datetime(2021, 1, 4, 16), datetime(2021, 1, 4, 18)]
+    queried = list()
+
+    class Connection:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *args):
+            pass
+
+        async def fetchval(self, query, *args):
+            queried.append(args)
+            return pending.pop(0)
+
+    monkeypatch.setattr(assets, "Connection", Connection)
+    monkeypatch.setattr(assets, "_release_timestamps", dict())
+
+    return queried
+
+
+def test_cached_within_ttl(timestamps, monkeypatch):
+    monkeypatch.setattr(Settings, "release_timestamp_ttl", 60)
+
+    async def main():
+        return [await assets.get_latest_timestamp(REQUEST) for _ in range(3)]
+
+    assert run(main()) == [datetime(2021, 1, 4, 16)] * 3
+    assert timestamps == [("2021-01-04", "MAIN")]
+
+
+def test_renewed_once_expired(timestamps, monkeypatch):
+    monkeypatch.setattr(Settings, "release_timestamp_ttl", 60)
+    now = [1000.0]
+    monkeypatch.setattr(assets, "time", lambda: now[0])
+
+    async def main():
+        first = await assets.get_latest_timestamp(REQUEST)
+        now[0] += 61
+        return first, await assets.get_latest_timestamp(REQUEST)
+
+    assert run(main()) == (datetime(2021, 1, 4, 16), datetime(2021, 1, 4, 18))
+    assert len(timestamps) == 2
@@ -0,0 +1,41 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+
+# 3rd party:
+
+# Internal:
+from app.engine.from_db.cache_index import BloomFilter
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+def test_no_false_negatives():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    paths = [f"2021-01-04/ltla/complete/{index:010x}.csv" for index in range(1000)]
+
+    for path in paths:
+        bloom.add(path)
+
+    assert all(path in bloom for path in paths)
+
+
+def test_false_positive_rate():
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+
+    for index in range(1000):
+        bloom.add(f"added/{index}")
+
+    false_positives = sum(f"missing/{index}" in bloom for index in range(10000))
+
+    # Well within an order of magnitude of the expected rate.
+    assert false_positives < 500
+
+
+def test_empty():
+    bloom = BloomFilter(capacity=0, error_rate=0.01)
+
+    assert "2021-01-04/ltla/complete/0000000000.csv" not in bloom
+    assert bloom.n_bits > 0 and bloom.n_hashes >= 1
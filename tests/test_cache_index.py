@@ -0,0 +1,97 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from asyncio import run
+
+# 3rd party:
+import pytest
+
+# Internal:
+from app.storage import AsyncStorageClient
+from app.engine.from_db.cache_index import CacheIndex
+from app.engine.from_db.utils import CacheEntry
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+RELEASE = "2021-01-04"
+PATH = f"{RELEASE}/ltla/complete/0123456789.csv"
+
+
+@pytest.fixture
+def probes(monkeypatch):
+    calls = list()
+    get_tags = AsyncStorageClient.get_tags
+
+    async def counted(self):
+        calls.append(self.path)
+        return await get_tags(self)
+
+    monkeypatch.setattr(AsyncStorageClient, "get_tags", counted)
+
+    return calls
+
+
+async def store(path: str, tags: dict[str, str]):
+    async with AsyncStorageClient("apiv2cache", path, compressed=False) as client:
+        await client.upload(b"payload")
+        await client.set_tags(tags)
+
+
+def make_index(max_size: int = 10) -> CacheIndex:
+    return CacheIndex(max_size=max_size, ttl=300, bloom_capacity=100, bloom_error_rate=0.01)
+
+
+def test_definite_miss_once_loaded(storage_root, probes):
+    index = make_index()
+
+    async def main():
+        await index.load(RELEASE)
+        return await index.lookup(PATH)
+
+    assert run(main()) is None
+    assert probes == list()
+
+
+def test_miss_probed_before_loading(storage_root, probes):
+    index = make_index()
+
+    async def main():
+        await store(PATH, {"done": "1", "in_progress": "0", "metrics": "newCasesByPublishDate"})
+        return await index.lookup(PATH), await index.lookup(PATH)
+
+    first, second = run(main())
+
+    assert first == second == CacheEntry(path=PATH, encodings=list(), size=None)
+    # The second lookup is served by the index.
+    assert probes == [PATH]
+
+
+def test_evicted_entry_probed_once(storage_root, probes):
+    index = make_index()
+
+    async def main():
+        await index.load(RELEASE)
+        index.add(PATH, CacheEntry(path=PATH, encodings=list()))
+        index.discard(PATH)
+
+        # Payload is being regenerated.
+        await store(PATH, {"done": "0", "in_progress": "1"})
+        return await index.lookup(PATH)
+
+    assert run(main()) is None
+    assert probes == [PATH]
+
+
+def test_disabled_index_probes(storage_root, probes):
+    index = make_index(max_size=0)
+
+    async def main():
+        await index.load(RELEASE)
+        await store(PATH, {"done": "1", "in_progress": "0"})
+        return await index.lookup(PATH)
+
+    assert run(main()) is not None
+    assert probes == [PATH]
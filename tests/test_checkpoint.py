@@ -0,0 +1,119 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from asyncio import run
+
+# 3rd party:
+import pytest
+
+# Internal:
+from app.utils.operations import Request
+from app.engine.from_db.checkpoint import Fragment, GenerationCheckpoint
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+CHUNKS = [(0, b"header\nrow-0\n"), (2, b"row-2\n"), (3, b"row-3\n"), (5, b"row-5\n")]
+
+
+class Interrupted(Exception):
+    pass
+
+
+def make_request() -> Request:
+    return Request(
+        request=None,
+        area_code=None,
+        area_type="ltla",
+        release="2021-01-04",
+        format="csv",
+        metric=["newCasesByPublishDate"],
+        method="GET",
+        url=None
+    )
+
+
+async def generate(*, start: int = 0, fail_after: int = None):
+    produced = 0
+
+    for index, item in CHUNKS:
+        if index < start:
+            continue
+
+        if fail_after is not None and produced == fail_after:
+            raise Interrupted()
+
+        yield index, item
+        produced += 1
+
+
+async def consume(checkpoint: GenerationCheckpoint, **kwargs) -> list:
+    return [item async for item in checkpoint.wrap(generate)(**kwargs)]
+
+
+def test_list_contiguous_fragments(storage_root):
+    checkpoint = GenerationCheckpoint(make_request())
+
+    async def main():
+        for sequence, index in [(0, 0), (1, 2), (3, 5)]:
+            await checkpoint.save(sequence, index, b"item")
+
+        return await checkpoint.list()
+
+    # Fragment 2 is missing, so those that follow cannot be replayed.
+    assert run(main()) == [
+        Fragment(0, 0, checkpoint.get_name(0, 0)),
+        Fragment(1, 2, checkpoint.get_name(1, 2)),
+    ]
+
+
+def test_list_without_first_fragment(storage_root):
+    checkpoint = GenerationCheckpoint(make_request())
+
+    async def main():
+        await checkpoint.save(1, 2, b"item")
+        return await checkpoint.list()
+
+    assert run(main()) == list()
+
+
+def test_resumed_generation_is_identical(storage_root):
+    request = make_request()
+    interrupted = GenerationCheckpoint(request)
+
+    async def interrupt():
+        try:
+            await consume(interrupted, fail_after=2)
+        finally:
+            # Uploads outlive the generation in the server.
+            await interrupted.wait_for_uploads()
+
+    with pytest.raises(Interrupted):
+        run(interrupt())
+
+    checkpoint = GenerationCheckpoint(request)
+
+    async def main():
+        fragments = await checkpoint.list()
+        return fragments, await consume(checkpoint)
+
+    fragments, resumed = run(main())
+
+    assert [fragment.index for fragment in fragments] == [0, 2]
+    assert resumed == CHUNKS
+    assert len(checkpoint.names) == len(CHUNKS)
+
+
+def test_clear(storage_root):
+    checkpoint = GenerationCheckpoint(make_request())
+
+    async def main():
+        await consume(checkpoint)
+        await checkpoint.clear()
+
+        return await checkpoint.list()
+
+    assert run(main()) == list()
+    assert checkpoint.names == list()
@@ -0,0 +1,165 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from asyncio import run, gather, sleep
+
+# 3rd party:
+import pytest
+
+# Internal:
+from app.utils.operations import Request
+from app.engine.from_db.coalescer import FetchCoalescer, get_area_ids
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+CODES = [(1,), (2,)]
+
+
+class FakeConnection:
+    """
+    Returns a record per metric and area, after ``delay`` seconds.
+    """
+    def __init__(self, calls: list, delay: float = 0.05, error: Exception = None):
+        self.calls = calls
+        self.delay = delay
+        self.error = error
+
+    async def fetch(self, query, metrics, area_type, codes):
+        self.calls.append(sorted(metrics))
+        await sleep(self.delay)
+
+        if self.error is not None:
+            raise self.error
+
+        return [
+            {"metric": metric, "area_id": area_id}
+            for metric in sorted(metrics)
+            for area_id in get_area_ids(codes)
+        ]
+
+
+def make_request(*metrics: str) -> Request:
+    return Request(
+        request=None,
+        area_code=None,
+        area_type="ltla",
+        release="2021-01-04",
+        format="csv",
+        metric=list(metrics),
+        method="GET",
+        url=None
+    )
+
+
+def get_metrics(rows: list) -> set[str]:
+    return {row["metric"] for row in rows}
+
+
+def test_get_area_ids():
+    assert get_area_ids(CODES) == (1, 2)
+    assert get_area_ids((1,)) == (1,)
+
+
+def test_uncontended_fetch_is_not_delayed():
+    calls = list()
+    coalescer = FetchCoalescer(window=10)
+
+    async def main():
+        return await coalescer.fetch(FakeConnection(calls), make_request("newCasesByPublishDate"), CODES)
+
+    rows = run(main())
+
+    assert calls == [["newCasesByPublishDate"]]
+    assert get_metrics(rows) == {"newCasesByPublishDate"}
+
+
+def test_contended_fetches_are_coalesced_and_split():
+    calls = list()
+    coalescer = FetchCoalescer(window=0.02)
+    first = make_request("newCasesByPublishDate")
+    second = make_request("newDeaths28DaysByPublishDate")
+    third = make_request("cumCasesByPublishDate", "newDeaths28DaysByPublishDate")
+
+    async def main():
+        async def fetch(request):
+            return await coalescer.fetch(FakeConnection(calls), request, CODES)
+
+        # The first fetch is issued immediately, and the
+        # others - arriving while it is in flight - are batched.
+        leader = fetch(first)
+        await sleep(0)
+
+        return await gather(leader, fetch(second), fetch(third))
+
+    first_rows, second_rows, third_rows = run(main())
+
+    assert calls == [
+        ["newCasesByPublishDate"],
+        ["cumCasesByPublishDate", "newDeaths28DaysByPublishDate"]
+    ]
+    assert get_metrics(first_rows) == {"newCasesByPublishDate"}
+    assert get_metrics(second_rows) == {"newDeaths28DaysByPublishDate"}
+    assert get_metrics(third_rows) == {"cumCasesByPublishDate", "newDeaths28DaysByPublishDate"}
+    assert len(third_rows) == 2 * len(CODES)
+    assert not coalescer._batches and not coalescer._in_flight
+
+
+def test_waiters_fetch_on_their_own_when_batch_fails():
+    calls = list()
+    coalescer = FetchCoalescer(window=0.02)
+
+    async def main():
+        failing = FakeConnection(calls, error=ValueError("failed"))
+
+        leader = coalescer.fetch(FakeConnection(calls), make_request("newCasesByPublishDate"), CODES)
+        await sleep(0)
+
+        return await gather(
+            leader,
+            coalescer.fetch(failing, make_request("cumCasesByPublishDate"), CODES),
+            coalescer.fetch(FakeConnection(calls), make_request("newDeaths28DaysByPublishDate"), CODES),
+            return_exceptions=True
+        )
+
+    _, batch_leader, waiter = run(main())
+
+    assert isinstance(batch_leader, ValueError)
+    assert get_metrics(waiter) == {"newDeaths28DaysByPublishDate"}
+    assert calls[-1] == ["newDeaths28DaysByPublishDate"]
+
+
+def test_not_coalesced_without_window():
+    calls = list()
+    coalescer = FetchCoalescer(window=0)
+
+    async def main():
+        return await gather(
+            coalescer.fetch(FakeConnection(calls), make_request("newCasesByPublishDate"), CODES),
+            coalescer.fetch(FakeConnection(calls), make_request("cumCasesByPublishDate"), CODES),
+        )
+
+    run(main())
+
+    assert sorted(calls) == [["cumCasesByPublishDate"], ["newCasesByPublishDate"]]
+
+
+@pytest.mark.parametrize("window", [0, 0.02])
+def test_different_chunks_are_not_coalesced(window):
+    calls = list()
+    coalescer = FetchCoalescer(window=window)
+    request = make_request("newCasesByPublishDate")
+
+    async def main():
+        return await gather(
+            coalescer.fetch(FakeConnection(calls), request, [(1,)]),
+            coalescer.fetch(FakeConnection(calls), request, [(2,)]),
+        )
+
+    first_rows, second_rows = run(main())
+
+    assert len(calls) == 2
+    assert [row["area_id"] for row in first_rows] == [1]
+    assert [row["area_id"] for row in second_rows] == [2]
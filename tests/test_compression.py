@@ -0,0 +1,38 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+
+# 3rd party:
+import pytest
+
+# Internal:
+from app.utils.compression import negotiate_encoding
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+@pytest.mark.parametrize("accept_encoding, available, expected", [
+    (None, ["gzip"], None),
+    ("", ["gzip"], None),
+    ("gzip", ["gzip"], "gzip"),
+    ("gzip", list(), None),
+    ("GZip", ["gzip"], "gzip"),
+    # Server preference breaks the ties.
+    ("gzip, br", ["gzip", "br"], "br"),
+    ("gzip, zstd", ["gzip", "zstd"], "zstd"),
+    # Client weights take precedence.
+    ("gzip;q=1.0, br;q=0.5", ["gzip", "br"], "gzip"),
+    ("br;q=0, gzip", ["gzip", "br"], "gzip"),
+    ("gzip;q=0", ["gzip"], None),
+    ("gzip;q=invalid", ["gzip"], None),
+    # Wildcard applies to the encodings that are not listed.
+    ("*", ["gzip"], "gzip"),
+    ("*;q=0, gzip", ["gzip", "br"], "gzip"),
+    ("deflate", ["gzip"], None),
+    # Unsupported encodings are never selected.
+    ("compress", ["compress"], None),
+])
+def test_negotiate_encoding(accept_encoding, available, expected):
+    assert negotiate_encoding(accept_encoding, available) == expected
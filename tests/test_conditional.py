@@ -0,0 +1,82 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from datetime import datetime, timezone
+
+# 3rd party:
+import pytest
+
+# Internal:
+from app.exceptions import RangeNotSatisfiable
+from app.utils.operations.conditional import Validators, is_not_modified, parse_byte_range
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+validators = Validators(
+    digest="0123456789abcdef",
+    last_modified=datetime(2021, 1, 4, 16, 0, 0, 500000, tzinfo=timezone.utc)
+)
+
+
+@pytest.mark.parametrize("header, size, expected", [
+    (None, 100, None),
+    ("bytes=0-9", 100, (0, 9)),
+    ("bytes=90-", 100, (90, 99)),
+    ("bytes=90-200", 100, (90, 99)),
+    ("bytes=-10", 100, (90, 99)),
+    ("bytes=-200", 100, (0, 99)),
+    ("bytes=10-5", 100, None),
+    ("bytes=0-9,20-29", 100, None),
+    ("items=0-9", 100, None),
+    ("bytes=a-b", 100, None),
+    ("bytes=10", 100, None),
+])
+def test_parse_byte_range(header, size, expected):
+    assert parse_byte_range(header, size) == expected
+
+
+@pytest.mark.parametrize("header, size", [
+    ("bytes=100-", 100),
+    ("bytes=-0", 100),
+    ("bytes=-10", 0),
+])
+def test_parse_byte_range_not_satisfiable(header, size):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_byte_range(header, size)
+
+
+@pytest.mark.parametrize("header, exists, expected", [
+    ('"0123456789abcdef"', False, True),
+    ('W/"0123456789abcdef"', False, True),
+    ('"0123456789abcdef-gzip"', False, True),
+    ('"other", "0123456789abcdef-br"', False, True),
+    ('"other"', False, False),
+    ("*", False, False),
+    ("*", True, True),
+])
+def test_is_not_modified_if_none_match(header, exists, expected):
+    assert is_not_modified({"If-None-Match": header}, validators, exists=exists) is expected
+
+
+@pytest.mark.parametrize("header, expected", [
+    # Fraction of a second is ignored.
+    ("Mon, 04 Jan 2021 16:00:00 GMT", True),
+    ("Mon, 04 Jan 2021 17:00:00 GMT", True),
+    ("Mon, 04 Jan 2021 15:59:59 GMT", False),
+    ("not a date", False),
+])
+def test_is_not_modified_if_modified_since(header, expected):
+    assert is_not_modified({"If-Modified-Since": header}, validators) is expected
+
+
+def test_if_none_match_takes_precedence():
+    headers = {
+        "If-None-Match": '"other"',
+        "If-Modified-Since": "Mon, 04 Jan 2021 17:00:00 GMT"
+    }
+
+    assert not is_not_modified(headers, validators)
+    assert not is_not_modified(dict(), validators)
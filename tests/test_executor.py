@@ -0,0 +1,148 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from asyncio import run, gather
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import date
+from threading import Lock
+import pickle
+
+# 3rd party:
+import pytest
+
+# Internal:
+from app.config import Settings
+from app.utils.assets import MetricData
+from app.utils.operations import Request
+from app.engine.from_db import executor
+from app.engine.from_db.executor import get_executor, process_records, run_formatter, shutdown_executor
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+COLUMNS = [*MetricData.base_metrics, "metric", "value"]
+
+ROWS = [
+    ("nation", "E92000001", "England", date(2021, 1, 2), "newCasesByPublishDate", 5),
+    ("nation", "N92000002", "Northern Ireland", date(2021, 1, 3), "cumCasesByPublishDate", 9),
+    ("nation", "E92000001", "England", date(2021, 1, 3), "newCasesByPublishDate", 7),
+]
+
+
+class FakeRecord(tuple):
+    """
+    DB record with the interface of ``asyncpg.Record`` used by ``run_formatter``.
+    """
+    def keys(self):
+        return COLUMNS
+
+
+def make_request(**kwargs) -> Request:
+    return Request(
+        **{
+            "request": None,
+            "area_code": None,
+            "area_type": "nation",
+            "release": "2021-01-04",
+            "format": "csv",
+            "metric": ["newCasesByPublishDate", "cumCasesByPublishDate"],
+            "method": "GET",
+            "url": None,
+            **kwargs
+        }
+    )
+
+
+@pytest.fixture
+def executor_type(monkeypatch):
+    def set_type(value: str):
+        monkeypatch.setattr(Settings, "format_executor", value)
+
+    shutdown_executor()
+    yield set_type
+    shutdown_executor()
+
+
+def test_get_executor_process(executor_type):
+    executor_type("process")
+    pool = get_executor()
+
+    assert isinstance(pool, ProcessPoolExecutor)
+    assert pool._mp_context.get_start_method() == "spawn"
+    # Executor is created once per worker.
+    assert get_executor() is pool
+
+
+def test_get_executor_thread(executor_type):
+    executor_type("Thread")
+
+    assert isinstance(get_executor(), ThreadPoolExecutor)
+
+
+def test_get_executor_inline(executor_type):
+    executor_type("inline")
+
+    assert get_executor() is None
+
+
+def test_get_executor_invalid(executor_type):
+    executor_type("fibre")
+
+    with pytest.raises(ValueError):
+        get_executor()
+
+
+def test_process_records_order():
+    payload = process_records(COLUMNS, ROWS, make_request(), include_header=True)
+
+    # Records are ordered by date (descending), then by area code.
+    assert payload.decode().splitlines() == [
+        "areaCode,areaName,areaType,date,cumCasesByPublishDate,newCasesByPublishDate",
+        "E92000001,England,nation,2021-01-03,,7",
+        "N92000002,Northern Ireland,nation,2021-01-03,9,",
+        "E92000001,England,nation,2021-01-02,,5",
+    ]
+
+
+def test_process_records_without_header():
+    with_header = process_records(COLUMNS, ROWS, make_request(), include_header=True)
+    without_header = process_records(COLUMNS, ROWS, make_request(), include_header=False)
+
+    assert with_header.split(b"\n", 1)[1] == without_header
+
+
+@pytest.mark.parametrize("value", ["inline", "thread", "process"])
+def test_run_formatter(executor_type, value):
+    executor_type(value)
+
+    # The underlying HTTP request cannot be pickled.
+    request = make_request(request=None)
+    request.base_request = Lock()
+
+    chunks = [[FakeRecord(row)] for row in ROWS]
+
+    async def main():
+        return await gather(*(
+            run_formatter(records, request, include_header=False)
+            for records in chunks
+        ))
+
+    # Results are returned in the order of the chunks.
+    assert run(main()) == [
+        process_records(COLUMNS, records, make_request(), include_header=False)
+        for records in chunks
+    ]
+
+
+def test_request_pickles_without_base_request():
+    request = make_request()
+    request.base_request = Lock()
+
+    restored = pickle.loads(pickle.dumps(request))
+
+    assert restored.base_request is None
+    assert restored.path == request.path
+    assert restored.metric == request.metric
+    assert request.base_request is not None
@@ -0,0 +1,35 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from asyncio import run
+
+# 3rd party:
+import pytest
+from azure.core.exceptions import ResourceNotFoundError
+
+# Internal:
+from app.storage import AsyncStorageClient
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+def test_get_tags(storage_root):
+    async def main():
+        async with AsyncStorageClient("apiv2cache", "2021-01-04/blob.csv") as client:
+            await client.upload(b"data")
+            await client.set_tags({"done": "1"})
+            return await client.get_tags()
+
+    assert run(main()) == {"done": "1"}
+
+
+def test_get_tags_not_found(storage_root):
+    async def main():
+        async with AsyncStorageClient("apiv2cache", "2021-01-04/missing.csv") as client:
+            return await client.get_tags()
+
+    # As is the case on Azure.
+    with pytest.raises(ResourceNotFoundError):
+        run(main())
@@ -0,0 +1,172 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from asyncio import run, gather
+from datetime import datetime
+
+# 3rd party:
+import pytest
+
+# Internal:
+from app.utils.operations import Request
+from app.engine.from_db import fragments
+from app.engine.from_db.fragments import FragmentRecord, FragmentStore
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+CODES = [(1,), (2,)]
+COLUMNS = ("areaCode", "date", "metric", "value")
+DATES = ["2021-01-04", "2021-01-03", "2021-01-02"]
+
+
+class FakeConnection:
+    """
+    Returns records for each of the requested metrics except
+    those in ``empty``, ordered by date as they are by the DB.
+    """
+    def __init__(self, empty: set = frozenset()):
+        self.calls = list()
+        self.empty = empty
+
+    async def fetch(self, query, metrics, area_type, codes):
+        self.calls.append(sorted(metrics))
+
+        return [
+            FragmentRecord(COLUMNS, (f"E{area_id}", day, metric, len(metric)))
+            for day in DATES
+            for metric in sorted(metrics)
+            for area_id in (1, 2)
+            if metric not in self.empty
+        ]
+
+
+def make_request(*metrics: str, area_type: str = "ltla") -> Request:
+    return Request(
+        request=None,
+        area_code=None,
+        area_type=area_type,
+        release="2021-01-04",
+        format="csv",
+        metric=list(metrics),
+        method="GET",
+        url=None
+    )
+
+
+@pytest.fixture
+def published(monkeypatch):
+    async def get_latest_timestamp(request):
+        return datetime(2021, 1, 4, 16)
+
+    monkeypatch.setattr(fragments, "get_latest_timestamp", get_latest_timestamp)
+
+
+@pytest.fixture
+def unpublished(monkeypatch):
+    async def get_latest_timestamp(request):
+        return None
+
+    monkeypatch.setattr(fragments, "get_latest_timestamp", get_latest_timestamp)
+
+
+async def fetch(store: FragmentStore, conn: FakeConnection, request: Request) -> list:
+    records = await store.fetch(conn, request, CODES)
+    await gather(*store._pending)
+
+    return records
+
+
+def test_record():
+    record = FragmentRecord(COLUMNS, ("E1", "2021-01-04", "newCasesByPublishDate", 1))
+
+    assert record.keys() == COLUMNS
+    assert record["metric"] == record[2] == "newCasesByPublishDate"
+    assert tuple(record) == ("E1", "2021-01-04", "newCasesByPublishDate", 1)
+
+
+def test_is_applicable():
+    store = FragmentStore(enabled=True)
+
+    assert store.is_applicable(make_request("newCasesByPublishDate"))
+    assert not store.is_applicable(make_request("newCasesByPublishDate", area_type="msoa"))
+    assert not FragmentStore(enabled=False).is_applicable(make_request("newCasesByPublishDate"))
+
+
+def test_assembly_order(storage_root, published):
+    store = FragmentStore(enabled=True)
+    request = make_request("newCasesByPublishDate", "cumCasesByPublishDate")
+
+    async def main():
+        # Only the cell of one of the metrics is stored.
+        await fetch(store, FakeConnection(), make_request("newCasesByPublishDate"))
+
+        conn = FakeConnection()
+        records = await fetch(store, conn, request)
+
+        return conn.calls, records
+
+    calls, records = run(main())
+
+    assert calls == [["cumCasesByPublishDate"]]
+
+    # Records are ordered by date, then by the order of the metrics of the request.
+    assert [(record["date"], record["metric"]) for record in records] == [
+        (day, metric)
+        for day in DATES
+        for metric in request.metric
+        for _ in CODES
+    ]
+
+
+def test_cells_are_reused(storage_root, published):
+    store = FragmentStore(enabled=True)
+    request = make_request("newCasesByPublishDate", "cumCasesByPublishDate")
+
+    async def main():
+        first = await fetch(store, FakeConnection(), request)
+
+        conn = FakeConnection()
+        second = await fetch(store, conn, request)
+
+        return conn.calls, first, second
+
+    calls, first, second = run(main())
+
+    assert calls == list()
+    assert [tuple(record) for record in second] == [tuple(record) for record in first]
+
+
+def test_unpublished_cells_are_not_stored(storage_root, unpublished):
+    store = FragmentStore(enabled=True)
+    request = make_request("newCasesByPublishDate")
+
+    async def main():
+        await fetch(store, FakeConnection(), request)
+
+        conn = FakeConnection()
+        await fetch(store, conn, request)
+
+        return conn.calls
+
+    assert run(main()) == [["newCasesByPublishDate"]]
+
+
+def test_empty_cells_are_not_stored(storage_root, published):
+    store = FragmentStore(enabled=True)
+    request = make_request("newCasesByPublishDate", "cumCasesByPublishDate")
+
+    async def main():
+        await fetch(store, FakeConnection(empty={"cumCasesByPublishDate"}), request)
+
+        conn = FakeConnection()
+        records = await fetch(store, conn, request)
+
+        return conn.calls, records
+
+    calls, records = run(main())
+
+    assert calls == [["cumCasesByPublishDate"]]
+    assert {record["metric"] for record in records} == {"newCasesByPublishDate", "cumCasesByPublishDate"}
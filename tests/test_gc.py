@@ -0,0 +1,134 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from datetime import date, datetime, timezone
+import subprocess
+import sys
+
+# 3rd party:
+
+# Internal:
+from app.engine.from_db.gc import CacheCollector, CacheEntryBlobs, get_entry_path
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+def make_entry(path: str, size: int = 10, accessed: int = 1, **kwargs) -> CacheEntryBlobs:
+    return CacheEntryBlobs(
+        path=path,
+        release=date.fromisoformat(path.split("/", 1)[0]),
+        names=[path],
+        size=size,
+        last_accessed=datetime(2021, 1, 4, accessed, tzinfo=timezone.utc),
+        **kwargs
+    )
+
+
+def select(collector: CacheCollector, *entries: CacheEntryBlobs) -> set[str]:
+    return {entry.path for entry in collector.select({entry.path: entry for entry in entries})}
+
+
+def test_get_entry_path():
+    assert get_entry_path("2021-01-04/ltla/complete/a.csv") == ("2021-01-04/ltla/complete/a.csv", False)
+    assert get_entry_path("2021-01-04/ltla/complete/a.csv.gz") == ("2021-01-04/ltla/complete/a.csv", True)
+    assert get_entry_path("2021-01-04/ltla/complete/a.csv.parts/000000-000000") == (
+        "2021-01-04/ltla/complete/a.csv", True
+    )
+
+
+def test_select_empty():
+    assert CacheCollector(retention_days=7, max_bytes=0).select(dict()) == list()
+
+
+def test_select_expired():
+    collector = CacheCollector(retention_days=7, max_bytes=0)
+
+    selected = select(
+        collector,
+        make_entry("2021-01-18/ltla/complete/a.csv"),
+        make_entry("2021-01-11/ltla/complete/b.csv"),
+        make_entry("2021-01-08/ltla/complete/c.csv"),
+        make_entry("2021-01-08/objects/0123", auxiliary=True),
+    )
+
+    # Auxiliary blobs expire with their release.
+    assert selected == {"2021-01-08/ltla/complete/c.csv", "2021-01-08/objects/0123"}
+    assert collector.stats["expired"] == 2
+
+
+def test_select_least_recently_used():
+    collector = CacheCollector(retention_days=7, max_bytes=25)
+
+    selected = select(
+        collector,
+        make_entry("2021-01-18/ltla/complete/a.csv", accessed=3),
+        make_entry("2021-01-18/ltla/complete/b.csv", accessed=1),
+        make_entry("2021-01-18/ltla/complete/c.csv", accessed=2),
+    )
+
+    assert selected == {"2021-01-18/ltla/complete/b.csv"}
+    assert collector.stats["evicted"] == 1
+
+
+def test_select_removes_aliases_with_target():
+    collector = CacheCollector(retention_days=7, max_bytes=15)
+    target = "2021-01-18/ltla/complete/a.csv"
+
+    selected = select(
+        collector,
+        make_entry(target, accessed=1),
+        make_entry("2021-01-18/ltla/complete/b.csv", size=0, accessed=3, alias=target),
+        make_entry("2021-01-18/ltla/complete/c.csv", accessed=2),
+    )
+
+    # Removing the target frees enough space for the rest to be retained.
+    assert selected == {target, "2021-01-18/ltla/complete/b.csv"}
+
+
+def test_select_protected():
+    collector = CacheCollector(retention_days=7, max_bytes=5)
+    target = "2021-01-18/ltla/complete/a.csv"
+
+    selected = select(
+        collector,
+        make_entry(target, accessed=1),
+        # Target is retained with its alias, which is in use.
+        make_entry("2021-01-18/ltla/complete/b.csv", size=0, accessed=3, alias=target, protected=True),
+        make_entry("2021-01-18/ltla/complete/c.csv", accessed=2, protected=True),
+        make_entry("2021-01-18/ltla/complete/d.csv", accessed=4),
+    )
+
+    # The target, the alias itself, and the payload in progress.
+    assert selected == {"2021-01-18/ltla/complete/d.csv"}
+    assert collector.stats["protected"] == 3
+
+
+def test_select_retains_auxiliary_within_retention():
+    collector = CacheCollector(retention_days=7, max_bytes=5)
+
+    selected = select(
+        collector,
+        make_entry("2021-01-18/objects/0123", accessed=1, auxiliary=True),
+        make_entry("2021-01-18/not_available/0123", accessed=1, auxiliary=True),
+        make_entry("2021-01-18/ltla/complete/a.csv", accessed=2),
+    )
+
+    assert selected == {"2021-01-18/ltla/complete/a.csv"}
+
+
+def test_cli_without_engine():
+    # The CLI only needs the storage and the settings.
+    code = (
+        "import sys, runpy; sys.argv = ['gc', '--help']\n"
+        "try: runpy.run_module('app.engine.from_db.gc', run_name='__main__')\n"
+        "except SystemExit: pass\n"
+        "print(sorted(name for name in sys.modules if name.startswith('app.')))"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True)
+    modules = result.stdout.splitlines()[-1]
+
+    assert "app.storage" in modules
+    assert "app.engine.from_db.base" not in modules
+    assert "app.main" not in modules
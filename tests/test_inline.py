@@ -0,0 +1,66 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from asyncio import run
+import gzip
+
+# 3rd party:
+from starlette.datastructures import URL
+
+# Internal:
+from app.storage import AsyncStorageClient, MemoryCache
+from app.utils.operations import Request
+from app.engine.from_db import base
+from app.engine.from_db.utils import cache_response
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+PAYLOAD = b"areaCode,date,newCasesByPublishDate\nE1,2021-01-04,1\nE2,2021-01-04,2\n"
+
+
+def make_request() -> Request:
+    return Request(
+        request=None,
+        area_code=None,
+        area_type="ltla",
+        release="2021-01-04",
+        format="csv",
+        metric=["newCasesByPublishDate"],
+        method="GET",
+        url=URL("https://localhost/api/v2/data?areaType=ltla&metric=newCasesByPublishDate&format=csv")
+    )
+
+
+async def generate(*, request: Request):
+    yield 0, PAYLOAD
+
+
+def test_gzip_variant_round_trip(storage_root, monkeypatch):
+    monkeypatch.setattr(base, "memory_cache", MemoryCache(max_size=1024 ** 2))
+    request = make_request()
+    path = request.get_path("gzip")
+
+    async def main():
+        entry = await cache_response(generate, request=request)
+
+        # Stored with its content encoding, and decoded on download by default.
+        async with AsyncStorageClient("apiv2cache", path) as client:
+            decoded = await (await client.download()).readall()
+
+        served = await base.serve_inline(request, path, "gzip", entry.etag)
+        from_memory = await base.serve_inline(request, path, "gzip", entry.etag)
+
+        return entry, decoded, served, from_memory
+
+    entry, decoded, served, from_memory = run(main())
+
+    assert "gzip" in entry.encodings
+    assert decoded == PAYLOAD
+
+    for response in [served, from_memory]:
+        assert response.headers["Content-Encoding"] == "gzip"
+        assert gzip.decompress(response.content) == PAYLOAD
+        assert int(response.headers["Content-Length"]) == len(response.content)
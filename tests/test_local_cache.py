@@ -0,0 +1,94 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from asyncio import run
+import errno
+import os
+import shutil
+
+# 3rd party:
+import pytest
+
+# Internal:
+from app.storage import AsyncStorageClient, LocalCache, LocalCacheWriter
+from app.utils.operations import Request
+from app.engine.from_db import utils
+from app.engine.from_db.utils import cache_response
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+PAYLOAD = b"areaCode,date,newCasesByPublishDate\nE1,2021-01-04,1\nE2,2021-01-04,2\n"
+
+
+def make_request() -> Request:
+    return Request(
+        request=None,
+        area_code=None,
+        area_type="ltla",
+        release="2021-01-04",
+        format="csv",
+        metric=["newCasesByPublishDate"],
+        method="GET",
+        url=None
+    )
+
+
+async def generate(*, request: Request):
+    yield 0, PAYLOAD
+
+
+def no_space(*args, **kwargs):
+    raise OSError(errno.ENOSPC, "No space left on device")
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    cache = LocalCache(str(tmp_path / "local"), 1024 ** 2)
+    monkeypatch.setattr(utils, "local_cache", cache)
+    return cache
+
+
+def test_budget_capped_to_file_system(tmp_path):
+    cache = LocalCache(str(tmp_path), 2 ** 60)
+
+    assert cache.enabled
+    assert cache.max_size == shutil.disk_usage(tmp_path).total // 2
+
+
+def test_cached_locally(storage_root, cache):
+    request = make_request()
+
+    async def main():
+        await cache_response(generate, request=request)
+        return await cache.get(request.path)
+
+    entry = run(main())
+
+    assert entry is not None
+    assert entry.size == len(PAYLOAD)
+
+
+@pytest.mark.parametrize("method", ["_commit", "write"])
+def test_local_failure_keeps_upload(storage_root, cache, monkeypatch, method):
+    monkeypatch.setattr(LocalCacheWriter, method, no_space)
+    request = make_request()
+
+    async def main():
+        entry = await cache_response(generate, request=request)
+
+        async with AsyncStorageClient("apiv2cache", request.path) as client:
+            stored = await (await client.download()).readall()
+
+        return entry, stored, await cache.get(request.path)
+
+    entry, stored, local_entry = run(main())
+
+    assert entry is not None
+    assert stored == PAYLOAD
+    assert local_entry is None
+
+    # Temporary files of the dropped writers are removed.
+    assert os.listdir(os.path.join(cache.root, ".tmp")) in [[], ["size"]]
@@ -0,0 +1,80 @@
+#!/usr/bin python3
+
+# Imports
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+# Python:
+from asyncio import run, sleep
+
+# 3rd party:
+import pytest
+
+# Internal:
+from app.config import Settings
+from app.utils.operations import Request
+from app.engine.from_db import base
+
+# ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
+
+
+CHUNKS = [
+    (0, b"areaCode,date,newCasesByPublishDate\nE1,2021-01-04,1\n"),
+    (1, b"E2,2021-01-04,2\n"),
+    (2, b"E3,2021-01-04,3\n"),
+]
+
+
+def make_request() -> Request:
+    return Request(
+        request=None,
+        area_code=None,
+        area_type="ltla",
+        release="2021-01-04",
+        format="csv",
+        metric=["newCasesByPublishDate"],
+        method="GET",
+        url=None
+    )
+
+
+@pytest.fixture
+def cached(monkeypatch):
+    """
+    Payloads passed on to be cached in the background.
+    """
+    payloads = list()
+
+    async def process_get_request(*, request: Request, **kwargs):
+        for item in CHUNKS:
+            yield item
+
+    async def cache_in_background(request: Request, payload):
+        payloads.append(payload)
+
+    monkeypatch.setattr(base, "process_get_request", process_get_request)
+    monkeypatch.setattr(base, "cache_in_background", cache_in_background)
+
+    return payloads
+
+
+async def consume(request: Request) -> bytes:
+    response = await base.stream_response(request)
+    content = b"".join([chunk async for chunk in response.content])
+
+    # Lets the background task run.
+    await sleep(0)
+
+    return content
+
+
+@pytest.mark.parametrize("buffer_size, n_cached", [(1024 ** 2, 1), (64, 0)])
+def test_buffer_size(cached, monkeypatch, buffer_size, n_cached):
+    monkeypatch.setattr(Settings, "direct_stream_buffer_size", buffer_size)
+
+    content = run(consume(make_request()))
+
+    # The response is complete either way.
+    assert content == b"".join(item for _, item in CHUNKS)
+    assert len(cached) == n_cached
+
+    if n_cached:
+        assert cached[0] == CHUNKS